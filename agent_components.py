@@ -1,6 +1,11 @@
 # Create multi-agent components.
-from charset_normalizer import detect
-from app import FirewallAgent, FirewallRepository, ManagerAgent, ModelAgent, PacketPipeline, ThreatDetector
+from app import FirewallAgent, FirewallRepository, ManagerAgent, PacketPipeline
+from agent_entities import model_agent_from_settings
+from core.config import settings
+from core.decision_hub import decision_hub
+from repositories.firewall_repository import block_ttl_policy, store_options
+from threat_intel import ThreatIntel
+from verdict_cache import VerdictCache
 
 
 
@@ -9,9 +14,20 @@ from app import FirewallAgent, FirewallRepository, ManagerAgent, ModelAgent, Pac
 
 
 # Instantiate components: repository, pipeline, and threat detector.
-firewall_repo = FirewallRepository()
+# Blocks expire by threat type and confidence, longer for repeat offenders, as the BLOCK_TTL_*
+# settings say. Group commits follow the same FIREWALL_FSYNC_POLICY and FIREWALL_FLUSH_* settings
+# as the API's store.
+firewall_repo = FirewallRepository(ttl_policy=block_ttl_policy(), **store_options())
 pipeline = PacketPipeline()
-detector = ThreatDetector()
 firewall_agent = FirewallAgent(firewall_repo)
-model_agent = ModelAgent(detect)
-manager_agent = ManagerAgent(model_agent, firewall_agent)
\ No newline at end of file
+# The rule model scores the FlowTable's per-source rates; DETECTOR_MODEL=random keeps the simulated detector.
+model_agent = model_agent_from_settings()
+# Reputation index built by `python -m threat_intel <feeds>`, memory-mapped and reloaded when republished.
+threat_intel = ThreatIntel()
+# Recent verdicts answer repeat packets from the same source without running the model.
+verdict_cache = VerdictCache(max_entries=settings.VERDICT_CACHE_SIZE, block_ttl=settings.VERDICT_CACHE_BLOCK_TTL,
+                             allow_ttl=settings.VERDICT_CACHE_ALLOW_TTL or None,
+                             key=settings.VERDICT_CACHE_KEY) if settings.VERDICT_CACHE_ENABLED else None
+# Live capture decisions go to the shared DecisionHub behind the Flask /stream and FastAPI /stream routes.
+manager_agent = ManagerAgent(model_agent, firewall_agent, verdict_cache=verdict_cache, decision_hub=decision_hub,
+                             threat_intel=threat_intel)
\ No newline at end of file
@@ -1,9 +1,37 @@
+import time
+
+import numpy as np
+
+from core.config import settings
+from core.decision_hub import DecisionHub, decision_event
+from core.event_log import DEBUG, event_log
+from core.metrics import count_decision, count_decisions, metrics
+from domain import Packet, ThreatBatchDecision, ThreatDecision
+from flow_table import AGGREGATE_COLUMNS, FlowTable
+from infra import FirewallRepository
+from packet_batch import PacketBatch
+from threat_intel import INTEL_THREAT_TYPE, ThreatIntel
+from threat_models import feature_matrix, model_for
+from use_case import ThreatDetector
+from verdict_cache import VerdictCache
+
+
+STAGE_HELP = "Time per call spent in each pipeline stage."
+MODEL_LATENCY = metrics.histogram("stage_latency_seconds", STAGE_HELP, stage="model")
+DETECTOR_LATENCY = metrics.histogram("stage_latency_seconds", STAGE_HELP, stage="detector")
+FIREWALL_LATENCY = metrics.histogram("stage_latency_seconds", STAGE_HELP, stage="firewall")
+MANAGER_LATENCY = metrics.histogram("stage_latency_seconds", STAGE_HELP, stage="manager")
+PACKETS_DECIDED = metrics.counter("packets_total", "Packets handled by each pipeline stage.", stage="decided")
+
+
 class ModelAgent:
     """
     Agent that analyzes packets by extracting features and invoking the threat detector.
+    With a FlowTable, per-source and per-flow sliding-window aggregates are added to the features.
     """
-    def __init__(self, detector: ThreatDetector):
+    def __init__(self, detector: ThreatDetector, flow_table: FlowTable = None):
         self.detector = detector
+        self.flow_table = flow_table
 
     def analyze_packet(self, packet: Packet) -> ThreatDecision:
         # Extract features to be analyzed by the threat detector.
@@ -11,12 +39,50 @@ class ModelAgent:
             "src_ip": packet.src_ip,
             "dst_ip": packet.dst_ip,
             "protocol": packet.protocol,
-            "frame_length": int(packet.data.get("length", "0"))
+            "frame_length": int(packet.data.get("length", "0")),
+            "src_port": packet.data.get("src_port"),
+            "dst_port": packet.data.get("dst_port"),
+            "tcp_flags": packet.data.get("tcp_flags")
         }
-        decision = self.detector.evaluate(features)
-        print(f"ModelAgent: Analyzed packet from {packet.src_ip} -> Decision: {decision.threat_type}")
+        if self.flow_table is not None:
+            features.update(zip(AGGREGATE_COLUMNS, self.flow_table.update_packet(packet)))
+        if metrics.enabled:
+            start = time.perf_counter()
+            decision = self.detector.evaluate(features)
+            DETECTOR_LATENCY.observe(time.perf_counter() - start)
+        else:
+            decision = self.detector.evaluate(features)
+        event_log.log("packet.analyzed", DEBUG, src_ip=packet.src_ip, threat_type=decision.threat_type)
         return decision
 
+    def analyze_batch(self, batch: PacketBatch, src_ips=None, weights=None) -> ThreatBatchDecision:
+        # Score the whole batch with one call into the detector.
+        # ``weights`` scale each row's contribution to the flow statistics (sampled traffic).
+        timed = metrics.enabled
+        if timed:
+            start = time.perf_counter()
+        if src_ips is None:
+            src_ips = batch.src_ips()
+        aggregates = self.flow_table.update_batch(batch, weights) if self.flow_table is not None else None
+        X = feature_matrix(batch, aggregates)
+        if not timed:
+            return self.detector.evaluate_batch(X, src_ips)
+        scored = time.perf_counter()
+        decisions = self.detector.evaluate_batch(X, src_ips)
+        end = time.perf_counter()
+        DETECTOR_LATENCY.observe(end - scored)
+        MODEL_LATENCY.observe(end - start)
+        return decisions
+
+def model_agent_from_settings():
+    """ModelAgent with the DETECTOR_MODEL and, if FLOW_TABLE_ENABLED, a FlowTable of its own.
+
+    Module-level so that sharded worker processes can build their copy after a spawn.
+    """
+    flow_table = FlowTable(window=settings.FLOW_WINDOW, buckets=settings.FLOW_BUCKETS,
+                           idle_timeout=settings.FLOW_IDLE_TIMEOUT) if settings.FLOW_TABLE_ENABLED else None
+    return ModelAgent(ThreatDetector(model=model_for(settings.DETECTOR_MODEL)), flow_table)
+
 class FirewallAgent:
     """
     Agent that handles firewall actions such as blocking IP addresses.
@@ -28,23 +94,250 @@ class FirewallAgent:
         reason = decision.threat_type
         confidence = decision.confidence
         action = decision.action
-        print(f"FirewallAgent: Blocking IP {ip} due to {reason} (Confidence: {confidence}).")
-        self.firewall_repo.add_blocked_ip(ip, reason, confidence, action)
+        event_log.info("firewall.block", ip=ip, reason=reason, confidence=confidence)
+        if metrics.enabled:
+            start = time.perf_counter()
+            self.firewall_repo.add_blocked_ip(ip, reason, confidence, action)
+            FIREWALL_LATENCY.observe(time.perf_counter() - start)
+        else:
+            self.firewall_repo.add_blocked_ip(ip, reason, confidence, action)
+
+    def block_ips(self, blocks):
+        # Batch variant of block_ip: every (ip, decision) pair is persisted in one commit.
+        for ip, decision in blocks:
+            event_log.info("firewall.block", ip=ip, reason=decision.threat_type, confidence=decision.confidence)
+        timed = metrics.enabled
+        if timed:
+            start = time.perf_counter()
+        self.firewall_repo.add_blocked_ips(
+            [(ip, decision.threat_type, decision.confidence, decision.action) for ip, decision in blocks])
+        if timed:
+            FIREWALL_LATENCY.observe(time.perf_counter() - start)
+
+    def blocked_prefix(self, ip: str):
+        return self.firewall_repo.match(ip)
+
+    def blocked_rows(self, batch: PacketBatch):
+        return self.firewall_repo.blocked_rows(batch)
 
 class ManagerAgent:
     """
     Manager that coordinates between the ModelAgent and the FirewallAgent.
+    Sources already inside a blocked prefix are answered from the firewall's CIDR index
+    without running the detector. With a VerdictCache, packets from sources that already have a cached block verdict
+    are dropped in O(1) without reaching the model or the firewall.
+    With a DecisionHub, every decision is also published to its live subscribers.
+    With a ThreatIntel, sources on a reputation list are blocked on sight, before the detector.
     """
-    def __init__(self, model_agent: ModelAgent, firewall_agent: FirewallAgent):
+    def __init__(self, model_agent: ModelAgent, firewall_agent: FirewallAgent, verdict_cache: VerdictCache = None,
+                 decision_hub: DecisionHub = None, threat_intel: ThreatIntel = None):
         self.model_agent = model_agent
         self.firewall_agent = firewall_agent
+        self.verdict_cache = verdict_cache
+        self.decision_hub = decision_hub
+        self.threat_intel = threat_intel
+
+    BLOCKED_THREAT_TYPE = "Blocked Source (Firewall Rule)"
+
+    def _blocked_decision(self, prefix):
+        return ThreatDecision(threat_detected=True, threat_type=self.BLOCKED_THREAT_TYPE, confidence="High",
+                              action="BLOCK", block_cidr=prefix)
+
+    def _intel_decision(self, ip):
+        return ThreatDecision(threat_detected=True, threat_type=INTEL_THREAT_TYPE, confidence="High", action="BLOCK",
+                              block_cidr=f"{ip}/32")
 
     def process_packet(self, packet: Packet) -> ThreatDecision:
+        if metrics.enabled:
+            start = time.perf_counter()
+            decision = self._decide(packet)
+            MANAGER_LATENCY.observe(time.perf_counter() - start)
+            PACKETS_DECIDED.inc()
+            count_decision(decision.threat_type)
+        else:
+            decision = self._decide(packet)
+        hub = self.decision_hub
+        if hub is not None and hub.active:
+            hub.publish([decision_event(packet.ts, packet.src_ip, packet.dst_ip, packet.protocol,
+                                        decision.threat_detected, decision.threat_type, decision.confidence,
+                                        decision.action, decision.block_cidr)])
+        return decision
+
+    def _decide(self, packet: Packet) -> ThreatDecision:
+        prefix = self.firewall_agent.blocked_prefix(packet.src_ip)
+        if prefix is not None:
+            return self._blocked_decision(prefix)
+        if self.threat_intel is not None and self.threat_intel.contains(packet.src_ip):
+            decision = self._intel_decision(packet.src_ip)
+            self.firewall_agent.block_ip(packet.src_ip, decision)
+            return decision
+        cache = self.verdict_cache
+        if cache is not None:
+            key = cache.packet_key(packet)
+            cached = cache.get(key)
+            if cached is not None:
+                return cached
         # Use ModelAgent to analyze the packet.
         decision = self.model_agent.analyze_packet(packet)
         # If a threat is detected, instruct FirewallAgent to block the source IP.
         if decision.threat_detected:
             self.firewall_agent.block_ip(packet.src_ip, decision)
         else:
-            print(f"ManagerAgent: No threat detected for packet from {packet.src_ip}.")
-        return decision
\ No newline at end of file
+            event_log.log("packet.allowed", DEBUG, src_ip=packet.src_ip)
+        if cache is not None:
+            cache.put(key, decision)
+        return decision
+
+    def process_packets(self, packets, weights=None) -> ThreatBatchDecision:
+        # Batch path: accepts a PacketBatch or a list of Packets, with optional per-packet sampling weights.
+        # Decisions are per batch row, so packets that cannot be parsed are left out of them.
+        timed = metrics.enabled
+        if timed:
+            start = time.perf_counter()
+        if not isinstance(packets, PacketBatch):
+            packets = PacketBatch.from_packets(packets)
+            if packets.rejected:
+                # Unparsable packets get no row (and no decision); keep the weights aligned with the rows.
+                event_log.warning("batch.rejected_packets", count=len(packets.rejected))
+                if weights is not None:
+                    rejected = set(packets.rejected)
+                    weights = [weight for i, weight in enumerate(weights) if i not in rejected]
+        batch = packets
+        src_ips = batch.src_ips()
+        decisions = self._decide_batch(batch, src_ips, weights)
+        if timed:
+            MANAGER_LATENCY.observe(time.perf_counter() - start)
+            PACKETS_DECIDED.inc(len(batch))
+            count_decisions(decisions.threat_type.tolist())
+        hub = self.decision_hub
+        if hub is not None and hub.active:
+            self._publish_batch(hub, batch, src_ips, decisions)
+        return decisions
+
+    def _publish_batch(self, hub, batch, src_ips, decisions):
+        columns = batch.columns
+        name_for = batch.protocols.name_for
+        block_cidr = decisions.block_cidr or [None] * len(batch)
+        hub.publish([
+            decision_event(ts, src_ip, dst_ip, name_for(protocol), detected, threat_type, confidence, action, cidr)
+            for ts, src_ip, dst_ip, protocol, detected, threat_type, confidence, action, cidr in zip(
+                columns["ts"].tolist(), src_ips, batch.dst_ips(), columns["protocol"].tolist(),
+                decisions.threat_detected.tolist(), decisions.threat_type.tolist(), decisions.confidence.tolist(),
+                decisions.action.tolist(), block_cidr)
+        ])
+
+    def screen_batch(self, batch, src_ips):
+        """Decide the rows that need no model: blocked prefixes, threat intel hits and cached verdicts.
+
+        Returns ``(decisions, keys)``: a decision or None (the model must score the row) per row,
+        and the verdict cache keys (None without a cache). Threat intel hits are blocked here.
+        """
+        cached = [None] * len(batch)
+        # Rows from already-blocked prefixes never reach the cache or the model.
+        blocked = {}
+        for i in self.firewall_agent.blocked_rows(batch):
+            decision = blocked.get(src_ips[i])
+            if decision is None:
+                decision = blocked[src_ips[i]] = self._blocked_decision(
+                    self.firewall_agent.blocked_prefix(src_ips[i]))
+            cached[i] = decision
+        if self.threat_intel is not None:
+            # Listed sources are blocked without scoring; later packets then hit the firewall index.
+            listed = {}
+            for i in self.threat_intel.listed_rows(batch).tolist():
+                if cached[i] is None:
+                    decision = listed.get(src_ips[i])
+                    if decision is None:
+                        decision = listed[src_ips[i]] = self._intel_decision(src_ips[i])
+                    cached[i] = decision
+            if listed:
+                self.firewall_agent.block_ips(list(listed.items()))
+        keys = None
+        if self.verdict_cache is not None:
+            keys = self._cache_keys(batch, src_ips)
+            cache_get = self.verdict_cache.get
+            for i, key in enumerate(keys):
+                if cached[i] is None:
+                    cached[i] = cache_get(key)
+        return cached, keys
+
+    def _decide_batch(self, batch, src_ips, weights=None):
+        cached, keys = self.screen_batch(batch, src_ips)
+        misses = [i for i, decision in enumerate(cached) if decision is None]
+        if len(misses) == len(cached):
+            return self._analyze_and_block(batch, src_ips, keys, weights)
+
+        # Merge blocked and cached verdicts with fresh decisions for the remaining rows.
+        n = len(cached)
+        threat_detected = np.zeros(n, dtype=bool)
+        threat_type = np.empty(n, dtype=object)
+        confidence = np.empty(n, dtype=object)
+        action = np.empty(n, dtype=object)
+        score = np.ones(n)
+        block_cidr = [None] * n
+        for i, decision in enumerate(cached):
+            if decision is not None:
+                threat_detected[i] = decision.threat_detected
+                threat_type[i] = decision.threat_type
+                confidence[i] = decision.confidence
+                action[i] = decision.action
+                block_cidr[i] = decision.block_cidr
+        if misses:
+            fresh = self._analyze_and_block(batch.take(misses), [src_ips[i] for i in misses],
+                                            None if keys is None else [keys[i] for i in misses],
+                                            None if weights is None else [weights[i] for i in misses])
+            rows = np.array(misses)
+            threat_detected[rows] = fresh.threat_detected
+            threat_type[rows] = fresh.threat_type
+            confidence[rows] = fresh.confidence
+            action[rows] = fresh.action
+            score[rows] = fresh.score
+            for j, i in enumerate(misses):
+                block_cidr[i] = fresh.block_cidr[j]
+        return ThreatBatchDecision(threat_detected, threat_type, confidence, action, score, block_cidr)
+
+    def _cache_keys(self, batch, src_ips):
+        if self.verdict_cache.key == "source":
+            return src_ips
+        columns = batch.columns
+        protocols = batch.protocols
+        return [
+            (src_ip, dst_ip, protocols.name_for(protocol), src_port or None, dst_port or None)
+            for src_ip, dst_ip, protocol, src_port, dst_port in zip(
+                src_ips, batch.dst_ips(), columns["protocol"].tolist(), columns["src_port"].tolist(),
+                columns["dst_port"].tolist())
+        ]
+
+    def _analyze_and_block(self, batch, src_ips, keys, weights=None):
+        decisions = self.model_agent.analyze_batch(batch, src_ips, weights)
+        cache = self.verdict_cache
+        blocks = {}
+        for i in decisions.threat_detected.nonzero()[0].tolist():
+            decision = decisions.decision(i)
+            if cache is not None:
+                cache.put(keys[i], decision)
+            # Repeats of the same source within one batch only need one block.
+            blocks.setdefault(src_ips[i], decision)
+        if blocks:
+            self.firewall_agent.block_ips(list(blocks.items()))
+        if cache is not None and cache.allow_ttl is not None:
+            for i in (~decisions.threat_detected).nonzero()[0].tolist():
+                cache.put(keys[i], decisions.decision(i))
+        return decisions
+
+    def apply_verdicts(self, verdicts):
+        # Verdicts scored outside this process (sharded workers): (src_ip, flow, decision) per detection,
+        # where flow is (src_ip, dst_ip, protocol, src_port, dst_port).
+        blocks = {}
+        cache = self.verdict_cache
+        for src_ip, flow, decision in verdicts:
+            if cache is not None:
+                cache.put(cache.key_for(*flow), decision)
+            blocks.setdefault(src_ip, decision)
+        if blocks:
+            self.firewall_agent.block_ips(list(blocks.items()))
+
+    def forget_source(self, ip):
+        # Called after a manual unblock so cached block verdicts do not outlive it.
+        if self.verdict_cache is not None:
+            self.verdict_cache.invalidate_source(ip)
@@ -6,8 +6,14 @@ import random
 import time
 import re
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, stream_with_context
 from flask_cors import CORS
+from core.bulk_codec import framing_for, iter_batches
+from core.cidr_index import parse_address
+from core.decision_hub import DecisionFilter
+from core.event_log import event_log
+from core.metrics import CONTENT_TYPE, metrics
+from packet_batch import PacketBatch
 
 
 
@@ -22,8 +28,12 @@ def index():
 def analyze_packet():
     # Endpoint to manually analyze a packet using JSON data.
     data = request.get_json()
-    if not data or "src_ip" not in data:
+    if not data or not isinstance(data.get("src_ip"), str):
         return jsonify({"error": "Invalid packet data."}), 400
+    try:
+        parse_address(data["src_ip"])
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     packet = Packet(
         data["src_ip"],
         data.get("dst_ip", ""),
@@ -40,13 +50,148 @@ def analyze_packet():
     }
     return jsonify(response)
 
+def _bulk_packet(record):
+    # Checks exactly what PacketBatch parses, per record, so one bad record does not fail the batch.
+    data = json.loads(record)
+    if not isinstance(data, dict) or not isinstance(data.get("src_ip"), str):
+        raise ValueError("Invalid packet data.")
+    parse_address(data["src_ip"])
+    dst_ip = data.get("dst_ip", "")
+    if not isinstance(dst_ip, str):
+        raise ValueError("dst_ip must be a string.")
+    if dst_ip:
+        parse_address(dst_ip)
+    protocol = data.get("protocol", "N/A")
+    if not isinstance(protocol, str):
+        raise ValueError("protocol must be a string.")
+    payload = data.get("data", {})
+    if not isinstance(payload, dict):
+        raise ValueError("data must be an object.")
+    int(payload.get("length", 0))
+    return Packet(data["src_ip"], dst_ip, protocol, payload)
+
+def _bulk_decisions(batch, start):
+    # One result per record of the batch: its decision, or why it was not analyzed.
+    results = [None] * len(batch)
+    packets, rows = [], []
+    for i, record in enumerate(batch):
+        try:
+            packets.append(_bulk_packet(record))
+            rows.append(i)
+        except (ValueError, TypeError) as e:
+            results[i] = {"index": start + i, "error": str(e)}
+    if packets:
+        packet_batch = PacketBatch.from_packets(packets)
+        rejected = set(packet_batch.rejected)
+        for j in rejected:
+            results[rows[j]] = {"index": start + rows[j], "error": "Invalid packet data."}
+        rows = [i for j, i in enumerate(rows) if j not in rejected]
+        try:
+            batch_decisions = manager_agent.process_packets(packet_batch) if rows else None
+        except Exception as e:
+            event_log.error("bulk.batch_failed", records=len(rows), error=str(e))
+            for i in rows:
+                results[i] = {"index": start + i, "error": "Analysis failed."}
+            return results
+        for j, i in enumerate(rows):
+            decision = batch_decisions.decision(j)
+            results[i] = {
+                "index": start + i,
+                "threat_detected": decision.threat_detected,
+                "threat_type": decision.threat_type,
+                "confidence": decision.confidence,
+                "action": decision.action,
+                "block_cidr": decision.block_cidr
+            }
+    return results
+
+@app.route('/analyze/bulk', methods=['POST'])
+def analyze_bulk():
+    # Streamed NDJSON (or length-prefixed records with Content-Type: application/octet-stream).
+    # Each batch goes through ManagerAgent.process_packets and its decisions are streamed back.
+    framing = framing_for(request.content_type)
+    chunks = iter(lambda: request.stream.read(65536), b"")
+
+    def decisions():
+        start = 0
+        try:
+            for batch in iter_batches(chunks, framing, 1000):
+                results = _bulk_decisions(batch, start)
+                start += len(batch)
+                yield "".join(json.dumps(result) + "\n" for result in results)
+        except ValueError as e:
+            yield json.dumps({"index": start, "error": str(e), "fatal": True}) + "\n"
+
+    return app.response_class(stream_with_context(decisions()), mimetype="application/x-ndjson")
+
+@app.route('/stream', methods=['GET'])
+def stream_decisions():
+    # Live decisions as server-sent events; filters: ?threat_type=&action=&cidr=&threats_only=true
+    hub = manager_agent.decision_hub
+    if hub is None:
+        return jsonify({"error": "Decision streaming is not enabled."}), 404
+    try:
+        subscription = hub.subscribe(DecisionFilter(
+            threat_types=request.args.getlist("threat_type"),
+            actions=request.args.getlist("action"),
+            cidrs=request.args.getlist("cidr"),
+            threats_only=request.args.get("threats_only", "false").lower() == "true"
+        ))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def frames():
+        try:
+            while not subscription.closed:
+                events, dropped = subscription.get_batch(500, timeout=15)
+                if events or dropped:
+                    yield f"data: {json.dumps({'events': events, 'dropped': dropped})}\n\n"
+                    time.sleep(0.1)
+                elif not subscription.closed:
+                    yield ": keepalive\n\n"
+            yield f"event: close\ndata: {json.dumps({'reason': subscription.close_reason})}\n\n"
+        finally:
+            subscription.close()
+
+    return app.response_class(frames(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @app.route('/firewall_state', methods=['GET'])
 def get_firewall_state():
-    return jsonify(firewall_repo.get_state())
+    # Paged like the FastAPI /firewall/state: ?limit=&since=&event=&view=summary&include_blocked=false
+    version = str(firewall_repo.version)
+    if request.if_none_match.contains_weak(version):
+        response = app.response_class(status=304)
+        response.set_etag(version, weak=True)
+        return response
+    try:
+        limit = min(max(int(request.args.get("limit", 1000)), 1), 10000)
+        since = request.args.get("since", type=int)
+    except ValueError:
+        return jsonify({"error": "limit must be an integer."}), 400
+    if request.args.get("view", "full") == "summary":
+        body = firewall_repo.get_summary()
+    else:
+        body = firewall_repo.get_state_page(
+            after=since,
+            limit=limit,
+            event=request.args.get("event"),
+            include_blocked=request.args.get("include_blocked", "true").lower() != "false"
+        )
+    response = jsonify(body)
+    response.set_etag(str(body["version"]), weak=True)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format; set METRICS_ENABLED=false to turn instrumentation off.
+    if not metrics.enabled:
+        return jsonify({"error": "Metrics are disabled."}), 404
+    return app.response_class(metrics.render(), content_type=CONTENT_TYPE)
 
 @app.route('/unblock/<ip>', methods=['DELETE'])
 def unblock_ip(ip):
     if firewall_repo.unblock_ip(ip):
+        manager_agent.forget_source(ip)
         return jsonify({"status": "success", "message": f"{ip} unblocked."})
     else:
         return jsonify({"status": "not_found", "message": f"{ip} is not currently blocked."}), 404
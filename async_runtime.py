@@ -0,0 +1,205 @@
+import asyncio
+
+from core.event_log import event_log
+from infra import PACKETS_CAPTURED, TSharkCapture
+from pcap_decoder import CaptureDecoder
+
+
+class AsyncCapture:
+    """Capture subprocess read through asyncio.
+
+    The process is started with ``asyncio.create_subprocess_exec`` and its stdout is read
+    in chunks of up to ``chunk_size`` bytes as soon as they arrive: no polling and no
+    sleep between reads. "fields" output is split into lines (a partial line is carried
+    to the next chunk); "pcap" output goes through the CaptureDecoder. Parsing and
+    decoding run in the default executor, so the loop only moves bytes. Each chunk's
+    packets are handed to ``deliver`` as one list.
+    """
+    def __init__(self, interface="eth0", filter_expr="ip", capture_format="fields", capture_tool="tshark",
+                 chunk_size=1 << 16):
+        self.spec = TSharkCapture(interface=interface, filter_expr=filter_expr, capture_format=capture_format,
+                                  capture_tool=capture_tool)
+        self.chunk_size = chunk_size
+        self.proc = None
+
+    async def run(self, deliver):
+        """Capture until the process exits (or ``terminate`` is called); returns its exit code."""
+        self.proc = await asyncio.create_subprocess_exec(*self.spec.command(), stdout=asyncio.subprocess.PIPE,
+                                                         stderr=asyncio.subprocess.DEVNULL)
+        try:
+            if self.spec.capture_format == "pcap":
+                await self._read_pcap(deliver)
+            else:
+                await self._read_fields(deliver)
+        finally:
+            if self.proc.returncode is None:
+                self.proc.terminate()
+        return await self.proc.wait()
+
+    def _parse_lines(self, data):
+        parse_line = self.spec.parse_line
+        lines = data.decode("utf-8", "replace").split("\n")
+        return [packet for packet in map(parse_line, lines) if packet is not None]
+
+    async def _read_fields(self, deliver):
+        loop = asyncio.get_running_loop()
+        stdout = self.proc.stdout
+        pending = b""
+        while True:
+            chunk = await stdout.read(self.chunk_size)
+            if not chunk:
+                break
+            end = chunk.rfind(b"\n")
+            if end < 0:
+                pending += chunk
+                continue
+            packets = await loop.run_in_executor(None, self._parse_lines, pending + chunk[:end])
+            pending = chunk[end + 1:]
+            if packets:
+                await deliver(packets)
+        if pending:
+            packets = self._parse_lines(pending)
+            if packets:
+                await deliver(packets)
+
+    async def _read_pcap(self, deliver):
+        loop = asyncio.get_running_loop()
+        stdout = self.proc.stdout
+        decoder = CaptureDecoder()
+        while True:
+            chunk = await stdout.read(self.chunk_size)
+            if not chunk:
+                break
+            # Chunks are decoded one at a time, in order, since the decoder carries partial records.
+            packets = await loop.run_in_executor(None, decoder.feed, chunk)
+            if packets:
+                await deliver(packets)
+
+    def terminate(self):
+        # The reader then sees EOF after whatever the process had already written.
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.terminate()
+
+
+def manager_handler(manager_agent):
+    """Batch handler running ManagerAgent.process_packets in the default executor."""
+    async def handle(batch):
+        await asyncio.get_running_loop().run_in_executor(None, manager_agent.process_packets, batch)
+    return handle
+
+
+def service_handler(service, model_agent):
+    """Batch handler scoring captured packets with ``model_agent`` and blocking through an AsyncFirewallService.
+
+    ``model_agent`` is the capture path's ModelAgent (``model_agent_from_settings``): the
+    configured model over its own FlowTable's per-source rates.
+    """
+    async def handle(batch):
+        await service.analyze_capture(batch, model_agent)
+    return handle
+
+
+class AsyncRuntime:
+    """Capture and detection on one event loop.
+
+    An AsyncCapture feeds a bounded asyncio queue of packet lists; when the queue is full
+    the reader waits, so back pressure reaches the capture pipe instead of memory.
+    ``consumers`` tasks each take the next list, merge whatever else is already queued
+    up to ``batch_size`` packets, and await ``handler(batch)``. If the capture process
+    exits on its own it is restarted after ``restart_delay`` seconds.
+
+    ``stop`` terminates the capture, lets the reader queue what the process had already
+    written, and waits up to ``drain_timeout`` seconds for the consumers to process every
+    queued batch before cancelling them.
+    """
+    def __init__(self, handler, interface="eth0", filter_expr="ip", capture_format="fields", consumers=1,
+                 batch_size=256, queue_size=1024, restart_delay=1.0, **capture_options):
+        self.handler = handler
+        self.capture = AsyncCapture(interface, filter_expr, capture_format, **capture_options)
+        self.consumers = consumers
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.restart_delay = restart_delay
+        self.queue = None
+        self.reader = None
+        self.workers = []
+        self.stopping = False
+        self.captured = 0
+        self.processed = 0
+        self.batches = 0
+        self.failed_batches = 0
+
+    async def start(self):
+        self.stopping = False
+        self.queue = asyncio.Queue(self.queue_size)
+        self.workers = [asyncio.create_task(self._consume()) for _ in range(self.consumers)]
+        self.reader = asyncio.create_task(self._capture())
+
+    async def _deliver(self, packets):
+        self.captured += len(packets)
+        PACKETS_CAPTURED.inc(len(packets))
+        await self.queue.put(packets)
+
+    async def _capture(self):
+        while not self.stopping:
+            try:
+                code = await self.capture.run(self._deliver)
+            except OSError as e:
+                event_log.error("capture.start_failed", error=str(e))
+            else:
+                if self.stopping:
+                    break
+                event_log.warning("capture.exited", returncode=code)
+            await asyncio.sleep(self.restart_delay)
+
+    async def _consume(self):
+        queue = self.queue
+        while True:
+            packets = await queue.get()
+            if packets is None:
+                return
+            batch = list(packets)
+            done = False
+            while len(batch) < self.batch_size and not queue.empty():
+                more = queue.get_nowait()
+                if more is None:
+                    done = True
+                    break
+                batch.extend(more)
+            try:
+                await self.handler(batch)
+                self.processed += len(batch)
+            except Exception as e:
+                self.failed_batches += 1
+                event_log.error("capture.batch_failed", packets=len(batch), error=str(e))
+            self.batches += 1
+            if done:
+                return
+
+    async def stop(self, drain_timeout=5.0):
+        if self.reader is None:
+            return
+        self.stopping = True
+        self.capture.terminate()
+        try:
+            await asyncio.wait_for(asyncio.shield(self.reader), 2.0)
+        except asyncio.TimeoutError:
+            self.reader.cancel()
+        for _ in self.workers:
+            await self.queue.put(None)
+        done, pending = await asyncio.wait(self.workers, timeout=drain_timeout)
+        for worker in pending:
+            worker.cancel()
+        if pending:
+            event_log.warning("capture.drain_timeout", unprocessed=self.queue.qsize())
+        self.reader = None
+        self.workers = []
+
+    def stats(self):
+        return {
+            "captured": self.captured,
+            "processed": self.processed,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+        }
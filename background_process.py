@@ -1,6 +1,16 @@
 # Start background threads for packet capture and processing.
 import threading
 
+from core.config import settings
+from sharding import ShardedProcessor
+
 
 threading.Thread(target=capture_thread, daemon=True).start()
-threading.Thread(target=processing_thread, daemon=True).start()
\ No newline at end of file
+if settings.SHARDED_WORKERS:
+    # Worker-pool mode: detection runs in SHARDED_WORKERS processes, partitioned by src_ip.
+    threading.Thread(target=sharded_processing_thread,
+                     args=(ShardedProcessor(manager_agent, settings.SHARDED_WORKERS),), daemon=True).start()
+else:
+    threading.Thread(target=processing_thread, daemon=True).start()
+# Picks up reputation index versions published by `python -m threat_intel`.
+threading.Thread(target=threat_intel.run, daemon=True).start()
@@ -0,0 +1,346 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from datetime import datetime
+
+import numpy as np
+
+from benchmarks.traffic import PROFILES, TrafficGenerator
+
+
+SCENARIOS = ("in_process", "pipeline", "repository", "http", "http_bulk")
+DEFAULTS = {
+    "profile": "mixed",
+    "packets": 50000,
+    "sources": 1000,
+    "seed": 1,
+    "detector": "rules",
+    "batch_size": 256,
+    "churn_ops": 20000,
+    "backend": "journal",
+    "fsync_policy": "batched",
+    "http_packets": 2000,
+    "bulk_size": 1000,
+    "url": None,
+}
+
+
+def latency_summary(latencies):
+    """p50/p99/max in milliseconds of a sequence of latencies in seconds."""
+    if not len(latencies):
+        return None
+    p50, p99, worst = np.percentile(np.asarray(latencies, dtype=float), [50, 99, 100]) * 1000
+    return {"p50": round(float(p50), 4), "p99": round(float(p99), 4), "max": round(float(worst), 4)}
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1 << 20 if sys.platform == "darwin" else 1 << 10), 1)
+
+
+def result(count, duration, latencies, **extra):
+    return dict({
+        "operations": count,
+        "duration_s": round(duration, 4),
+        "per_s": round(count / duration, 1) if duration > 0 else 0.0,
+        "latency_ms": latency_summary(latencies),
+    }, **extra)
+
+
+def build_manager(options, workdir):
+    from agent_entities import FirewallAgent, ManagerAgent, ModelAgent
+    from flow_table import FlowTable
+    from infra import FirewallRepository
+    from threat_models import RandomModel, default_rule_model
+    from use_case import ThreatDetector
+
+    if options["detector"] == "rules":
+        detector, flow_table = ThreatDetector(model=default_rule_model()), FlowTable()
+    else:
+        detector, flow_table = ThreatDetector(model=RandomModel(7, seed=options["seed"])), None
+    repo = FirewallRepository(os.path.join(workdir, "firewall_state.json"), fsync_policy=options["fsync_policy"])
+    return ManagerAgent(ModelAgent(detector, flow_table), FirewallAgent(repo)), repo
+
+
+def bench_in_process(options, workdir):
+    """(a) ManagerAgent.process_packet, one packet at a time."""
+    manager, repo = build_manager(options, workdir)
+    packets = TrafficGenerator(options["profile"], options["sources"], options["seed"]).packets(options["packets"])
+    latencies = np.empty(len(packets))
+    clock = time.perf_counter
+    started = clock()
+    for i, packet in enumerate(packets):
+        start = clock()
+        manager.process_packet(packet)
+        latencies[i] = clock() - start
+    duration = clock() - started
+    stats = result(len(packets), duration, latencies, blocked=len(repo.store.blocked_ips))
+    repo.store.close()
+    return stats
+
+
+def bench_pipeline(options, workdir):
+    """(b) Producer -> PacketPipeline -> process_packets, latency from enqueue to decision."""
+    from domain import Packet
+    from infra import PacketPipeline
+
+    manager, repo = build_manager(options, workdir)
+    generator = TrafficGenerator(options["profile"], options["sources"], options["seed"])
+    fields = [generator.fields() for _ in range(options["packets"])]
+    pipeline = PacketPipeline(batch_size=options["batch_size"])
+    queue_obj = pipeline.get_queue()
+    latencies = []
+    done = threading.Event()
+
+    def consume():
+        while not (done.is_set() and queue_obj.empty()):
+            batch = pipeline.get_batch(timeout=0.1)
+            if batch:
+                manager.process_packets(batch)
+                now = time.time()
+                latencies.extend(now - packet.ts for packet in batch)
+
+    consumer = threading.Thread(target=consume)
+    started = time.perf_counter()
+    consumer.start()
+    for offset in range(0, len(fields), 256):
+        now = time.time()
+        queue_obj.put_many([
+            Packet(src_ip, dst_ip, protocol,
+                   {"length": length, "src_port": src_port, "dst_port": dst_port, "tcp_flags": tcp_flags}, ts=now)
+            for src_ip, dst_ip, protocol, length, src_port, dst_port, tcp_flags in fields[offset:offset + 256]
+        ])
+    done.set()
+    consumer.join()
+    duration = time.perf_counter() - started
+    queue_stats = pipeline.stats()
+    stats = result(len(latencies), duration, latencies, blocked=len(repo.store.blocked_ips),
+                   avg_batch_size=round(queue_stats["avg_batch_size"], 1), high_watermark=queue_stats["high_watermark"])
+    repo.store.close()
+    return stats
+
+
+def bench_repository(options, workdir):
+    """(c) Block/unblock churn against the selected storage backend."""
+    os.environ["FIREWALL_FSYNC_POLICY"] = options["fsync_policy"]
+    from repositories.firewall_repository import FirewallRepository, create_store
+
+    backend = options["backend"]
+    path = os.path.join(workdir, "firewall_state.db" if backend == "sqlite" else "firewall_state.json")
+    repo = FirewallRepository(create_store(backend, path))
+    generator = TrafficGenerator("benign", options["sources"], options["seed"])
+    rng = random.Random(options["seed"])
+    threat = {"threat_type": "Benchmark", "confidence": "High", "action": "BLOCK"}
+    blocked = []
+    latencies = np.empty(options["churn_ops"])
+    clock = time.perf_counter
+    started = clock()
+    for i in range(options["churn_ops"]):
+        # Keep roughly half of the source pool blocked.
+        if blocked and (rng.random() < 0.4 or len(blocked) * 2 >= len(generator.sources)):
+            ip = blocked.pop(rng.randrange(len(blocked)))
+            start = clock()
+            repo.unblock_ip(ip)
+        else:
+            ip = rng.choice(generator.sources)
+            start = clock()
+            if not repo.is_blocked(ip):
+                repo.block_ip(ip, threat)
+                blocked.append(ip)
+        latencies[i] = clock() - start
+    repo.store.flush(durable=True)
+    duration = clock() - started
+    store_stats = repo.store.stats()
+    repo.store.close()
+    return result(options["churn_ops"], duration, latencies, backend=backend,
+                  fsyncs=store_stats.get("fsyncs"), bytes_written=store_stats.get("bytes_written"))
+
+
+def http_client(options, workdir):
+    """Returns post(path, body, content_type) against ``url``, or the FastAPI app in-process."""
+    url = options["url"]
+    if url:
+        def post(path, body, content_type="application/json"):
+            request = urllib.request.Request(url.rstrip("/") + path, data=body, method="POST",
+                                             headers={"Content-Type": content_type})
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.read()
+        return post, None
+
+    os.chdir(workdir)
+    os.makedirs("data", exist_ok=True)
+    os.environ["FIREWALL_FSYNC_POLICY"] = options["fsync_policy"]
+    from fastapi.testclient import TestClient
+    import main
+
+    client = TestClient(main.app)
+    client.__enter__()
+
+    def post(path, body, content_type="application/json"):
+        response = client.post(path, content=body, headers={"Content-Type": content_type})
+        return response.status_code, response.content
+    return post, client
+
+
+def bench_http(options, workdir):
+    """(d) POST /firewall/analyze, one request per packet."""
+    post, client = http_client(options, workdir)
+    records = TrafficGenerator(options["profile"], options["sources"], options["seed"]).records(
+        options["http_packets"])
+    bodies = [json.dumps(record).encode() for record in records]
+    latencies = np.empty(len(bodies))
+    errors = 0
+    clock = time.perf_counter
+    started = clock()
+    for i, body in enumerate(bodies):
+        start = clock()
+        status, _ = post("/firewall/analyze", body)
+        latencies[i] = clock() - start
+        errors += status != 200
+    duration = clock() - started
+    if client is not None:
+        client.__exit__(None, None, None)
+    return result(len(bodies), duration, latencies, errors=errors, target=options["url"] or "in-process")
+
+
+def bench_http_bulk(options, workdir):
+    """(d) POST /firewall/analyze/bulk with NDJSON bodies of ``bulk_size`` records."""
+    post, client = http_client(options, workdir)
+    records = TrafficGenerator(options["profile"], options["sources"], options["seed"]).records(options["packets"])
+    size = options["bulk_size"]
+    bodies = ["".join(json.dumps(record) + "\n" for record in records[i:i + size]).encode()
+              for i in range(0, len(records), size)]
+    latencies = np.empty(len(bodies))
+    clock = time.perf_counter
+    started = clock()
+    for i, body in enumerate(bodies):
+        start = clock()
+        post("/firewall/analyze/bulk", body, "application/x-ndjson")
+        latencies[i] = clock() - start
+    duration = clock() - started
+    if client is not None:
+        client.__exit__(None, None, None)
+    # Throughput is in records; latency is per request of ``bulk_size`` records.
+    return result(len(records), duration, latencies, requests=len(bodies), bulk_size=size,
+                  target=options["url"] or "in-process")
+
+
+BENCHMARKS = {
+    "in_process": bench_in_process,
+    "pipeline": bench_pipeline,
+    "repository": bench_repository,
+    "http": bench_http,
+    "http_bulk": bench_http_bulk,
+}
+
+
+def run_scenario(name, options):
+    # Runs in a fresh process so peak RSS and imported state belong to this scenario alone.
+    from core.event_log import event_log
+    event_log.configure(level="WARNING")
+    random.seed(options["seed"])
+    np.random.seed(options["seed"])
+    with tempfile.TemporaryDirectory(prefix=f"bench-{name}-") as workdir:
+        cwd = os.getcwd()
+        try:
+            stats = BENCHMARKS[name](options, workdir)
+        finally:
+            os.chdir(cwd)
+    stats["peak_rss_mb"] = peak_rss_mb()
+    return stats
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(scenarios=SCENARIOS, **options):
+    """Run each scenario in its own process and return the results document."""
+    options = dict(DEFAULTS, **options)
+    context = multiprocessing.get_context("spawn")
+    results = {}
+    for name in scenarios:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(run_scenario, (name, options))
+        print(f"{name}: {results[name]['per_s']:.0f}/s latency_ms={results[name]['latency_ms']} "
+              f"peak_rss_mb={results[name]['peak_rss_mb']}", file=sys.stderr)
+    return {
+        "meta": {
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "options": options,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline, current):
+    """Throughput and p99 change per scenario between two results documents."""
+    rows = {}
+    for name, stats in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        row = {"per_s": stats["per_s"], "per_s_change": None, "p99_ms": None, "p99_change": None}
+        if before["per_s"]:
+            row["per_s_change"] = round(stats["per_s"] / before["per_s"] - 1, 4)
+        if stats["latency_ms"] and before["latency_ms"]:
+            row["p99_ms"] = stats["latency_ms"]["p99"]
+            if before["latency_ms"]["p99"]:
+                row["p99_change"] = round(stats["latency_ms"]["p99"] / before["latency_ms"]["p99"] - 1, 4)
+        rows[name] = row
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline with seeded synthetic traffic.")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--profile", choices=PROFILES, default=DEFAULTS["profile"])
+    parser.add_argument("--packets", type=int, default=DEFAULTS["packets"])
+    parser.add_argument("--sources", type=int, default=DEFAULTS["sources"], help="Source address cardinality")
+    parser.add_argument("--seed", type=int, default=DEFAULTS["seed"])
+    parser.add_argument("--detector", choices=("rules", "random"), default=DEFAULTS["detector"])
+    parser.add_argument("--batch-size", type=int, default=DEFAULTS["batch_size"])
+    parser.add_argument("--churn-ops", type=int, default=DEFAULTS["churn_ops"])
+    parser.add_argument("--backend", choices=("journal", "sqlite"), default=DEFAULTS["backend"])
+    parser.add_argument("--fsync-policy", choices=("always", "batched", "never"), default=DEFAULTS["fsync_policy"])
+    parser.add_argument("--http-packets", type=int, default=DEFAULTS["http_packets"])
+    parser.add_argument("--bulk-size", type=int, default=DEFAULTS["bulk_size"])
+    parser.add_argument("--url", default=None, help="Benchmark a running FastAPI server instead of the app in-process")
+    parser.add_argument("--output", "-o", help="Write the results JSON here (default: stdout)")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    args = parser.parse_args()
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenario(s) {', '.join(unknown)}; expected {', '.join(SCENARIOS)}")
+
+    options = {key: value for key, value in vars(args).items() if key in DEFAULTS}
+    document = run(args.scenarios or SCENARIOS, **options)
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            document["comparison"] = compare(json.load(f), document)
+    text = json.dumps(document, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
@@ -0,0 +1,102 @@
+import random
+import time
+
+from domain import Packet
+
+
+PROFILES = ("benign", "syn_flood", "ping_flood", "scan", "mixed")
+SYN = 0x02
+ACK = 0x10
+PSH = 0x08
+BENIGN_SERVICES = [("TCP", 443, 0.45), ("TCP", 80, 0.15), ("UDP", 53, 0.2), ("TCP", 22, 0.05),
+                   ("UDP", 123, 0.05), ("ICMP", None, 0.1)]
+# Share of each attack profile in the "mixed" profile, the rest is benign.
+MIXED_SHARES = (("syn_flood", 0.2), ("ping_flood", 0.1), ("scan", 0.1))
+
+
+class TrafficGenerator:
+    """Seeded synthetic traffic for the benchmarks.
+
+    Every profile draws source addresses from a pool of ``sources`` addresses (the source
+    cardinality) inside ``source_prefix``, and victims from ``destinations`` addresses in
+    ``destination_prefix``. The same seed always yields the same packets, apart from the
+    timestamps, which are taken when a packet is built.
+
+      - "benign": web/DNS/SSH/NTP/ICMP mix with realistic lengths and TCP flags,
+      - "syn_flood": TCP SYNs to port 80 of one victim,
+      - "ping_flood": 98-byte ICMP echo requests to one victim,
+      - "scan": TCP SYNs from each source walking the victims' ports,
+      - "mixed": benign traffic with the three attacks interleaved (see MIXED_SHARES).
+    """
+    def __init__(self, profile="benign", sources=1000, seed=0, destinations=16,
+                 source_prefix="10.0.0.0", destination_prefix="192.168.0.0"):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile {profile!r}; expected one of {PROFILES}.")
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.sources = [self._address(source_prefix, i) for i in range(sources)]
+        self.destinations = [self._address(destination_prefix, i + 1) for i in range(destinations)]
+        self.scan_ports = {}
+        self.services = [service[:2] for service in BENIGN_SERVICES]
+        self.service_weights = [service[2] for service in BENIGN_SERVICES]
+
+    @staticmethod
+    def _address(prefix, offset):
+        a, b, c, d = (int(part) for part in prefix.split("."))
+        value = (a << 24 | b << 16 | c << 8 | d) + offset
+        return f"{value >> 24 & 255}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+    def fields(self):
+        """One packet as (src_ip, dst_ip, protocol, length, src_port, dst_port, tcp_flags)."""
+        profile = self.profile
+        if profile == "mixed":
+            roll = self.rng.random()
+            profile = "benign"
+            for name, share in MIXED_SHARES:
+                if roll < share:
+                    profile = name
+                    break
+                roll -= share
+        return getattr(self, "_" + profile)()
+
+    def _benign(self):
+        rng = self.rng
+        protocol, port = rng.choices(self.services, self.service_weights)[0]
+        src_ip = rng.choice(self.sources)
+        dst_ip = rng.choice(self.destinations)
+        if protocol == "ICMP":
+            return src_ip, dst_ip, protocol, 98, None, None, None
+        length = int(rng.lognormvariate(6.0, 0.9)) % 1460 + 60
+        flags = rng.choice((ACK, ACK | PSH)) if protocol == "TCP" else None
+        return src_ip, dst_ip, protocol, length, rng.randint(32768, 60999), port, flags
+
+    def _syn_flood(self):
+        rng = self.rng
+        return rng.choice(self.sources), self.destinations[0], "TCP", 60, rng.randint(1024, 65535), 80, SYN
+
+    def _ping_flood(self):
+        return self.rng.choice(self.sources), self.destinations[0], "ICMP", 98, None, None, None
+
+    def _scan(self):
+        rng = self.rng
+        src_ip = rng.choice(self.sources)
+        port = self.scan_ports.get(src_ip, 0) % 1024 + 1
+        self.scan_ports[src_ip] = port
+        return src_ip, rng.choice(self.destinations), "TCP", 60, rng.randint(32768, 60999), port, SYN
+
+    def packet(self):
+        src_ip, dst_ip, protocol, length, src_port, dst_port, tcp_flags = self.fields()
+        return Packet(src_ip, dst_ip, protocol,
+                      {"length": length, "src_port": src_port, "dst_port": dst_port, "tcp_flags": tcp_flags},
+                      ts=time.time())
+
+    def packets(self, count):
+        return [self.packet() for _ in range(count)]
+
+    def records(self, count):
+        """``count`` packets as /firewall/analyze request bodies."""
+        records = []
+        for _ in range(count):
+            src_ip, dst_ip, protocol, length, src_port, dst_port, tcp_flags = self.fields()
+            records.append({"src_ip": src_ip, "dst_ip": dst_ip, "protocol": protocol, "port": dst_port or 0})
+        return records
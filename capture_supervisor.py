@@ -0,0 +1,274 @@
+import threading
+import time
+from collections import Counter
+
+from core.cidr_index import format_prefix, parse_prefix
+from core.event_log import event_log
+from core.metrics import metrics
+from infra import TSharkCapture
+
+
+CAPTURE_RESTARTS = metrics.counter("capture_restarts_total", "Capture processes replaced to apply a new filter.")
+OVERLAP_DUPLICATES = metrics.counter("capture_overlap_duplicates_total",
+                                     "Packets delivered by both captures during a filter swap and dropped once.")
+
+
+def exclusion_terms(prefixes, max_terms=200):
+    """BPF ``src`` terms for the blocked prefixes, widest first, at most ``max_terms``.
+
+    Returns (terms, omitted). When there are more prefixes than terms, the widest ones
+    are kept since they exclude the most traffic; the omitted prefixes are still caught
+    by the userspace CIDR check. Prefixes are never widened beyond what is blocked.
+    """
+    parsed = []
+    for prefix in prefixes:
+        try:
+            parsed.append(parse_prefix(prefix))
+        except ValueError:
+            continue
+    parsed.sort(key=lambda item: (item[2] - (32 if item[0] == 4 else 128), item[0], item[1]))
+    terms = []
+    for version, value, length in parsed[:max_terms]:
+        if length == (32 if version == 4 else 128):
+            terms.append(f"src host {format_prefix(version, value, length, host_suffix=False)}")
+        else:
+            terms.append(f"src net {format_prefix(version, value, length)}")
+    return terms, max(0, len(parsed) - max_terms)
+
+
+def exclusion_filter(base_filter, terms):
+    """``base_filter`` with the given terms excluded, e.g. ``(ip) and not (src net 10.0.0.0/8)``."""
+    if not terms:
+        return base_filter
+    return f"({base_filter}) and not ({' or '.join(terms)})"
+
+
+def packet_key(packet):
+    # Two captures of one interface report the same capture time, addresses and length for a packet.
+    return packet.ts, packet.src_ip, packet.dst_ip, packet.data.get("length")
+
+
+class _OverlapDeduper:
+    """Drops the second copy of packets delivered by both captures while they overlap.
+
+    Each capture's packets are matched against the other capture's unmatched ones; a
+    match is the same packet seen twice, anything else is new. Repeats of a key within one
+    capture are distinct packets and are kept. State only lives until ``finish``.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.unmatched = (Counter(), Counter())
+        self.active = True
+        self.duplicates = 0
+
+    def admit(self, side, packets):
+        """The packets from capture ``side`` (0 old, 1 new) that the other one has not delivered."""
+        with self.lock:
+            if not self.active:
+                return packets
+            mine, theirs = self.unmatched[side], self.unmatched[1 - side]
+            kept = []
+            for packet in packets:
+                key = packet_key(packet)
+                if theirs[key]:
+                    theirs[key] -= 1
+                    if not theirs[key]:
+                        del theirs[key]
+                    self.duplicates += 1
+                else:
+                    mine[key] += 1
+                    kept.append(packet)
+            return kept
+
+    def finish(self):
+        with self.lock:
+            self.active = False
+            self.unmatched = (Counter(), Counter())
+        if self.duplicates:
+            OVERLAP_DUPLICATES.inc(self.duplicates)
+        return self.duplicates
+
+
+class _GatedQueue:
+    """Queue proxy that discards packets until ``open`` is called.
+
+    While ``dedupe`` is set to (an _OverlapDeduper, side), packets the other capture already
+    delivered are dropped.
+    """
+    def __init__(self, queue_obj):
+        self.queue = queue_obj
+        self.gate = threading.Event()
+        self.dedupe = None
+        self.received = 0
+        self.discarded = 0
+
+    def open(self):
+        self.gate.set()
+
+    def put(self, packet, block=True, timeout=None):
+        self.received += 1
+        if not self.gate.is_set():
+            self.discarded += 1
+            return False
+        dedupe = self.dedupe
+        if dedupe is not None and not dedupe[0].admit(dedupe[1], [packet]):
+            return False
+        return self.queue.put(packet, block, timeout)
+
+    def put_many(self, packets, block=True, timeout=None):
+        self.received += len(packets)
+        if not self.gate.is_set():
+            self.discarded += len(packets)
+            return 0
+        dedupe = self.dedupe
+        if dedupe is not None:
+            packets = dedupe[0].admit(dedupe[1], packets)
+            if not packets:
+                return 0
+        return self.queue.put_many(packets, block, timeout)
+
+
+class CaptureSupervisor:
+    """Runs the TShark capture with the blocklist compiled into its BPF filter.
+
+    Packets from blocked sources are then dropped in the kernel instead of being copied
+    to userspace, decoded, parsed and queued. Every ``check_interval`` seconds the
+    supervisor compares the firewall state version with the one its filter was built
+    from; if the rebuilt filter differs (and ``min_restart_interval`` has passed since
+    the last swap), it replaces the capture make-before-break:
+
+      1. start a new capture process with the new filter, its packets discarded,
+      2. once it delivers a packet or ``startup_grace`` seconds pass, let its packets
+         through,
+      3. stop the old process ``overlap`` seconds later.
+
+    Packets seen by both processes during the overlap are queued once: the second copy
+    (same capture time, addresses and length) is dropped, so flow rates are not inflated.
+    None are lost unless the old process lags by more than ``overlap``. If the new process exits
+    before cutover (e.g. the filter does not compile), the old one keeps running.
+    At most ``max_filter_terms`` prefixes go into the filter, widest first.
+    """
+    def __init__(self, firewall_repo, interface="eth0", base_filter="ip", queue_obj=None, max_filter_terms=200,
+                 check_interval=1.0, min_restart_interval=5.0, startup_grace=1.0, overlap=0.5, **capture_options):
+        self.firewall_repo = firewall_repo
+        self.interface = interface
+        self.base_filter = base_filter
+        self.queue = queue_obj
+        self.max_filter_terms = max_filter_terms
+        self.check_interval = check_interval
+        self.min_restart_interval = min_restart_interval
+        self.startup_grace = startup_grace
+        self.overlap = overlap
+        self.capture_options = capture_options
+        self.capture = None
+        self.capture_thread = None
+        self.gated = None
+        self.filter_expr = None
+        self.version = None
+        self.last_restart = 0.0
+        self.restarts = 0
+        self.failed_restarts = 0
+        self.overlap_duplicates = 0
+        self.omitted = 0
+        self.stopping = threading.Event()
+
+    def build_filter(self):
+        """Return (state version, filter expression, omitted prefix count) for the current blocklist."""
+        store = self.firewall_repo.store
+        with store.lock:
+            version = store.version
+            prefixes = list(store.blocked_ips)
+        terms, omitted = exclusion_terms(prefixes, self.max_filter_terms)
+        return version, exclusion_filter(self.base_filter, terms), omitted
+
+    def _launch(self, filter_expr):
+        gated = _GatedQueue(self.queue)
+        capture = TSharkCapture(interface=self.interface, filter_expr=filter_expr, queue_obj=gated,
+                                **self.capture_options)
+        thread = threading.Thread(target=capture.start_capture, name="capture", daemon=True)
+        thread.start()
+        return capture, thread, gated
+
+    def _wait_ready(self, capture, thread, gated):
+        deadline = time.monotonic() + self.startup_grace
+        while time.monotonic() < deadline and not self.stopping.is_set():
+            if gated.received:
+                return True
+            if not thread.is_alive() or (capture.proc is not None and capture.proc.poll() is not None):
+                return False
+            time.sleep(0.01)
+        return thread.is_alive() and (capture.proc is None or capture.proc.poll() is None)
+
+    def swap(self, version, filter_expr, omitted):
+        """Replace the running capture with one using ``filter_expr``; returns False if it failed to start."""
+        self.last_restart = time.monotonic()
+        capture, thread, gated = self._launch(filter_expr)
+        if self.capture is not None and not self._wait_ready(capture, thread, gated):
+            capture.stop_capture()
+            self.failed_restarts += 1
+            event_log.error("capture.restart_failed", interface=self.interface, filter_length=len(filter_expr))
+            # Do not retry the same filter until the blocklist changes again.
+            self.version = version
+            return False
+        old, old_thread, old_gated = self.capture, self.capture_thread, self.gated
+        deduper = None
+        if old is not None:
+            deduper = _OverlapDeduper()
+            old_gated.dedupe, gated.dedupe = (deduper, 0), (deduper, 1)
+        gated.open()
+        self.capture, self.capture_thread, self.gated = capture, thread, gated
+        self.filter_expr, self.version, self.omitted = filter_expr, version, omitted
+        if old is not None:
+            self.stopping.wait(self.overlap)
+            old.stop_capture()
+            old_thread.join(timeout=5)
+            gated.dedupe = None
+            self.overlap_duplicates += deduper.finish()
+            self.restarts += 1
+            CAPTURE_RESTARTS.inc()
+        event_log.info("capture.filter_updated", interface=self.interface, omitted=omitted,
+                       filter_length=len(filter_expr))
+        return True
+
+    def check(self):
+        """Rebuild the filter if the blocklist changed; returns True if the capture was replaced."""
+        store = self.firewall_repo.store
+        if store.version == self.version:
+            return False
+        if time.monotonic() - self.last_restart < self.min_restart_interval:
+            return False
+        version, filter_expr, omitted = self.build_filter()
+        if filter_expr == self.filter_expr:
+            self.version = version
+            return False
+        return self.swap(version, filter_expr, omitted)
+
+    def run(self):
+        """Start capturing and keep the filter in sync with the blocklist until ``stop``."""
+        self.swap(*self.build_filter())
+        while not self.stopping.wait(self.check_interval):
+            if self.capture_thread is not None and not self.capture_thread.is_alive():
+                if time.monotonic() - self.last_restart < self.min_restart_interval:
+                    continue
+                # The capture died on its own: start over with the current filter.
+                self.capture = self.capture_thread = self.gated = None
+                self.filter_expr = None
+                self.swap(*self.build_filter())
+                continue
+            self.check()
+
+    def stop(self):
+        self.stopping.set()
+        if self.capture is not None:
+            self.capture.stop_capture()
+            self.capture_thread.join(timeout=5)
+
+    def stats(self):
+        return {
+            "filter": self.filter_expr,
+            "version": self.version,
+            "omitted_prefixes": self.omitted,
+            "restarts": self.restarts,
+            "failed_restarts": self.failed_restarts,
+            "overlap_duplicates": self.overlap_duplicates,
+        }
@@ -0,0 +1,125 @@
+import struct
+
+
+FRAME_HEADER = struct.Struct("!I")
+
+
+def framing_for(content_type):
+    """Bulk bodies are NDJSON unless sent as application/octet-stream (length-prefixed records)."""
+    if content_type and content_type.split(";")[0].strip().lower() == "application/octet-stream":
+        return "length-prefixed"
+    return "ndjson"
+
+
+class RecordReader:
+    """Splits a streamed bulk request body into records.
+
+    "ndjson" records are newline-terminated JSON documents; "length-prefixed" records are a
+    4-byte big-endian length followed by that many bytes of UTF-8 JSON. Chunks may split
+    records anywhere: ``feed`` returns the records completed so far and ``finish`` whatever
+    is left at the end of the body. A record longer than ``max_record_bytes`` raises
+    ValueError, as the rest of the stream cannot be trusted after it.
+    """
+    def __init__(self, framing="ndjson", max_record_bytes=65536):
+        if framing not in ("ndjson", "length-prefixed"):
+            raise ValueError(f"Unknown framing {framing!r}.")
+        self.framing = framing
+        self.max_record_bytes = max_record_bytes
+        self.buffer = bytearray()
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        if self.framing == "ndjson":
+            return self._lines()
+        return self._frames()
+
+    def _lines(self):
+        end = self.buffer.rfind(b"\n")
+        if end < 0:
+            if len(self.buffer) > self.max_record_bytes:
+                raise ValueError(f"Record exceeds the {self.max_record_bytes}-byte limit.")
+            return []
+        records = [line for line in bytes(self.buffer[:end]).split(b"\n") if line.strip()]
+        del self.buffer[:end + 1]
+        return records
+
+    def _frames(self):
+        records = []
+        offset = 0
+        available = len(self.buffer)
+        while available - offset >= FRAME_HEADER.size:
+            length, = FRAME_HEADER.unpack_from(self.buffer, offset)
+            if length > self.max_record_bytes:
+                if records:
+                    # Hand back what precedes it; the next feed raises.
+                    break
+                raise ValueError(f"Record of {length} bytes exceeds the {self.max_record_bytes}-byte limit.")
+            start = offset + FRAME_HEADER.size
+            if available - start < length:
+                break
+            records.append(bytes(self.buffer[start:start + length]))
+            offset = start + length
+        del self.buffer[:offset]
+        return records
+
+    def finish(self):
+        if self.framing == "ndjson":
+            remainder = bytes(self.buffer)
+            self.buffer.clear()
+            return [remainder] if remainder.strip() else []
+        records = self._frames()
+        if self.buffer and not records:
+            raise ValueError("Body ends in the middle of a length-prefixed record.")
+        return records
+
+
+def iter_batches(chunks, framing="ndjson", batch_size=1000, max_record_bytes=65536):
+    """Group the records of an iterable of body chunks into lists of up to ``batch_size``."""
+    reader = RecordReader(framing, max_record_bytes)
+    batch = []
+    error = None
+    try:
+        for chunk in chunks:
+            batch.extend(reader.feed(chunk))
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        while True:
+            records = reader.finish()
+            if not records:
+                break
+            batch.extend(records)
+    except ValueError as e:
+        # Analyze the records that arrived intact before reporting the broken one.
+        error = e
+    while batch:
+        yield batch[:batch_size]
+        batch = batch[batch_size:]
+    if error is not None:
+        raise error
+
+
+async def aiter_batches(chunks, framing="ndjson", batch_size=1000, max_record_bytes=65536):
+    """Async variant of iter_batches for an ASGI request stream."""
+    reader = RecordReader(framing, max_record_bytes)
+    batch = []
+    error = None
+    try:
+        async for chunk in chunks:
+            batch.extend(reader.feed(chunk))
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        while True:
+            records = reader.finish()
+            if not records:
+                break
+            batch.extend(records)
+    except ValueError as e:
+        # Analyze the records that arrived intact before reporting the broken one.
+        error = e
+    while batch:
+        yield batch[:batch_size]
+        batch = batch[batch_size:]
+    if error is not None:
+        raise error
@@ -0,0 +1,177 @@
+import ipaddress
+import socket
+from bisect import bisect_left, bisect_right
+
+
+_BITS = {4: 32, 6: 128}
+_FAMILIES = {4: socket.AF_INET, 6: socket.AF_INET6}
+_IPV4_MAPPED = 0xFFFF  # the upper 96 bits of ::ffff:a.b.c.d
+
+
+def parse_prefix(text):
+    """Return (version, network value, prefix length) for an address or CIDR string.
+
+    IPv4-mapped IPv6 addresses (::ffff:a.b.c.d) are folded into IPv4.
+    """
+    try:
+        if "/" in text:
+            network = ipaddress.ip_network(text, strict=False)
+            version, value, length = network.version, int(network.network_address), network.prefixlen
+        elif ":" in text:
+            version, value, length = 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, text), "big"), 128
+        else:
+            version, value, length = 4, int.from_bytes(socket.inet_pton(socket.AF_INET, text), "big"), 32
+    except (OSError, ValueError):
+        raise ValueError(f"Invalid IP address or CIDR {text!r}.") from None
+    if version == 6 and length >= 96 and value >> 32 == _IPV4_MAPPED:
+        return 4, value & 0xFFFFFFFF, length - 96
+    return version, value, length
+
+
+def parse_address(text):
+    """``parse_prefix`` for a single address (e.g. a packet's source); a CIDR raises ValueError."""
+    if "/" in text:
+        raise ValueError(f"Expected an IP address, not a CIDR: {text!r}.")
+    return parse_prefix(text)
+
+
+def format_prefix(version, value, length, host_suffix=True):
+    """Format a prefix as CIDR; with ``host_suffix=False`` a full-length prefix is a bare address."""
+    bits = _BITS[version]
+    value = value >> (bits - length) << (bits - length) if length else 0
+    address = socket.inet_ntop(_FAMILIES[version], value.to_bytes(bits // 8, "big"))
+    if length == bits and not host_suffix:
+        return address
+    return f"{address}/{length}"
+
+
+# A prefix is stored as one integer key, network << 8 | length, so keys sort by network.
+_LENGTH_BITS = 8
+_LENGTH_MASK = 0xFF
+
+
+class CidrIndex:
+    """Set of blocked IPv4/IPv6 prefixes kept as a sorted list of disjoint prefixes per family.
+
+    Each prefix is one integer key (``network << 8 | length``), so a lookup is a ``bisect``
+    for the last prefix starting at or before the address plus one mask compare, and the
+    index holds one int per blocked prefix. Prefixes never overlap: adding a prefix drops
+    the more-specific entries under it, and two blocked siblings are merged into their
+    parent, so adjacent /32s coalesce into wider prefixes. Removing part of a blocked range
+    splits it into the pieces that stay blocked.
+
+    The interface is set-like (``add``, ``discard``, ``clear``, ``in``, iteration) over
+    address or CIDR strings; iteration yields host prefixes as bare addresses.
+    Every mutation replaces one slice of the list in a single step between two increments
+    of ``changes``, and lookups retry if ``changes`` moved while they read, so readers need
+    no lock; writers must be serialized by the caller (the store lock).
+    """
+    def __init__(self, prefixes=()):
+        self.keys = {4: [], 6: []}
+        self.changes = 0
+        for prefix in prefixes:
+            self.add(prefix)
+
+    def __len__(self):
+        return len(self.keys[4]) + len(self.keys[6])
+
+    def __iter__(self):
+        for version in (4, 6):
+            for key in list(self.keys[version]):
+                yield format_prefix(version, key >> _LENGTH_BITS, key & _LENGTH_MASK, host_suffix=False)
+
+    def __contains__(self, text):
+        """True if the address (or the whole CIDR) is covered by a blocked prefix."""
+        version, value, length = parse_prefix(text)
+        return self._covering(version, value, length) is not None
+
+    def contains_int(self, hi, lo, version):
+        """Lookup for PacketBatch address columns, where IPv4 is stored IPv4-mapped."""
+        if version == 4:
+            return self._covering(4, lo & 0xFFFFFFFF, 32) is not None
+        return self._covering(6, hi << 64 | lo, 128) is not None
+
+    def match(self, text):
+        """Return the blocked prefix covering ``text`` in CIDR notation, or None."""
+        version, value, length = parse_prefix(text)
+        depth = self._covering(version, value, length)
+        return None if depth is None else format_prefix(version, value, depth)
+
+    def _covering(self, version, value, length):
+        # Length of the blocked prefix covering (value, length), or None. Prefixes are disjoint,
+        # so only the last one starting at or before ``value`` can cover it.
+        keys = self.keys[version]
+        probe = value << _LENGTH_BITS | _LENGTH_MASK
+        while True:
+            changes = self.changes
+            i = bisect_right(keys, probe) - 1
+            try:
+                key = keys[i] if i >= 0 else None
+            except IndexError:
+                continue
+            if changes == self.changes and not changes & 1:
+                break
+        if key is None:
+            return None
+        covering = key & _LENGTH_MASK
+        if covering > length or (value ^ key >> _LENGTH_BITS) >> (_BITS[version] - covering):
+            return None
+        return covering
+
+    def _span(self, keys, value, length, bits):
+        # Positions of the keys inside the prefix (value, length).
+        last = value | ((1 << (bits - length)) - 1)
+        return bisect_left(keys, value << _LENGTH_BITS), bisect_right(keys, last << _LENGTH_BITS | _LENGTH_MASK)
+
+    def _replace(self, keys, lo, hi, new_keys):
+        self.changes += 1
+        keys[lo:hi] = new_keys
+        self.changes += 1
+
+    def add(self, text):
+        """Block a prefix; returns False if it was already covered."""
+        version, value, length = parse_prefix(text)
+        if self._covering(version, value, length) is not None:
+            return False
+        bits = _BITS[version]
+        keys = self.keys[version]
+        # Two blocked halves make a blocked parent.
+        while length:
+            sibling = (value ^ (1 << (bits - length))) << _LENGTH_BITS | length
+            i = bisect_left(keys, sibling)
+            if i == len(keys) or keys[i] != sibling:
+                break
+            value &= ~(1 << (bits - length))
+            length -= 1
+        lo, hi = self._span(keys, value, length, bits)
+        self._replace(keys, lo, hi, [value << _LENGTH_BITS | length])
+        return True
+
+    def discard(self, text):
+        """Unblock a prefix (and everything under it); returns False if none of it was blocked.
+
+        Unblocking part of a wider blocked prefix splits that prefix: each sibling on the
+        path down to ``text`` stays blocked.
+        """
+        version, value, length = parse_prefix(text)
+        bits = _BITS[version]
+        keys = self.keys[version]
+        covering = self._covering(version, value, length)
+        if covering is not None:
+            pieces = sorted(((value >> (bits - depth) ^ 1) << (bits - depth)) << _LENGTH_BITS | depth
+                            for depth in range(covering + 1, length + 1))
+            network = value >> (bits - covering) << (bits - covering) if covering else 0
+            i = bisect_left(keys, network << _LENGTH_BITS | covering)
+            self._replace(keys, i, i + 1, pieces)
+            return True
+        lo, hi = self._span(keys, value, length, bits)
+        if lo == hi:
+            return False
+        self._replace(keys, lo, hi, [])
+        return True
+
+    def clear(self):
+        self.changes += 1
+        for keys in self.keys.values():
+            del keys[:]
+        self.changes += 1
@@ -10,12 +10,66 @@ class Settings(BaseSettings):
 
     # Firewall file
     FIREWALL_STATE_FILE: str = "firewall_state.json"
+    FIREWALL_STORAGE_BACKEND: str = "journal"  # journal | sqlite
+    FIREWALL_DB_FILE: str = "data/firewall_state.db"
+    FIREWALL_STATE_PAGE_SIZE: int = 1000  # default log entries per /firewall/state page
+    FIREWALL_IO_WORKERS: int = 4  # executor threads for blocking store reads
+    FIREWALL_FSYNC_POLICY: str = "batched"  # always | batched | never
+    FIREWALL_FLUSH_INTERVAL_MS: int = 10
+    FIREWALL_FLUSH_MAX_EVENTS: int = 1000
+
+    # Block expiry (repositories.block_ttl.BlockTtlPolicy)
+    BLOCK_TTL_ENABLED: bool = True
+    BLOCK_TTL_DEFAULT: float = 3600.0  # seconds, for threat types missing from BLOCK_TTL_BY_THREAT
+    BLOCK_TTL_BY_THREAT: dict = {}  # threat type -> seconds; empty uses DEFAULT_BLOCK_TTLS
+    BLOCK_TTL_ESCALATION: float = 4.0  # TTL multiplier per repeat offense
+    BLOCK_TTL_MAX: float = 30 * 86400.0
+    BLOCK_TTL_PERMANENT_AFTER: int = 0  # offense count that makes a block permanent; 0 never does
+    BLOCK_TTL_OFFENSE_MEMORY: float = 30 * 86400.0  # seconds a past block counts towards escalation
+
+    # Bulk analyze (/firewall/analyze/bulk)
+    BULK_BATCH_SIZE: int = 1000
+    BULK_MAX_RECORD_BYTES: int = 65536
+
+    # Live decision stream (/stream/decisions)
+    STREAM_MAX_PENDING: int = 1000  # buffered events per subscriber
+    STREAM_OVERFLOW: str = "sample"  # sample | disconnect
+    STREAM_FRAME_INTERVAL_MS: int = 100
+    STREAM_MAX_BATCH: int = 500  # events per frame
 
     # CORS
     ALLOWED_ORIGINS: list[str] = ["*"]  # You can restrict this in production
 
+    # Live capture hosted by the FastAPI app (async_runtime.AsyncRuntime)
+    CAPTURE_ENABLED: bool = False
+    CAPTURE_INTERFACE: str = "eth0"
+    CAPTURE_FILTER: str = "ip"
+    CAPTURE_FORMAT: str = "fields"  # fields | pcap
+    CAPTURE_CONSUMERS: int = 1
+    CAPTURE_BATCH_SIZE: int = 256
+    CAPTURE_QUEUE_SIZE: int = 1024  # captured chunks buffered before the reader waits
+    CAPTURE_DRAIN_TIMEOUT: float = 5.0
+
+    # Detection in the tshark/Flask agent (agent_components)
+    DETECTOR_MODEL: str = "rules"  # rules | random | path to a saved .npz model (threat_models.load_model)
+    FLOW_TABLE_ENABLED: bool = True  # per-flow and per-source sliding-window features
+    FLOW_WINDOW: float = 10.0  # seconds of history behind the rate features
+    FLOW_BUCKETS: int = 10
+    FLOW_IDLE_TIMEOUT: float = 60.0  # seconds before an idle flow or source is evicted
+    SHARDED_WORKERS: int = 0  # worker processes scoring packets by src_ip shard (sharding.py); 0 scores in-thread
+    VERDICT_CACHE_ENABLED: bool = True
+    VERDICT_CACHE_SIZE: int = 100000
+    VERDICT_CACHE_KEY: str = "source"  # source | flow
+    VERDICT_CACHE_BLOCK_TTL: float = 300.0  # seconds a block verdict is reused
+    VERDICT_CACHE_ALLOW_TTL: float = 0.0  # seconds an allow verdict is reused; 0 never caches them
+
+    # Metrics (/metrics)
+    METRICS_ENABLED: bool = True
+
     # Logging
-    LOG_LEVEL: str = "INFO"
+    LOG_LEVEL: str = "INFO"  # DEBUG | INFO | WARNING | ERROR
+    LOG_RATE_LIMIT: float = 100.0  # records per event type per second; 0 disables the limit
+    LOG_SAMPLE_RATES: dict = {"packet.analyzed": 0.01, "packet.allowed": 0.01}  # fraction kept per event type
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,191 @@
+import asyncio
+import threading
+from collections import deque
+
+from core.cidr_index import CidrIndex
+
+
+OVERFLOW_POLICIES = ("sample", "disconnect")
+
+
+def decision_event(ts, src_ip, dst_ip, protocol, threat_detected, threat_type, confidence, action, block_cidr):
+    """The dict published for one decision."""
+    return {
+        "ts": ts,
+        "src_ip": src_ip,
+        "dst_ip": dst_ip,
+        "protocol": protocol,
+        "threat_detected": threat_detected,
+        "threat_type": threat_type,
+        "confidence": confidence,
+        "action": action,
+        "block_cidr": block_cidr,
+    }
+
+
+class DecisionFilter:
+    """Subscriber-side filter; an event must match every criterion that is set."""
+    def __init__(self, threat_types=None, actions=None, cidrs=None, threats_only=False):
+        self.threat_types = set(threat_types) if threat_types else None
+        self.actions = {action.upper() for action in actions} if actions else None
+        self.sources = CidrIndex(cidrs) if cidrs else None
+        self.threats_only = threats_only
+
+    def matches(self, event):
+        if self.threats_only and not event["threat_detected"]:
+            return False
+        if self.threat_types is not None and event["threat_type"] not in self.threat_types:
+            return False
+        if self.actions is not None and event["action"] not in self.actions:
+            return False
+        if self.sources is not None:
+            try:
+                return event["src_ip"] in self.sources
+            except ValueError:
+                return False
+        return True
+
+
+class Subscription:
+    """One subscriber's bounded buffer of filtered decision events.
+
+    Publishers call ``offer`` from the detection threads and never wait on the subscriber.
+    When the buffer is full, "sample" drops the overflowing events and reports how many
+    in the next frame, while "disconnect" closes the subscription.
+    """
+    def __init__(self, hub, event_filter, max_pending, overflow):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}; expected one of {OVERFLOW_POLICIES}.")
+        self.hub = hub
+        self.filter = event_filter
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.pending = deque()
+        self.dropped = 0
+        self.delivered = 0
+        self.closed = False
+        self.close_reason = None
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.waker = None
+
+    def offer(self, events):
+        """Buffer the matching events; returns False if this overflowed a "disconnect" subscription."""
+        if self.closed:
+            return True
+        matched = [event for event in events if self.filter.matches(event)]
+        if not matched:
+            return True
+        accepted = True
+        with self.lock:
+            room = self.max_pending - len(self.pending)
+            if len(matched) > room:
+                if self.overflow == "disconnect":
+                    self.closed = True
+                    self.close_reason = "slow consumer"
+                    accepted = False
+                    matched = []
+                else:
+                    self.dropped += len(matched) - room
+                    matched = matched[:room]
+            self.pending.extend(matched)
+        self._wake()
+        return accepted
+
+    def _wake(self):
+        self.ready.set()
+        # One-shot: an async waiter re-arms it each time it waits.
+        waker, self.waker = self.waker, None
+        if waker is not None:
+            waker()
+
+    def take(self, max_items=500):
+        """Return (events, dropped since the last take) without waiting."""
+        with self.lock:
+            count = min(max_items, len(self.pending))
+            events = [self.pending.popleft() for _ in range(count)]
+            dropped, self.dropped = self.dropped, 0
+            if not self.pending and not self.closed:
+                self.ready.clear()
+        self.delivered += len(events)
+        return events, dropped
+
+    def get_batch(self, max_items=500, timeout=1.0):
+        """Blocking take for thread-based servers (e.g. the Flask SSE route)."""
+        self.ready.wait(timeout)
+        return self.take(max_items)
+
+    async def aget_batch(self, max_items=500, timeout=1.0):
+        """Take for asyncio servers; waits on the loop instead of a thread."""
+        if not self.ready.is_set():
+            loop = asyncio.get_running_loop()
+            ready = asyncio.Event()
+            self.waker = lambda: loop.call_soon_threadsafe(ready.set)
+            # An offer may have landed between the check and arming the waker.
+            if not self.ready.is_set():
+                try:
+                    await asyncio.wait_for(ready.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self.waker = None
+        return self.take(max_items)
+
+    def close(self):
+        self.closed = True
+        self.hub.unsubscribe(self)
+        self._wake()
+
+
+class DecisionHub:
+    """Fan-out of detection decisions to live subscribers (WebSocket / SSE streams).
+
+    ``publish`` takes a list of events (see ``decision_event``) and hands it to every
+    subscription's bounded buffer, so a slow subscriber costs the publisher one filter
+    pass and never blocks it. The subscriber list is copy-on-write, and publishers check
+    ``active`` to skip building events when nobody is listening.
+    """
+    def __init__(self, max_pending=1000, overflow="sample"):
+        self.max_pending = max_pending
+        self.overflow = overflow
+        self.subscriptions = ()
+        self.lock = threading.Lock()
+        self.published = 0
+        self.disconnected = 0
+
+    @property
+    def active(self):
+        return bool(self.subscriptions)
+
+    def subscribe(self, event_filter=None, max_pending=None, overflow=None):
+        subscription = Subscription(self, event_filter or DecisionFilter(), max_pending or self.max_pending,
+                                    overflow or self.overflow)
+        with self.lock:
+            self.subscriptions = self.subscriptions + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions = tuple(s for s in self.subscriptions if s is not subscription)
+
+    def publish(self, events):
+        subscriptions = self.subscriptions
+        if not subscriptions or not events:
+            return
+        self.published += len(events)
+        for subscription in subscriptions:
+            if not subscription.offer(events):
+                self.disconnected += 1
+                subscription.close()
+
+    def stats(self):
+        subscriptions = self.subscriptions
+        return {
+            "subscribers": len(subscriptions),
+            "published": self.published,
+            "disconnected": self.disconnected,
+            "pending": sum(len(s.pending) for s in subscriptions),
+        }
+
+
+decision_hub = DecisionHub()
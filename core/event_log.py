@@ -0,0 +1,195 @@
+import atexit
+import json
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from core.config import settings
+
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"DEBUG": DEBUG, "INFO": INFO, "WARNING": WARNING, "ERROR": ERROR}
+LEVEL_NAMES = {value: name for name, value in LEVELS.items()}
+# Per-packet events are DEBUG; when enabled, keep 1 in 100 of them by default.
+DEFAULT_SAMPLE_RATES = {"packet.analyzed": 0.01, "packet.allowed": 0.01}
+
+
+def parse_level(level):
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVELS[str(level).upper()]
+    except KeyError:
+        raise ValueError(f"Unknown log level {level!r}; expected one of {list(LEVELS)}.")
+
+
+def _jsonable(value):
+    # NumPy scalars and anything else json cannot encode.
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class EventLogger:
+    """Structured JSON-lines logger that keeps the write off the calling thread.
+
+    ``log`` checks the level, then applies per-event-type sampling and rate limiting, and
+    appends the record to a deque; deque appends are atomic, so callers never take a lock
+    or touch the stream. A writer thread drains the deque every ``flush_interval`` seconds
+    and writes the records as JSON lines in a single write.
+
+    ``sample_rates`` maps an event type to the fraction of its records kept (every
+    round(1 / rate)-th one). ``rate_limit`` caps records per event type per second and
+    ``rate_limits`` overrides it per type. Records beyond ``max_pending`` are dropped.
+    Sampled-out, rate-limited and dropped counts are written as a "log.suppressed" record
+    every ``report_interval`` seconds. The counters are not locked, so under contention
+    they are approximate.
+    """
+    def __init__(self, stream=None, level=INFO, sample_rates=None, rate_limit=None, rate_limits=None,
+                 max_pending=10000, flush_interval=0.2, report_interval=10.0):
+        self.stream = stream
+        self.threshold = parse_level(level)
+        self.sample_every = {}
+        self.set_sample_rates(DEFAULT_SAMPLE_RATES if sample_rates is None else sample_rates)
+        self.rate_limit = rate_limit
+        self.rate_limits = dict(rate_limits or {})
+        self.max_pending = max_pending
+        self.flush_interval = flush_interval
+        self.report_interval = report_interval
+        self.pending = deque()
+        self.seen = Counter()
+        self.windows = {}
+        self.suppressed = Counter()
+        self.written = 0
+        self.write_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.closed = False
+        self.writer = None
+
+    def configure(self, level=None, sample_rates=None, rate_limit=None, rate_limits=None):
+        if level is not None:
+            self.threshold = parse_level(level)
+        if sample_rates is not None:
+            self.set_sample_rates(sample_rates)
+        if rate_limit is not None:
+            self.rate_limit = rate_limit or None
+        if rate_limits is not None:
+            self.rate_limits = dict(rate_limits)
+
+    def set_sample_rates(self, sample_rates):
+        self.sample_every = {event: max(1, round(1 / rate)) for event, rate in sample_rates.items() if rate > 0}
+        # A rate of 0 turns the event off.
+        self.sample_every.update((event, 0) for event, rate in sample_rates.items() if rate <= 0)
+
+    def enabled(self, level):
+        return level >= self.threshold
+
+    def log(self, event, level=INFO, **fields):
+        if level < self.threshold:
+            return
+        every = self.sample_every.get(event)
+        if every is not None:
+            seen = self.seen[event] = self.seen[event] + 1
+            if every == 0 or seen % every:
+                self.suppressed[event, "sampled"] += 1
+                return
+        limit = self.rate_limits.get(event, self.rate_limit)
+        now = time.time()
+        if limit is not None:
+            second = int(now)
+            window = self.windows.get(event)
+            if window is None or window[0] != second:
+                window = self.windows[event] = [second, 0]
+            window[1] += 1
+            if window[1] > limit:
+                self.suppressed[event, "rate_limited"] += 1
+                return
+        if len(self.pending) >= self.max_pending:
+            self.suppressed[event, "dropped"] += 1
+            return
+        self.pending.append((now, level, event, fields))
+        if self.writer is None:
+            self._start()
+
+    def debug(self, event, **fields):
+        self.log(event, DEBUG, **fields)
+
+    def info(self, event, **fields):
+        self.log(event, INFO, **fields)
+
+    def warning(self, event, **fields):
+        self.log(event, WARNING, **fields)
+
+    def error(self, event, **fields):
+        self.log(event, ERROR, **fields)
+
+    def _start(self):
+        with self.write_lock:
+            if self.writer is None and not self.closed:
+                self.writer = threading.Thread(target=self._writer_loop, name="event-log", daemon=True)
+                self.writer.start()
+
+    def _writer_loop(self):
+        last_report = time.monotonic()
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            if time.monotonic() - last_report >= self.report_interval:
+                last_report = time.monotonic()
+                self._report_suppressed()
+            self.flush()
+
+    def _report_suppressed(self):
+        if not self.suppressed:
+            return
+        suppressed, self.suppressed = self.suppressed, Counter()
+        counts = {}
+        for (event, reason), count in suppressed.items():
+            counts.setdefault(event, {})[reason] = count
+        self.pending.append((time.time(), INFO, "log.suppressed", {"counts": counts}))
+
+    def _format(self, record):
+        ts, level, event, fields = record
+        line = {"ts": round(ts, 6), "level": LEVEL_NAMES.get(level, level), "event": event}
+        line.update(fields)
+        return json.dumps(line, default=_jsonable)
+
+    def flush(self):
+        """Write every queued record now."""
+        with self.write_lock:
+            lines = []
+            pending = self.pending
+            while pending:
+                lines.append(self._format(pending.popleft()))
+            if not lines:
+                return
+            stream = self.stream or sys.stdout
+            try:
+                stream.write("\n".join(lines) + "\n")
+                stream.flush()
+            except (OSError, ValueError):
+                # The stream is gone (closed pipe, interpreter shutdown); nothing to report to.
+                return
+            self.written += len(lines)
+
+    def close(self):
+        self.closed = True
+        self.wakeup.set()
+        if self.writer is not None and self.writer is not threading.current_thread():
+            self.writer.join()
+        self._report_suppressed()
+        self.flush()
+
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "written": self.written,
+            "suppressed": sum(self.suppressed.values()),
+        }
+
+
+# Configured here from settings, so the FastAPI app, the Flask/tshark agent and the tools log alike.
+event_log = EventLogger(level=settings.LOG_LEVEL, sample_rates=settings.LOG_SAMPLE_RATES,
+                        rate_limit=settings.LOG_RATE_LIMIT or None)
+atexit.register(event_log.close)
@@ -0,0 +1,180 @@
+import os
+import threading
+from collections import Counter as Tally
+
+
+PREFIX = "packet_analyzer_"
+# Exported histogram buckets: powers of two from ~1us to ~137s, in nanoseconds.
+EXPORT_BOUNDS_NS = [1 << k for k in range(10, 38)]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """HDR-style latency histogram with 4 linear sub-buckets per power of two of nanoseconds.
+
+    Recording is an index computation and a list increment; the relative error of a
+    bucket is at most 25%. Quantiles are estimated from the bucket midpoints.
+    """
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self):
+        self.counts = [0] * 256
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds, count=1):
+        ns = int(seconds * 1e9)
+        if ns < 0:
+            ns = 0
+        shift = ns.bit_length() - 3
+        if shift < 0:
+            shift = 0
+        self.counts[(shift << 2) + (ns >> shift)] += count
+        self.count += count
+        self.sum += seconds * count
+
+    @staticmethod
+    def bucket_bounds(index):
+        """Lower and upper bound of a bucket in nanoseconds."""
+        if index < 8:
+            return index, index + 1
+        shift = (index >> 2) - 1
+        mantissa = index - (shift << 2)
+        return mantissa << shift, (mantissa + 1) << shift
+
+    def quantile(self, q):
+        """Estimated q-quantile in seconds (0.0 when empty)."""
+        target = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                low, high = self.bucket_bounds(index)
+                return (low + high) / 2e9
+        return 0.0
+
+    def cumulative(self, bounds_ns):
+        """Counts of observations at or below each bound (bounds must be powers of two)."""
+        result = []
+        seen = 0
+        index = 0
+        for bound in bounds_ns:
+            while index < len(self.counts) and self.bucket_bounds(index)[1] <= bound:
+                seen += self.counts[index]
+                index += 1
+            result.append(seen)
+        return result
+
+
+class MetricsRegistry:
+    """Process-wide counters, histograms and gauges, rendered in Prometheus text format.
+
+    ``counter``/``histogram`` return the series for a name and label set, creating it on
+    first use; hot paths look them up once and keep the object. Updates take no lock, so
+    under heavy contention a few increments can be lost. Instrumented code checks
+    ``enabled`` before timing anything, so a disabled registry costs one attribute read.
+    Gauges are callables evaluated at scrape time.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.help = {}
+        self.types = {}
+        self.series = {}
+        self.gauges = {}
+
+    def _get(self, kind, factory, name, help, labels):
+        key = (name, tuple(sorted(labels.items())))
+        series = self.series.get(key)
+        if series is None:
+            with self.lock:
+                series = self.series.get(key)
+                if series is None:
+                    self.help.setdefault(name, help)
+                    self.types.setdefault(name, kind)
+                    series = self.series[key] = factory()
+        return series
+
+    def counter(self, name, help="", **labels):
+        return self._get("counter", Counter, name, help, labels)
+
+    def histogram(self, name, help="", **labels):
+        return self._get("histogram", Histogram, name, help, labels)
+
+    def gauge(self, name, fn, help="", **labels):
+        with self.lock:
+            self.help.setdefault(name, help)
+            self.types.setdefault(name, "gauge")
+            self.gauges[(name, tuple(sorted(labels.items())))] = fn
+
+    def render(self):
+        with self.lock:
+            series = sorted(self.series.items(), key=lambda item: item[0])
+            gauges = sorted(self.gauges.items(), key=lambda item: item[0])
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {PREFIX}{name} {self.help.get(name, '')}")
+                lines.append(f"# TYPE {PREFIX}{name} {self.types[name]}")
+
+        for (name, labels), value in series:
+            describe(name)
+            if isinstance(value, Counter):
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {value.value}")
+                continue
+            for bound, count in zip(EXPORT_BOUNDS_NS, value.cumulative(EXPORT_BOUNDS_NS)):
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', f'{bound / 1e9:.9g}'),))} {count}")
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', '+Inf'),))} {value.count}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {value.sum:.9g}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {value.count}")
+        for (name, labels), fn in gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            describe(name)
+            lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+_decision_counters = {}
+
+
+def count_decision(threat_type, count=1):
+    counter = _decision_counters.get(threat_type)
+    if counter is None:
+        counter = _decision_counters[threat_type] = metrics.counter(
+            "decisions_total", "Decisions by threat type.", threat_type=threat_type)
+    counter.value += count
+
+
+def count_decisions(threat_types):
+    """Add a batch of decisions to the per-threat-type counters."""
+    for threat_type, count in Tally(threat_types).items():
+        count_decision(threat_type, count)
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+metrics = MetricsRegistry(enabled=os.environ.get("METRICS_ENABLED", "true").lower() not in ("0", "false", "no"))
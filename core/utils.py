@@ -1,14 +1,17 @@
-import random
+from datetime import datetime, timezone
 
-THREAT_SCENARIOS = [
-    {"threat_type": "TCP SYN Flood Attack", "confidence": "High", "action": "BLOCK"},
-    {"threat_type": "Slowloris DoS Attack", "confidence": "High", "action": "BLOCK"},
-    {"threat_type": "SQL Injection Attempt", "confidence": "High", "action": "BLOCK"},
-    {"threat_type": "Suspicious SSH Brute Force", "confidence": "High", "action": "BLOCK"},
-    {"threat_type": "Excessive ICMP Requests (Ping Flood)", "confidence": "High", "action": "BLOCK"},
-    {"threat_type": "Outbound Data Exfiltration (Beaconing)", "confidence": "High", "action": "BLOCK"},
-    {"threat_type": "Normal traffic", "confidence": "Low", "action": "ALLOW"},
-]
+# Verdict for sources already inside a blocked prefix; the detector is skipped for them.
+BLOCKED_SOURCE = {"threat_type": "Blocked Source (Firewall Rule)", "confidence": "High", "action": "BLOCK"}
 
-def get_threat():
-    return random.choice(THREAT_SCENARIOS)
+def to_epoch(value):
+    """Seconds since the epoch for a number (or numeric string) or an ISO-8601 timestamp (naive or "Z" means UTC)."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value[:-1] if value.endswith("Z") else value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
@@ -1,10 +1,30 @@
+import time
+from datetime import datetime, timezone
+
+
 class Packet:
-    def __init__(self, src_ip, dst_ip, protocol, data, timestamp=None):
+    """A single packet. ``ts`` is the float epoch; the ISO-8601 ``timestamp`` is only formatted on access."""
+    __slots__ = ("src_ip", "dst_ip", "protocol", "data", "_ts", "_timestamp")
+
+    def __init__(self, src_ip, dst_ip, protocol, data, timestamp=None, ts=None):
         self.src_ip = src_ip
         self.dst_ip = dst_ip
         self.protocol = protocol
         self.data = data
-        self.timestamp = timestamp or datetime.utcnow().isoformat() + "Z"
+        self._timestamp = timestamp
+        self._ts = ts if ts is not None or timestamp is not None else time.time()
+
+    @property
+    def ts(self):
+        if self._ts is None:
+            self._ts = datetime.fromisoformat(self._timestamp.rstrip("Z")).replace(tzinfo=timezone.utc).timestamp()
+        return self._ts
+
+    @property
+    def timestamp(self):
+        if self._timestamp is None:
+            self._timestamp = datetime.utcfromtimestamp(self._ts).isoformat() + "Z"
+        return self._timestamp
 
 class ThreatDecision:
     def __init__(self, threat_detected, threat_type, confidence, action, block_cidr=None):
@@ -12,4 +32,26 @@ class ThreatDecision:
         self.threat_type = threat_type
         self.confidence = confidence
         self.action = action
-        self.block_cidr = block_cidr
\ No newline at end of file
+        self.block_cidr = block_cidr
+
+class ThreatBatchDecision:
+    """Decisions for a whole batch, one array element per packet."""
+    def __init__(self, threat_detected, threat_type, confidence, action, score, block_cidr=None):
+        self.threat_detected = threat_detected
+        self.threat_type = threat_type
+        self.confidence = confidence
+        self.action = action
+        self.score = score
+        self.block_cidr = block_cidr
+
+    def __len__(self):
+        return len(self.threat_detected)
+
+    def decision(self, i):
+        return ThreatDecision(
+            threat_detected=bool(self.threat_detected[i]),
+            threat_type=str(self.threat_type[i]),
+            confidence=str(self.confidence[i]),
+            action=str(self.action[i]),
+            block_cidr=self.block_cidr[i] if self.block_cidr is not None else None
+        )
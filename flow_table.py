@@ -0,0 +1,239 @@
+import math
+
+import numpy as np
+
+from packet_batch import PROTOCOLS, ip_to_int
+from timing_wheel import TimingWheel
+
+
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+PROTO_TCP = 6
+ICMP_PROTOCOLS = (1, 58)
+PORT_BITMAP_BITS = 1024
+
+# Aggregate columns appended to the detector's feature matrix, in this order.
+AGGREGATE_COLUMNS = (
+    "src_pps",
+    "src_syn_ratio",
+    "src_syn_rate",
+    "src_distinct_dst_ports",
+    "src_icmp_rate",
+    "src_interarrival_cv",
+    "flow_pps",
+    "flow_bytes_per_s",
+)
+
+
+class WindowStats:
+    """Sliding-window counters kept in a ring of time buckets.
+
+    Totals are maintained incrementally: entering a new bucket subtracts whatever the
+    recycled bucket held, so every update and read is O(buckets) at worst and O(1)
+    amortized. Destination ports go into a per-bucket bitmap so distinct ports over the
+    window can be estimated by linear counting.
+    """
+    __slots__ = ("bucket_ids", "packets", "bytes", "syn", "tcp", "icmp", "ports", "head",
+                 "total_packets", "total_bytes", "total_syn", "total_tcp", "total_icmp",
+                 "first_seen", "last_seen", "gap_mean", "gap_var", "gaps")
+
+    def __init__(self, buckets, now):
+        self.bucket_ids = [-1] * buckets
+        self.packets = [0.0] * buckets
+        self.bytes = [0.0] * buckets
+        self.syn = [0.0] * buckets
+        self.tcp = [0.0] * buckets
+        self.icmp = [0.0] * buckets
+        self.ports = [0] * buckets
+        self.head = -1
+        self.total_packets = self.total_bytes = self.total_syn = self.total_tcp = self.total_icmp = 0.0
+        self.first_seen = self.last_seen = now
+        self.gap_mean = self.gap_var = 0.0
+        self.gaps = 0
+
+    def _rotate(self, bucket_id):
+        # Recycle every bucket between the previous head and ``bucket_id``.
+        size = len(self.bucket_ids)
+        start = max(self.head + 1, bucket_id - size + 1)
+        for current in range(start, bucket_id + 1):
+            i = current % size
+            if self.bucket_ids[i] != current:
+                self.total_packets -= self.packets[i]
+                self.total_bytes -= self.bytes[i]
+                self.total_syn -= self.syn[i]
+                self.total_tcp -= self.tcp[i]
+                self.total_icmp -= self.icmp[i]
+                self.packets[i] = self.bytes[i] = self.syn[i] = self.tcp[i] = self.icmp[i] = 0.0
+                self.ports[i] = 0
+                self.bucket_ids[i] = current
+        self.head = bucket_id
+
+    def add(self, bucket_id, now, protocol, dst_port, tcp_flags, length, weight):
+        if bucket_id > self.head:
+            self._rotate(bucket_id)
+        elif bucket_id <= self.head - len(self.bucket_ids):
+            # Too late for its own bucket (already recycled); count it in the newest one.
+            bucket_id = self.head
+        i = bucket_id % len(self.bucket_ids)
+        self.packets[i] += weight
+        self.total_packets += weight
+        self.bytes[i] += length * weight
+        self.total_bytes += length * weight
+        if protocol == PROTO_TCP:
+            self.tcp[i] += weight
+            self.total_tcp += weight
+            if tcp_flags & TCP_SYN and not tcp_flags & TCP_ACK:
+                self.syn[i] += weight
+                self.total_syn += weight
+        elif protocol in ICMP_PROTOCOLS:
+            self.icmp[i] += weight
+            self.total_icmp += weight
+        if dst_port:
+            self.ports[i] |= 1 << (hash(dst_port) % PORT_BITMAP_BITS)
+        # Exponentially weighted mean/variance of inter-arrival gaps for beaconing.
+        gap = max(now - self.last_seen, 0.0)
+        if gap > 0 or self.gaps:
+            if self.gaps == 0:
+                self.gap_mean = gap
+            else:
+                delta = gap - self.gap_mean
+                self.gap_mean += 0.1 * delta
+                self.gap_var = 0.9 * (self.gap_var + 0.1 * delta * delta)
+            self.gaps += 1
+        if now > self.last_seen:
+            self.last_seen = now
+
+    def distinct_ports(self, bucket_id):
+        if bucket_id > self.head:
+            self._rotate(bucket_id)
+        bits = 0
+        for ports in self.ports:
+            bits |= ports
+        zeros = PORT_BITMAP_BITS - bin(bits).count("1")
+        if zeros == 0:
+            return float(PORT_BITMAP_BITS)
+        return -PORT_BITMAP_BITS * math.log(zeros / PORT_BITMAP_BITS)
+
+    def interarrival_cv(self, min_gaps=5):
+        # Coefficient of variation of the gaps; 1.0 until there are enough samples.
+        if self.gaps < min_gaps or self.gap_mean <= 0:
+            return 1.0
+        return math.sqrt(self.gap_var) / self.gap_mean
+
+
+class FlowTable:
+    """Per-flow (5-tuple) and per-source sliding-window statistics.
+
+    Entries idle for ``idle_timeout`` seconds are evicted through a timing wheel, so memory
+    follows the set of active sources rather than everything ever seen. Timestamps are the
+    packets' own capture times, which keeps replayed captures deterministic.
+    """
+    def __init__(self, window=10.0, buckets=10, idle_timeout=60.0, wheel_slots=512):
+        self.window = window
+        self.buckets = buckets
+        self.bucket_width = window / buckets
+        self.idle_timeout = idle_timeout
+        self.sources = {}
+        self.flows = {}
+        self.source_wheel = None
+        self.flow_wheel = None
+        self.wheel_slots = wheel_slots
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.sources) + len(self.flows)
+
+    def _wheel(self, now):
+        if self.source_wheel is None:
+            tick = max(self.idle_timeout / 8, 0.001)
+            self.source_wheel = TimingWheel(tick, self.wheel_slots, now)
+            self.flow_wheel = TimingWheel(tick, self.wheel_slots, now)
+
+    def update(self, src_key, flow_key, now, protocol, dst_port, tcp_flags, length, weight=1.0):
+        """Account one packet and return its aggregate feature tuple (see AGGREGATE_COLUMNS)."""
+        bucket_id = int(now / self.bucket_width)
+        source = self.sources.get(src_key)
+        if source is None:
+            self._wheel(now)
+            source = self.sources[src_key] = WindowStats(self.buckets, now)
+            self.source_wheel.schedule(src_key, now + self.idle_timeout)
+        flow = self.flows.get(flow_key)
+        if flow is None:
+            self._wheel(now)
+            flow = self.flows[flow_key] = WindowStats(self.buckets, now)
+            self.flow_wheel.schedule(flow_key, now + self.idle_timeout)
+        source.add(bucket_id, now, protocol, dst_port, tcp_flags, length, weight)
+        flow.add(bucket_id, now, protocol, dst_port, tcp_flags, length, weight)
+        return self._features(source, flow, bucket_id, now)
+
+    def _features(self, source, flow, bucket_id, now):
+        source_span = min(self.window, max(now - source.first_seen, self.bucket_width))
+        flow_span = min(self.window, max(now - flow.first_seen, self.bucket_width))
+        syn_ratio = source.total_syn / source.total_tcp if source.total_tcp else 0.0
+        return (
+            source.total_packets / source_span,
+            syn_ratio,
+            source.total_syn / source_span,
+            source.distinct_ports(bucket_id),
+            source.total_icmp / source_span,
+            source.interarrival_cv(),
+            flow.total_packets / flow_span,
+            flow.total_bytes / flow_span,
+        )
+
+    def update_packet(self, packet, weight=1.0):
+        """Single-packet path: key the packet the same way update_batch does."""
+        src_hi, src_lo, _ = ip_to_int(packet.src_ip)
+        dst_hi, dst_lo, _ = ip_to_int(packet.dst_ip)
+        data = packet.data
+        protocol_id = PROTOCOLS.id_for(packet.protocol)
+        src_port = data.get("src_port") or 0
+        dst_port = data.get("dst_port") or 0
+        ts = packet.ts
+        features = self.update((src_hi, src_lo), (src_hi, src_lo, dst_hi, dst_lo, protocol_id, src_port, dst_port),
+                               ts, protocol_id, dst_port, data.get("tcp_flags") or 0,
+                               int(data.get("length", "0")), weight)
+        self.expire(ts)
+        return features
+
+    def update_batch(self, batch, weights=None):
+        """Account every row of a PacketBatch; returns an (n, len(AGGREGATE_COLUMNS)) matrix."""
+        columns = batch.columns
+        result = np.empty((len(columns), len(AGGREGATE_COLUMNS)), dtype=np.float64)
+        if not len(columns):
+            return result
+        weights = [1.0] * len(columns) if weights is None else weights
+        update = self.update
+        rows = zip(columns["src_hi"].tolist(), columns["src_lo"].tolist(), columns["dst_hi"].tolist(),
+                   columns["dst_lo"].tolist(), columns["protocol"].tolist(), columns["src_port"].tolist(),
+                   columns["dst_port"].tolist(), columns["tcp_flags"].tolist(), columns["length"].tolist(),
+                   columns["ts"].tolist(), weights)
+        for i, (src_hi, src_lo, dst_hi, dst_lo, protocol, src_port, dst_port, tcp_flags, length, ts,
+                weight) in enumerate(rows):
+            result[i] = update((src_hi, src_lo), (src_hi, src_lo, dst_hi, dst_lo, protocol, src_port, dst_port),
+                               ts, protocol, dst_port, tcp_flags, length, weight)
+        self.expire(float(columns["ts"][-1]))
+        return result
+
+    def expire(self, now):
+        """Evict sources and flows idle for longer than idle_timeout; returns how many were evicted."""
+        if self.source_wheel is None:
+            return 0
+        evicted = 0
+        for table, wheel in ((self.sources, self.source_wheel), (self.flows, self.flow_wheel)):
+            for key in wheel.advance(now):
+                stats = table.get(key)
+                if stats is None:
+                    continue
+                deadline = stats.last_seen + self.idle_timeout
+                if deadline > now:
+                    # Still active: entries are rescheduled lazily, only when they come due.
+                    wheel.schedule(key, deadline)
+                else:
+                    del table[key]
+                    evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    def stats(self):
+        return {"sources": len(self.sources), "flows": len(self.flows), "evicted": self.evicted}
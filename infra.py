@@ -1,18 +1,35 @@
+import queue
+import re
+import subprocess
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from core.event_log import event_log
+from core.metrics import metrics
+from domain import Packet
+from pcap_decoder import CaptureDecoder
+from repositories.journal import JournaledFirewallState
+
+
+PACKETS_CAPTURED = metrics.counter("packets_total", "Packets handled by each pipeline stage.", stage="captured")
+
+
 class FirewallRepository:
-    """Persists firewall state in a JSON file."""
-    def __init__(self, filepath="firewall_state.json"):
+    """Persists firewall state as a JSON snapshot plus an append-only journal.
+
+    ``store_options`` (fsync_policy, flush_interval, ttl_policy, ...) are passed to JournaledFirewallState.
+    """
+    def __init__(self, filepath="firewall_state.json", **store_options):
         self.filepath = filepath
-        try:
-            with open(filepath, "r") as f:
-                self.state = json.load(f)
-        except FileNotFoundError:
-            self.state = {"blocked_ips": [], "log": []}
+        self.store = JournaledFirewallState(filepath, **store_options)
         self.lock = threading.Lock()
 
     def add_blocked_ip(self, ip, reason, confidence, action):
+        """Record a block; returns the journal CommitHandle, or None if ``ip`` was already blocked or invalid."""
         with self.lock:
-            if ip not in self.state["blocked_ips"]:
-                self.state["blocked_ips"].append(ip)
+            if not self.store.is_blocked(ip):
                 log_entry = {
                     "event": "Blocked IP",
                     "ip": ip,
@@ -21,46 +38,116 @@ class FirewallRepository:
                     "action": action,
                     "timestamp": datetime.utcnow().isoformat() + "Z"
                 }
-                self.state["log"].append(log_entry)
-                self.save()
-                print(f"FirewallRepository: Added {ip} to blocked list.")
-            else:
-                print(f"FirewallRepository: {ip} is already blocked.")
+                handle = self.store.record(log_entry)
+                if handle is not None:
+                    event_log.debug("firewall.blocked", ip=ip)
+                return handle
+            event_log.debug("firewall.already_blocked", ip=ip)
+            return None
+
+    def add_blocked_ips(self, blocks):
+        """Record (ip, reason, confidence, action) blocks with one group commit; returns its handle."""
+        with self.lock:
+            timestamp = datetime.utcnow().isoformat() + "Z"
+            entries = [{
+                "event": "Blocked IP",
+                "ip": ip,
+                "reason": reason,
+                "confidence": confidence,
+                "action": action,
+                "timestamp": timestamp
+            } for ip, reason, confidence, action in blocks if not self.store.is_blocked(ip)]
+            if not entries:
+                return None
+            handle = self.store.record_many(entries)
+            event_log.debug("firewall.blocked", count=len(entries))
+            return handle
 
     def unblock_ip(self, ip):
         with self.lock:
-            if ip in self.state["blocked_ips"]:
-                self.state["blocked_ips"].remove(ip)
+            if self.store.is_blocked(ip):
                 log_entry = {
                     "event": "Unblocked IP",
                     "ip": ip,
                     "reason": "Manual unblock",
                     "timestamp": datetime.utcnow().isoformat() + "Z"
                 }
-                self.state["log"].append(log_entry)
-                self.save()
+                self.store.record(log_entry)
                 return True
             return False
 
+    def is_blocked(self, ip):
+        return self.store.is_blocked(ip)
+
+    def match(self, ip):
+        return self.store.match(ip)
+
+    def blocked_rows(self, batch):
+        """Indices of the PacketBatch rows whose source falls in a blocked prefix."""
+        index = self.store.blocked_ips
+        if not len(index):
+            return []
+        columns = batch.columns
+        seen = {}
+        rows = []
+        for i, (hi, lo, version) in enumerate(zip(columns["src_hi"].tolist(), columns["src_lo"].tolist(),
+                                                  columns["ip_version"].tolist())):
+            blocked = seen.get((hi, lo))
+            if blocked is None:
+                blocked = seen[(hi, lo)] = index.contains_int(hi, lo, version)
+            if blocked:
+                rows.append(i)
+        return rows
+
     def get_state(self):
-        with self.lock:
-            return self.state
+        return self.store.state()
+
+    @property
+    def version(self):
+        return self.store.version
+
+    def get_state_page(self, after=None, limit=1000, event=None, include_blocked=True):
+        return self.store.state_page(after=after, limit=limit, event=event, include_blocked=include_blocked)
+
+    def get_summary(self):
+        return self.store.summary()
 
     def save(self):
-        with open(self.filepath, "w") as f:
-            json.dump(self.state, f, indent=4)
+        # Events are journaled as they happen; this folds the journal into a new snapshot.
+        self.store.compact()
 
 class TSharkCapture:
-    """Uses TShark to capture packets and stream them into a pipeline queue."""
-    def __init__(self, interface="eth0", filter_expr="ip", queue_obj=None):
+    """Uses TShark to capture packets and stream them into a pipeline queue.
+
+    ``capture_format="fields"`` parses tshark's text output line by line.
+    ``capture_format="pcap"`` reads raw pcapng from ``tshark -w -`` (or ``dumpcap``)
+    in large chunks and decodes the headers directly, which also yields ports and TCP flags.
+    """
+    def __init__(self, interface="eth0", filter_expr="ip", queue_obj=None,
+                 capture_format="fields", capture_tool="tshark", chunk_size=1 << 20):
         self.interface = interface
         self.filter_expr = filter_expr
         self.queue = queue_obj
+        self.capture_format = capture_format
+        self.capture_tool = capture_tool
+        self.chunk_size = chunk_size
         self.running = False
+        self.proc = None
 
-    def start_capture(self):
-        self.running = True
-        cmd = [
+    def command(self):
+        """The capture command line for ``capture_format``."""
+        if self.capture_format == "pcap":
+            cmd = [
+                self.capture_tool,
+                "-i", self.interface,
+                "-f", self.filter_expr,
+                "-w", "-",         # Write raw pcapng to stdout
+                "-q"
+            ]
+            if self.capture_tool == "tshark":
+                cmd += ["-F", "pcapng"]
+            return cmd
+        return [
             "tshark",
             "-i", self.interface,
             "-f", self.filter_expr,
@@ -69,31 +156,228 @@ class TSharkCapture:
             "-e", "ip.src",
             "-e", "ip.dst",
             "-e", "_ws.col.Protocol",
-            "-e", "frame.len"
+            "-e", "frame.len",
+            "-e", "frame.time_epoch"  # capture time, so overlapping captures report a packet alike
         ]
-        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    @staticmethod
+    def parse_line(line):
+        """Build a Packet from one line of ``-T fields`` output, or None if it is incomplete."""
+        line = line.strip()
+        if not line:
+            return None
+        # Parse TShark output (assumed to be whitespace separated)
+        fields = re.split(r'\s+', line)
+        if len(fields) < 4:
+            return None
+        src_ip, dst_ip, protocol, length = fields[:4]
+        ts = None
+        if len(fields) > 4:
+            try:
+                ts = float(fields[4])
+            except ValueError:
+                pass
+        return Packet(src_ip, dst_ip, protocol, data={"length": length}, ts=ts)
+
+    def start_capture(self):
+        if self.capture_format == "pcap":
+            return self._start_pcap_capture()
+        self.running = True
+        proc = self.proc = subprocess.Popen(self.command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                            text=True)
         while self.running:
             line = proc.stdout.readline()
             if line:
-                line = line.strip()
-                if line:
-                    # Parse TShark output (assumed to be whitespace separated)
-                    fields = re.split(r'\s+', line)
-                    if len(fields) >= 4:
-                        src_ip, dst_ip, protocol, length = fields[:4]
-                        packet = Packet(src_ip, dst_ip, protocol, data={"length": length})
-                        self.queue.put(packet)
+                packet = self.parse_line(line)
+                if packet is not None:
+                    self.queue.put(packet)
+                    PACKETS_CAPTURED.inc()
+            elif proc.poll() is not None:
+                break
             else:
                 time.sleep(0.1)
         proc.terminate()
 
+    def _start_pcap_capture(self):
+        self.running = True
+        proc = self.proc = subprocess.Popen(self.command(), stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                            bufsize=0)
+        decoder = CaptureDecoder()
+        while self.running:
+            # The pipe is unbuffered, so read() returns whatever is available up to chunk_size.
+            chunk = proc.stdout.read(self.chunk_size)
+            if not chunk:
+                break
+            packets = decoder.feed(chunk)
+            if packets:
+                self.queue.put_many(packets)
+                PACKETS_CAPTURED.inc(len(packets))
+        proc.terminate()
+
     def stop_capture(self):
         self.running = False
+        # Terminating the process also unblocks a reader waiting on its output.
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+OVERFLOW_POLICIES = ("block", "drop_newest", "drop_oldest", "sample")
+
+
+class BoundedPacketQueue:
+    """Bounded packet buffer drained in micro-batches.
+
+    When full, producers follow ``overflow_policy``:
+      - "block": wait for room (a ``put`` timeout counts as a drop),
+      - "drop_newest": discard the incoming packet,
+      - "drop_oldest": evict the oldest queued packet,
+      - "sample": admit every ``sample_every``-th overflowing packet by evicting the oldest,
+        discard the rest.
+    ``put``/``get`` keep the ``queue.Queue`` interface for existing callers.
+    """
+    def __init__(self, capacity=65536, overflow_policy="block", sample_every=10):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow_policy!r}; expected one of {OVERFLOW_POLICIES}.")
+        self.capacity = capacity
+        self.overflow_policy = overflow_policy
+        self.sample_every = sample_every
+        self.items = deque()
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.not_full = threading.Condition(self.lock)
+        self.enqueued = 0
+        self.dequeued = 0
+        self.high_watermark = 0
+        self.overflow_count = 0
+        self.dropped = {"newest": 0, "oldest": 0, "sampled_out": 0, "timeout": 0}
+        self.batches = 0
+        self.batched_packets = 0
+        # Batch size histogram keyed by power-of-two upper bound (1, 2, 4, ...).
+        self.batch_sizes = {}
+
+    def put(self, packet, block=True, timeout=None):
+        """Enqueue one packet; returns False if it was dropped."""
+        with self.lock:
+            accepted = self._put_locked(packet, block, timeout)
+            if accepted:
+                self.not_empty.notify()
+            return accepted
+
+    def put_many(self, packets, block=True, timeout=None):
+        """Enqueue several packets under a single lock acquisition; returns how many were accepted."""
+        accepted = 0
+        with self.lock:
+            for packet in packets:
+                if self._put_locked(packet, block, timeout):
+                    accepted += 1
+            if accepted:
+                self.not_empty.notify_all()
+        return accepted
+
+    def _put_locked(self, packet, block, timeout):
+        items = self.items
+        if len(items) >= self.capacity:
+            self.overflow_count += 1
+            policy = self.overflow_policy
+            if policy == "block" and block:
+                # Wake consumers first: put_many may be holding packets they have not been told about.
+                self.not_empty.notify_all()
+                if not self.not_full.wait_for(lambda: len(items) < self.capacity, timeout):
+                    self.dropped["timeout"] += 1
+                    return False
+            elif policy == "drop_oldest" or (policy == "sample" and self.overflow_count % self.sample_every == 0):
+                items.popleft()
+                self.dropped["oldest"] += 1
+            elif policy == "sample":
+                self.dropped["sampled_out"] += 1
+                return False
+            else:
+                self.dropped["newest"] += 1
+                return False
+        items.append(packet)
+        self.enqueued += 1
+        if len(items) > self.high_watermark:
+            self.high_watermark = len(items)
+        return True
+
+    def get(self, block=True, timeout=None):
+        """Dequeue one packet, raising queue.Empty like queue.Queue.get."""
+        with self.lock:
+            if not self.items:
+                if not block or not self.not_empty.wait_for(lambda: self.items, timeout):
+                    raise queue.Empty
+            packet = self.items.popleft()
+            self.dequeued += 1
+            self.not_full.notify()
+            return packet
+
+    def get_batch(self, max_items=256, max_wait=0.005, timeout=None):
+        """Drain up to ``max_items`` packets.
+
+        Waits up to ``timeout`` for the first packet, then at most ``max_wait`` seconds
+        more for the batch to fill. Returns an empty list on timeout.
+        """
+        with self.lock:
+            items = self.items
+            if not items and not self.not_empty.wait_for(lambda: items, timeout):
+                return []
+            if len(items) < max_items and max_wait:
+                deadline = time.monotonic() + max_wait
+                while len(items) < max_items:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.not_empty.wait(remaining):
+                        break
+            count = min(max_items, len(items))
+            batch = [items.popleft() for _ in range(count)]
+            self.dequeued += count
+            self.batches += 1
+            self.batched_packets += count
+            bucket = 1 << (count - 1).bit_length()
+            self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+            self.not_full.notify_all()
+            return batch
+
+    def qsize(self):
+        return len(self.items)
+
+    def empty(self):
+        return not self.items
+
+    def stats(self):
+        with self.lock:
+            return {
+                "depth": len(self.items),
+                "capacity": self.capacity,
+                "overflow_policy": self.overflow_policy,
+                "high_watermark": self.high_watermark,
+                "enqueued": self.enqueued,
+                "dequeued": self.dequeued,
+                "dropped": dict(self.dropped),
+                "dropped_total": sum(self.dropped.values()),
+                "batches": self.batches,
+                "avg_batch_size": self.batched_packets / self.batches if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self.batch_sizes.items())),
+            }
+
 
 class PacketPipeline:
-    """A simple pipeline using a thread-safe queue to stream packets."""
-    def __init__(self):
-        self.queue = queue.Queue()
+    """A bounded pipeline that streams packets to batch-draining consumers."""
+    def __init__(self, capacity=65536, overflow_policy="block", batch_size=256, batch_timeout=0.005,
+                 sample_every=10):
+        self.queue = BoundedPacketQueue(capacity, overflow_policy, sample_every)
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        metrics.gauge("queue_depth", self.queue.qsize, "Packets waiting in the pipeline queue.")
+        metrics.gauge("queue_dropped", lambda: sum(self.queue.dropped.values()),
+                      "Packets dropped by the pipeline queue's overflow policy.")
 
     def get_queue(self):
-        return self.queue
\ No newline at end of file
+        return self.queue
+
+    def get_batch(self, timeout=None):
+        return self.queue.get_batch(self.batch_size, self.batch_timeout, timeout)
+
+    def stats(self):
+        return self.queue.stats()
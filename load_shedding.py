@@ -0,0 +1,156 @@
+import random
+import time
+
+from core.event_log import event_log
+from core.metrics import metrics
+
+
+NORMAL = 0
+FLOW_HEADS = 1
+SAMPLING = 2
+LEVEL_NAMES = {NORMAL: "normal", FLOW_HEADS: "flow_heads", SAMPLING: "sampling"}
+
+PACKETS_SHED = metrics.counter("packets_total", "Packets handled by each pipeline stage.", stage="shed")
+SHED_STEPS = metrics.counter("load_shed_steps_total", "Load shedding level or sample rate changes.")
+
+
+class LoadShedder:
+    """Overload controller between the packet queue and the ManagerAgent.
+
+    It watches the pipeline lag (capture time to dequeue of the oldest packet in each
+    batch) and degrades in steps when the lag stays above ``high_lag`` seconds:
+
+      1. "flow_heads": only the first ``flow_head`` packets of each flow (5-tuple) in the
+         current ``table_window`` reach the detector; the rest are shed.
+      2. "sampling": the first ``source_head`` packets of each source and protocol are
+         always kept; later ones are kept with probability ``sample_rate``. A kept packet
+         carries the number of packets of its source and protocol shed since the last
+         kept one as its weight, so the FlowTable packet counts stay exact. While the
+         lag stays high the rate halves each ``interval`` down to ``min_sample_rate``.
+
+    When the lag drops below ``low_lag`` the steps are undone in reverse order. Since a
+    source's first packets are never shed, a new attacker is evaluated on arrival
+    whatever the offered load; only sources already seen are sampled. Every step is
+    logged as "load.shed_step" and counted on /metrics.
+    """
+    def __init__(self, high_lag=0.5, low_lag=0.1, interval=1.0, flow_head=8, source_head=4, min_sample_rate=0.01,
+                 table_window=10.0, max_entries=1000000, seed=None):
+        self.high_lag = high_lag
+        self.low_lag = low_lag
+        self.interval = interval
+        self.flow_head = flow_head
+        self.source_head = source_head
+        self.min_sample_rate = min_sample_rate
+        self.table_window = table_window
+        self.max_entries = max_entries
+        self.rng = random.Random(seed)
+        self.level = NORMAL
+        self.sample_rate = 1.0
+        self.flows = {}
+        self.sources = {}
+        self.table_started = time.monotonic()
+        self.window_started = time.monotonic()
+        self.window_max_lag = 0.0
+        self.lag = 0.0
+        self.kept = 0
+        self.shed_count = 0
+        self.steps = 0
+        metrics.gauge("load_shed_level", lambda: self.level, "Current load shedding level (0 = off).")
+        metrics.gauge("load_shed_sample_rate", lambda: self.sample_rate, "Share of later packets per source and protocol kept.")
+
+    def observe(self, lag):
+        """Feed one lag measurement; escalates or relaxes at most once per ``interval``."""
+        self.lag = lag
+        if lag > self.window_max_lag:
+            self.window_max_lag = lag
+        now = time.monotonic()
+        if now - self.window_started < self.interval:
+            return
+        worst = self.window_max_lag
+        self.window_started = now
+        self.window_max_lag = 0.0
+        if worst > self.high_lag:
+            if self.level < SAMPLING:
+                self._step(self.level + 1, 0.5 if self.level == FLOW_HEADS else 1.0, worst)
+            elif self.sample_rate > self.min_sample_rate:
+                self._step(SAMPLING, max(self.sample_rate / 2, self.min_sample_rate), worst)
+        elif worst < self.low_lag and self.level != NORMAL:
+            if self.level == SAMPLING and self.sample_rate < 0.5:
+                self._step(SAMPLING, self.sample_rate * 2, worst)
+            else:
+                self._step(self.level - 1, 1.0, worst)
+
+    def _step(self, level, sample_rate, lag):
+        previous = LEVEL_NAMES[self.level]
+        self.level, self.sample_rate = level, sample_rate
+        self.steps += 1
+        SHED_STEPS.inc()
+        # Start counting flow and source heads afresh at every level change.
+        self._reset_tables(time.monotonic())
+        event_log.warning("load.shed_step", previous=previous, step=LEVEL_NAMES[level],
+                          sample_rate=round(sample_rate, 4), lag=round(lag, 3))
+
+    def _reset_tables(self, now):
+        self.flows.clear()
+        self.sources.clear()
+        self.table_started = now
+
+    def shed(self, packets, lag):
+        """Return (kept packets, weights) for a batch; weights is None when nothing is sampled."""
+        self.observe(lag)
+        level = self.level
+        if level == NORMAL:
+            self.kept += len(packets)
+            return packets, None
+        now = time.monotonic()
+        if now - self.table_started >= self.table_window or len(self.flows) + len(self.sources) > self.max_entries:
+            self._reset_tables(now)
+        kept = []
+        weights = None
+        if level == FLOW_HEADS:
+            flows = self.flows
+            flow_head = self.flow_head
+            for packet in packets:
+                data = packet.data
+                key = (packet.src_ip, packet.dst_ip, packet.protocol, data.get("src_port"), data.get("dst_port"))
+                seen = flows.get(key, 0)
+                if seen < flow_head:
+                    flows[key] = seen + 1
+                    kept.append(packet)
+        else:
+            sources = self.sources
+            source_head = self.source_head
+            rate = self.sample_rate
+            random_value = self.rng.random
+            weights = []
+            for packet in packets:
+                key = (packet.src_ip, packet.protocol)
+                counts = sources.get(key)
+                if counts is None:
+                    counts = sources[key] = [0, 0]
+                counts[0] += 1
+                if counts[0] <= source_head or random_value() < rate:
+                    # The kept packet also stands for the ones shed since the last kept one.
+                    kept.append(packet)
+                    weights.append(counts[1] + 1.0)
+                    counts[1] = 0
+                else:
+                    counts[1] += 1
+        shed = len(packets) - len(kept)
+        self.kept += len(kept)
+        self.shed_count += shed
+        if shed:
+            PACKETS_SHED.inc(shed)
+        return kept, weights
+
+    def stats(self):
+        return {
+            "level": LEVEL_NAMES[self.level],
+            "sample_rate": self.sample_rate,
+            "lag": round(self.lag, 3),
+            "kept": self.kept,
+            "shed": self.shed_count,
+            "steps": self.steps,
+            "tracked_flows": len(self.flows),
+            "tracked_sources": len(self.sources),
+        }
@@ -0,0 +1,49 @@
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+
+from agent_entities import model_agent_from_settings
+from async_runtime import AsyncRuntime, service_handler
+from core.config import settings
+from core.event_log import event_log
+from core.metrics import metrics
+from routers import firewall, metrics as metrics_router, root, stream
+
+
+metrics.enabled = settings.METRICS_ENABLED
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # The firewall service's owner task, and the capture when enabled, live on the server's event loop.
+    await firewall.service.start()
+    capture = None
+    if settings.CAPTURE_ENABLED:
+        # Captured packets are scored by the configured model over a FlowTable, like the tshark agent.
+        capture = AsyncRuntime(service_handler(firewall.service, model_agent_from_settings()),
+                               interface=settings.CAPTURE_INTERFACE,
+                               filter_expr=settings.CAPTURE_FILTER, capture_format=settings.CAPTURE_FORMAT,
+                               consumers=settings.CAPTURE_CONSUMERS, batch_size=settings.CAPTURE_BATCH_SIZE,
+                               queue_size=settings.CAPTURE_QUEUE_SIZE)
+        await capture.start()
+    yield
+    if capture is not None:
+        # Drain in-flight batches before the service's owner task stops.
+        await capture.stop(settings.CAPTURE_DRAIN_TIMEOUT)
+    await firewall.service.stop()
+    event_log.flush()
+
+
+app = FastAPI(title=settings.APP_NAME, version=settings.VERSION, debug=settings.DEBUG, lifespan=lifespan)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=settings.ALLOWED_ORIGINS,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+app.include_router(root.router)
+app.include_router(firewall.router)
+app.include_router(stream.router)
+app.include_router(metrics_router.router)
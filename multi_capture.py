@@ -0,0 +1,275 @@
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+
+from core.event_log import event_log
+from core.metrics import metrics
+from domain import Packet
+from infra import TSharkCapture
+
+
+def _interface_drops(interface):
+    # Kernel/NIC receive drops for the interface, where Linux exposes them.
+    try:
+        with open(f"/sys/class/net/{interface}/statistics/rx_dropped", "r") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+class _ChunkForwarder:
+    """Queue stand-in for TSharkCapture inside a worker: ships packets to the parent in chunks.
+
+    A chunk goes out when it is full or ``max_delay`` seconds old. ``start`` runs a timer
+    thread for the second case, since the capture only calls ``put`` when a packet
+    arrives and the tail of a burst would otherwise wait for the next one.
+    """
+    def __init__(self, name, out, chunk_size=256, max_delay=0.01):
+        self.name = name
+        self.out = out
+        self.chunk_size = chunk_size
+        self.max_delay = max_delay
+        self.chunk = []
+        self.last_flush = time.monotonic()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def start(self):
+        threading.Thread(target=self._flush_loop, name="chunk-flusher", daemon=True).start()
+
+    def stop(self):
+        self.stopping.set()
+        self.flush()
+
+    def _flush_loop(self):
+        while not self.stopping.wait(self.max_delay):
+            with self.lock:
+                if self.chunk and time.monotonic() - self.last_flush >= self.max_delay:
+                    self._flush_locked()
+
+    def put(self, packet, block=True, timeout=None):
+        with self.lock:
+            self.chunk.append(packet)
+            if len(self.chunk) >= self.chunk_size or time.monotonic() - self.last_flush >= self.max_delay:
+                self._flush_locked()
+        return True
+
+    def put_many(self, packets, block=True, timeout=None):
+        with self.lock:
+            self.chunk.extend(packets)
+            self._flush_locked()
+        return len(packets)
+
+    def flush(self):
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self.chunk:
+            self.out.put((self.name, [(p.src_ip, p.dst_ip, p.protocol, p.data, p.ts) for p in self.chunk]))
+            self.chunk = []
+        self.last_flush = time.monotonic()
+
+
+def _capture_worker(name, interface, filter_expr, cpu, out, capture_options):
+    """Worker process: one capture on one interface, pinned to ``cpu`` where supported."""
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {cpu})
+        except OSError:
+            pass
+    forwarder = _ChunkForwarder(name, out)
+    capture = TSharkCapture(interface=interface, filter_expr=filter_expr, queue_obj=forwarder, **capture_options)
+    # Stopping the worker stops its capture process too, instead of orphaning it.
+    signal.signal(signal.SIGTERM, lambda signum, frame: capture.stop_capture())
+    forwarder.start()
+    try:
+        capture.start_capture()
+    finally:
+        forwarder.stop()
+
+
+class MultiInterfaceCapture:
+    """One capture worker process per interface, merged into one pipeline in timestamp order.
+
+    ``interfaces`` lists interface names, or (name, interface, filter) tuples to run several
+    workers on one NIC, e.g. one per RSS queue with disjoint filters
+    (``("eth0-q0", "eth0", "ip and src net 0.0.0.0/1")``). Worker ``i`` is pinned to CPU
+    ``cpus[i]`` (default: ``i`` modulo the CPU count).
+
+    Workers send packets in chunks over a multiprocessing queue. A merge thread keeps them
+    in a heap by capture timestamp and releases a packet once it is ``reorder_window``
+    seconds old, or when more than ``max_buffered`` packets are held, so the output is in
+    timestamp order across interfaces except for packets that arrive later than the
+    window; those are released at once and counted as "late". Use the "pcap" capture
+    format (the default) for kernel capture timestamps.
+
+    A worker that exits while the supervisor runs is restarted after a backoff that
+    doubles up to ``max_backoff`` seconds. ``stats()`` reports per interface the packet
+    rate, packets forwarded, late packets, pipeline rejects, kernel receive drops and
+    restarts.
+    """
+    def __init__(self, interfaces, queue_obj, filter_expr="ip", reorder_window=0.05, max_buffered=100000,
+                 cpus=None, capture_format="pcap", capture_tool="dumpcap", check_interval=0.5, max_backoff=30.0):
+        self.specs = []
+        for spec in interfaces:
+            if isinstance(spec, str):
+                spec = (spec, spec, filter_expr)
+            self.specs.append(spec)
+        self.queue = queue_obj
+        self.reorder_window = reorder_window
+        self.max_buffered = max_buffered
+        cpu_count = os.cpu_count() or 1
+        self.cpus = list(cpus) if cpus is not None else [i % cpu_count for i in range(len(self.specs))]
+        self.capture_options = {"capture_format": capture_format, "capture_tool": capture_tool}
+        self.check_interval = check_interval
+        self.max_backoff = max_backoff
+        self.context = multiprocessing.get_context("spawn")
+        self.inbox = None
+        self.workers = {}
+        self.heap = []
+        self.order = itertools.count()
+        self.last_released = 0.0
+        self.stopping = threading.Event()
+        self.merger = None
+        self.started_at = None
+        self.stats_by_name = {}
+
+    def _start_worker(self, index):
+        name, interface, filter_expr = self.specs[index]
+        process = self.context.Process(
+            target=_capture_worker,
+            args=(name, interface, filter_expr, self.cpus[index], self.inbox, self.capture_options),
+            name=f"capture-{name}",
+            daemon=True
+        )
+        process.start()
+        worker = self.workers.setdefault(name, {"index": index, "restarts": 0, "backoff": 1.0})
+        worker.update(process=process, started=time.monotonic())
+
+    def start(self):
+        self.inbox = self.context.Queue()
+        self.started_at = time.monotonic()
+        for index, (name, interface, _) in enumerate(self.specs):
+            self.stats_by_name[name] = {
+                "interface": interface,
+                "packets": 0,
+                "late": 0,
+                "rejected": 0,
+                "rx_dropped_start": _interface_drops(interface),
+                "rate_window": (time.monotonic(), 0),
+                "packets_per_s": 0.0,
+            }
+            self._start_worker(index)
+        self.merger = threading.Thread(target=self._merge, name="capture-merge", daemon=True)
+        self.merger.start()
+
+    def run(self):
+        """Start the workers and supervise them until ``stop``."""
+        self.start()
+        while not self.stopping.wait(self.check_interval):
+            self.supervise()
+
+    def supervise(self):
+        """Restart workers that exited, with exponential backoff; update the rates."""
+        now = time.monotonic()
+        for name, worker in self.workers.items():
+            process = worker["process"]
+            if process.is_alive() or self.stopping.is_set():
+                continue
+            if "died" not in worker:
+                worker["died"] = now
+                event_log.warning("capture.worker_exited", worker=name, exitcode=process.exitcode)
+            if now - worker["died"] < worker["backoff"]:
+                continue
+            # Reset the backoff for a worker that had stayed up for a while.
+            uptime = worker["died"] - worker["started"]
+            worker["backoff"] = 1.0 if uptime > 60 else min(worker["backoff"] * 2, self.max_backoff)
+            del worker["died"]
+            worker["restarts"] += 1
+            metrics.counter("capture_worker_restarts_total", "Capture worker processes restarted.",
+                            worker=name).inc()
+            self._start_worker(worker["index"])
+        for stats in self.stats_by_name.values():
+            since, count = stats["rate_window"]
+            if now - since >= 1.0:
+                stats["packets_per_s"] = (stats["packets"] - count) / (now - since)
+                stats["rate_window"] = (now, stats["packets"])
+
+    def _merge(self):
+        heap = self.heap
+        while True:
+            try:
+                name, rows = self.inbox.get(timeout=self.reorder_window / 2)
+            except queue.Empty:
+                rows = None
+            except (EOFError, OSError):
+                break
+            if rows is None and not heap and self.stopping.is_set():
+                break
+            if rows:
+                stats = self.stats_by_name[name]
+                stats["packets"] += len(rows)
+                metrics.counter("capture_packets_total", "Packets received from each capture worker.",
+                                worker=name).inc(len(rows))
+                late = []
+                for row in rows:
+                    if row[4] < self.last_released:
+                        late.append(row)
+                    else:
+                        heapq.heappush(heap, (row[4], next(self.order), name, row))
+                if late:
+                    stats["late"] += len(late)
+                    self._emit([(name, row) for row in late])
+            horizon = time.time() - self.reorder_window
+            ready = []
+            while heap and (heap[0][0] <= horizon or len(heap) > self.max_buffered or self.stopping.is_set()):
+                ts, _, name, row = heapq.heappop(heap)
+                ready.append((name, row))
+                self.last_released = ts
+            if ready:
+                self._emit(ready)
+
+    def _emit(self, rows):
+        packets = [Packet(src_ip, dst_ip, protocol, data, ts=ts) for _, (src_ip, dst_ip, protocol, data, ts) in rows]
+        accepted = self.queue.put_many(packets)
+        if accepted < len(packets):
+            # Attribute the pipeline's rejects to the interfaces of the rejected tail.
+            for name, _ in rows[accepted:]:
+                self.stats_by_name[name]["rejected"] += 1
+
+    def stop(self):
+        self.stopping.set()
+        for worker in self.workers.values():
+            process = worker["process"]
+            if process.is_alive():
+                process.terminate()
+        for worker in self.workers.values():
+            worker["process"].join(timeout=5)
+        if self.merger is not None:
+            self.merger.join(timeout=5)
+
+    def stats(self):
+        result = {}
+        for name, stats in self.stats_by_name.items():
+            worker = self.workers.get(name, {})
+            dropped = None
+            rx_dropped = _interface_drops(stats["interface"])
+            if rx_dropped is not None and stats["rx_dropped_start"] is not None:
+                dropped = rx_dropped - stats["rx_dropped_start"]
+            result[name] = {
+                "interface": stats["interface"],
+                "alive": bool(worker) and worker["process"].is_alive(),
+                "packets": stats["packets"],
+                "packets_per_s": round(stats["packets_per_s"], 1),
+                "late": stats["late"],
+                "rejected": stats["rejected"],
+                "rx_dropped": dropped,
+                "restarts": worker.get("restarts", 0),
+            }
+        return {"interfaces": result, "buffered": len(self.heap), "reorder_window": self.reorder_window}
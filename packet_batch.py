@@ -0,0 +1,228 @@
+import socket
+import struct
+
+import numpy as np
+
+from domain import Packet
+from pcap_decoder import PROTOCOL_NAMES, decode_headers
+
+
+# One row per packet. Addresses are 128-bit integers split into two uint64 halves,
+# with IPv4 stored IPv4-mapped (::ffff:a.b.c.d) so both families share one column.
+PACKET_DTYPE = np.dtype([
+    ("src_hi", "<u8"),
+    ("src_lo", "<u8"),
+    ("dst_hi", "<u8"),
+    ("dst_lo", "<u8"),
+    ("ts", "<f8"),
+    ("length", "<u4"),
+    ("protocol", "<u2"),
+    ("src_port", "<u2"),
+    ("dst_port", "<u2"),
+    ("tcp_flags", "u1"),
+    ("ip_version", "u1"),
+])
+
+IPV4_MAPPED = 0xFFFF00000000
+_U32 = struct.Struct("!I")
+_U64_PAIR = struct.Struct("!QQ")
+
+
+class ProtocolTable:
+    """Maps protocol names to the integer ids stored in ``PacketBatch`` rows.
+
+    Names with an IP protocol number use that number; other names (e.g. tshark's
+    "HTTP" or "DNS" column values) get ids from 256 upwards in first-seen order.
+    """
+    def __init__(self):
+        self.names = dict(PROTOCOL_NAMES)
+        self.ids = {name: number for number, name in PROTOCOL_NAMES.items()}
+        self.dynamic = []
+
+    def id_for(self, name):
+        protocol_id = self.ids.get(name)
+        if protocol_id is None:
+            name = str(name)
+            protocol_id = self.ids.get(name)
+            if protocol_id is not None:
+                return protocol_id
+            if name.isdigit() and int(name) < 256:
+                # A bare number names its protocol; keep the known name for display.
+                protocol_id = int(name)
+                self.ids[name] = protocol_id
+                self.names.setdefault(protocol_id, name)
+            else:
+                protocol_id = 256 + len(self.dynamic)
+                self.dynamic.append(name)
+                self.register(protocol_id, name)
+        return protocol_id
+
+    def name_for(self, protocol_id):
+        name = self.names.get(protocol_id)
+        return name if name is not None else str(protocol_id)
+
+    def register(self, protocol_id, name):
+        self.ids[name] = protocol_id
+        self.names[protocol_id] = name
+        if protocol_id >= 256 and protocol_id - 256 == len(self.dynamic):
+            self.dynamic.append(name)
+
+
+PROTOCOLS = ProtocolTable()
+
+
+def ip_to_int(ip):
+    """Return (hi, lo, version) for an IP string; IPv4 is IPv4-mapped."""
+    if not ip:
+        return 0, 0, 4
+    if ":" in ip:
+        hi, lo = _U64_PAIR.unpack(socket.inet_pton(socket.AF_INET6, ip))
+        return hi, lo, 6
+    return 0, IPV4_MAPPED | _U32.unpack(socket.inet_aton(ip))[0], 4
+
+
+def int_to_ip(hi, lo, version):
+    if not hi and not lo:
+        return ""
+    if version == 4:
+        return socket.inet_ntop(socket.AF_INET, _U32.pack(lo & 0xFFFFFFFF))
+    return socket.inet_ntop(socket.AF_INET6, _U64_PAIR.pack(hi, lo))
+
+
+class PacketBatch:
+    """Columnar batch of packets in a preallocated NumPy structured array.
+
+    Rows ``[0, size)`` are valid. ``packet(i)`` returns a ``domain.Packet`` view of one row
+    for the single-packet code paths. Packets whose addresses, protocol or length cannot be
+    parsed (e.g. tshark's comma-joined addresses for ICMP errors and tunnels) get no row;
+    ``rejected`` lists their positions in the last ``extend`` call.
+    """
+    def __init__(self, capacity=1024, array=None, size=0, protocols=PROTOCOLS):
+        self.array = np.zeros(capacity, PACKET_DTYPE) if array is None else array
+        self.size = size
+        self.protocols = protocols
+        self.rejected = []
+
+    @classmethod
+    def from_buffer(cls, buffer, capacity, offset=0, size=0):
+        """Wrap an existing buffer (e.g. shared memory) without copying it."""
+        return cls(array=np.ndarray((capacity,), PACKET_DTYPE, buffer=buffer, offset=offset), size=size)
+
+    @classmethod
+    def from_packets(cls, packets):
+        """Batch holding ``packets``; the positions of unparsable ones are in ``rejected``."""
+        packets = list(packets)
+        batch = cls(max(len(packets), 1))
+        batch.extend(packets)
+        return batch
+
+    @property
+    def capacity(self):
+        return len(self.array)
+
+    @property
+    def columns(self):
+        return self.array[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.packet(i)
+
+    def is_full(self):
+        return self.size >= len(self.array)
+
+    def clear(self):
+        self.size = 0
+
+    def append(self, src_ip, dst_ip, protocol, length, ts, src_port=None, dst_port=None, tcp_flags=None):
+        src_hi, src_lo, version = ip_to_int(src_ip)
+        dst_hi, dst_lo, _ = ip_to_int(dst_ip)
+        self.array[self.size] = (src_hi, src_lo, dst_hi, dst_lo, ts, int(length), self.protocols.id_for(protocol),
+                                 src_port or 0, dst_port or 0, tcp_flags or 0, version)
+        self.size += 1
+
+    def append_packet(self, packet):
+        data = packet.data
+        self.append(packet.src_ip, packet.dst_ip, packet.protocol, data.get("length", 0), packet.ts,
+                    data.get("src_port"), data.get("dst_port"), data.get("tcp_flags"))
+
+    def extend(self, packets):
+        """Append as many packets as fit, filling whole columns at once; returns the count appended.
+
+        Unparsable packets are skipped and listed in ``rejected``.
+        """
+        packets = packets[:len(self.array) - self.size]
+        self.rejected = []
+        if not packets:
+            return 0
+        rows = []
+        id_for = self.protocols.id_for
+        for i, packet in enumerate(packets):
+            data = packet.data
+            try:
+                src_hi, src_lo, version = ip_to_int(packet.src_ip)
+                dst_hi, dst_lo, _ = ip_to_int(packet.dst_ip)
+                rows.append((src_hi, src_lo, dst_hi, dst_lo, packet.ts, int(data.get("length", 0)),
+                             id_for(packet.protocol), data.get("src_port") or 0, data.get("dst_port") or 0,
+                             data.get("tcp_flags") or 0, version))
+            except (OSError, ValueError, TypeError):
+                self.rejected.append(i)
+        if not rows:
+            return 0
+        end = self.size + len(rows)
+        self.array[self.size:end] = np.array(rows, dtype=PACKET_DTYPE)
+        self.size = end
+        return len(rows)
+
+    def append_frame(self, ts, linktype, frame, wire_len):
+        """Decode a captured frame straight into the next row, without building address strings."""
+        headers = decode_headers(linktype, frame)
+        if headers is None:
+            return False
+        version, address, proto, src_port, dst_port, tcp_flags = headers
+        if version == 4:
+            src_hi, src_lo = 0, IPV4_MAPPED | _U32.unpack_from(frame, address)[0]
+            dst_hi, dst_lo = 0, IPV4_MAPPED | _U32.unpack_from(frame, address + 4)[0]
+        else:
+            src_hi, src_lo = _U64_PAIR.unpack_from(frame, address)
+            dst_hi, dst_lo = _U64_PAIR.unpack_from(frame, address + 16)
+        self.array[self.size] = (src_hi, src_lo, dst_hi, dst_lo, ts, wire_len, proto,
+                                 src_port or 0, dst_port or 0, tcp_flags or 0, version)
+        self.size += 1
+        return True
+
+    def packet(self, i):
+        row = self.array[i]
+        version = int(row["ip_version"])
+        src_port = int(row["src_port"])
+        dst_port = int(row["dst_port"])
+        tcp_flags = int(row["tcp_flags"])
+        data = {
+            "length": int(row["length"]),
+            "src_port": src_port or None,
+            "dst_port": dst_port or None,
+            "tcp_flags": tcp_flags if row["protocol"] == 6 else None,
+        }
+        return Packet(int_to_ip(int(row["src_hi"]), int(row["src_lo"]), version),
+                      int_to_ip(int(row["dst_hi"]), int(row["dst_lo"]), version),
+                      self.protocols.name_for(int(row["protocol"])), data, ts=float(row["ts"]))
+
+    def take(self, indices):
+        """Copy the given rows into a new batch."""
+        rows = self.columns[indices]
+        return PacketBatch(array=rows, size=len(rows), protocols=self.protocols)
+
+    def src_ips(self):
+        return self._ips("src")
+
+    def dst_ips(self):
+        return self._ips("dst")
+
+    def _ips(self, prefix):
+        columns = self.columns
+        return [int_to_ip(hi, lo, version) for hi, lo, version in
+                zip(columns[prefix + "_hi"].tolist(), columns[prefix + "_lo"].tolist(),
+                    columns["ip_version"].tolist())]
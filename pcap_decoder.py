@@ -0,0 +1,313 @@
+import socket
+import struct
+
+from domain import Packet
+
+
+# Link-layer types we know how to strip (see pcap-linktype(7)).
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+LINKTYPE_LINUX_SLL2 = 276
+
+PROTOCOL_NAMES = {
+    1: "ICMP",
+    2: "IGMP",
+    6: "TCP",
+    17: "UDP",
+    47: "GRE",
+    50: "ESP",
+    58: "ICMPv6",
+    132: "SCTP",
+}
+
+# IPv6 extension headers that may sit between the fixed header and the payload.
+IPV6_EXTENSION_HEADERS = {0, 43, 44, 51, 60}
+
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_SPB = 0x00000003
+PCAPNG_ISB = 0x00000005
+PCAPNG_EPB = 0x00000006
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+_U16 = struct.Struct("!H")
+_U16_PAIR = struct.Struct("!HH")
+
+
+def _ethertype_offset(linktype, frame):
+    """Return (ethertype, offset of the network header) for a link-layer frame."""
+    if linktype == LINKTYPE_ETHERNET:
+        if len(frame) < 14:
+            return None, 0
+        ethertype = _U16.unpack_from(frame, 12)[0]
+        offset = 14
+        # Skip 802.1Q / 802.1ad VLAN tags.
+        while ethertype in (0x8100, 0x88A8, 0x9100) and len(frame) >= offset + 4:
+            ethertype = _U16.unpack_from(frame, offset + 2)[0]
+            offset += 4
+        return ethertype, offset
+    if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+        if not len(frame):
+            return None, 0
+        version = frame[0] >> 4
+        return (0x0800 if version == 4 else 0x86DD if version == 6 else None), 0
+    if linktype == LINKTYPE_LINUX_SLL:
+        if len(frame) < 16:
+            return None, 0
+        return _U16.unpack_from(frame, 14)[0], 16
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if len(frame) < 20:
+            return None, 0
+        return _U16.unpack_from(frame, 0)[0], 20
+    if linktype == LINKTYPE_NULL:
+        if len(frame) < 4:
+            return None, 0
+        family = frame[0] or frame[3]
+        return (0x0800 if family == socket.AF_INET else 0x86DD), 4
+    return None, 0
+
+
+def decode_headers(linktype, frame):
+    """Walk the IP and transport headers of a single frame without copying it.
+
+    ``frame`` is a memoryview over the captured bytes; headers are read in place with
+    ``struct.unpack_from``. Returns (ip_version, address offset, ip protocol, src_port,
+    dst_port, tcp_flags) or None for non-IP frames. The destination address follows the
+    source at ``address offset + 4`` (IPv4) or ``+ 16`` (IPv6).
+    """
+    ethertype, offset = _ethertype_offset(linktype, frame)
+    if ethertype == 0x0800:
+        if len(frame) < offset + 20:
+            return None
+        ihl = (frame[offset] & 0x0F) * 4
+        proto = frame[offset + 9]
+        version, address = 4, offset + 12
+        # Only the first fragment carries the transport header.
+        if _U16.unpack_from(frame, offset + 6)[0] & 0x1FFF:
+            return version, address, proto, None, None, None
+        offset += ihl
+    elif ethertype == 0x86DD:
+        if len(frame) < offset + 40:
+            return None
+        proto = frame[offset + 6]
+        version, address = 6, offset + 8
+        offset += 40
+        while proto in IPV6_EXTENSION_HEADERS and len(frame) >= offset + 8:
+            next_proto = frame[offset]
+            if proto == 44:
+                # Non-first fragments carry no transport header.
+                if _U16.unpack_from(frame, offset + 2)[0] & 0xFFF8:
+                    return version, address, next_proto, None, None, None
+                offset += 8
+            elif proto == 51:
+                offset += (frame[offset + 1] + 2) * 4
+            else:
+                offset += (frame[offset + 1] + 1) * 8
+            proto = next_proto
+    else:
+        return None
+
+    src_port = dst_port = tcp_flags = None
+    if proto in (6, 17, 132) and len(frame) >= offset + 4:
+        src_port, dst_port = _U16_PAIR.unpack_from(frame, offset)
+        if proto == 6 and len(frame) >= offset + 14:
+            tcp_flags = frame[offset + 13]
+    return version, address, proto, src_port, dst_port, tcp_flags
+
+
+def decode_frame(linktype, frame):
+    """Decode a frame into (src_ip, dst_ip, protocol, src_port, dst_port, tcp_flags) or None."""
+    headers = decode_headers(linktype, frame)
+    if headers is None:
+        return None
+    version, address, proto, src_port, dst_port, tcp_flags = headers
+    if version == 4:
+        src_ip = socket.inet_ntop(socket.AF_INET, frame[address:address + 4])
+        dst_ip = socket.inet_ntop(socket.AF_INET, frame[address + 4:address + 8])
+    else:
+        src_ip = socket.inet_ntop(socket.AF_INET6, frame[address:address + 16])
+        dst_ip = socket.inet_ntop(socket.AF_INET6, frame[address + 16:address + 32])
+    return src_ip, dst_ip, PROTOCOL_NAMES.get(proto, str(proto)), src_port, dst_port, tcp_flags
+
+
+class CaptureDecoder:
+    """Incrementally decodes a pcap or pcapng byte stream.
+
+    Chunks of any size can be fed in; records split across chunk boundaries are kept
+    until the rest of their bytes arrive.
+    """
+    def __init__(self):
+        self.format = None
+        self.endian = "<"
+        self.linktype = LINKTYPE_ETHERNET
+        self.ts_scale = 1e-6
+        # pcapng: (linktype, timestamp scale) per interface id, in IDB order.
+        self.interfaces = []
+        # pcapng: interface id -> (ifrecv, ifdrop) from the last statistics block.
+        self.interface_stats = {}
+        self.buffer = bytearray()
+
+    def feed(self, chunk):
+        """Append raw capture bytes and return the Packets they completed."""
+        self.buffer += chunk
+        packets = []
+        with memoryview(self.buffer) as view:
+            consumed = 0
+            for consumed, ts, linktype, frame, wire_len in self.iter_records(view):
+                if frame is None:
+                    continue
+                packet = self.build_packet(ts, linktype, frame, wire_len)
+                if packet is not None:
+                    packets.append(packet)
+                frame.release()
+        if consumed:
+            del self.buffer[:consumed]
+        return packets
+
+    def feed_into(self, chunk, batch):
+        """Append raw capture bytes and decode complete records straight into ``batch``.
+
+        Decoding stops when the batch is full; the remaining records stay buffered and are
+        decoded by the next call (pass ``b""`` to continue without new data).
+        Returns the number of rows appended.
+        """
+        self.buffer += chunk
+        appended = 0
+        consumed = 0
+        with memoryview(self.buffer) as view:
+            for end, ts, linktype, frame, wire_len in self.iter_records(view):
+                if frame is not None:
+                    if batch.is_full():
+                        frame.release()
+                        break
+                    if batch.append_frame(ts, linktype, frame, wire_len):
+                        appended += 1
+                    frame.release()
+                consumed = end
+        if consumed:
+            del self.buffer[:consumed]
+        return appended
+
+    def iter_records(self, view, offset=0):
+        """Yield (end offset, epoch seconds, linktype, frame view, wire length) for each
+        complete record in ``view``, stopping at the first truncated one.
+        Blocks that carry no packet are yielded with a frame of None.
+        """
+        if self.format is None:
+            if len(view) < 4:
+                return
+            offset = self._read_file_header(view, offset)
+            if offset is None:
+                return
+            yield offset, None, None, None, 0
+        if self.format == "pcap":
+            yield from self._iter_pcap(view, offset)
+        else:
+            yield from self._iter_pcapng(view, offset)
+
+    def build_packet(self, ts, linktype, frame, wire_len):
+        decoded = decode_frame(linktype, frame)
+        if decoded is None:
+            return None
+        src_ip, dst_ip, protocol, src_port, dst_port, tcp_flags = decoded
+        data = {"length": wire_len, "src_port": src_port, "dst_port": dst_port, "tcp_flags": tcp_flags}
+        return Packet(src_ip, dst_ip, protocol, data, ts=ts)
+
+    def _read_file_header(self, view, offset):
+        magic_le = struct.unpack_from("<I", view, offset)[0]
+        if magic_le == PCAPNG_SHB:
+            # The section header block is parsed like any other block.
+            self.format = "pcapng"
+            return offset
+        if len(view) < offset + 24:
+            return None
+        for endian in ("<", ">"):
+            magic = struct.unpack_from(endian + "I", view, offset)[0]
+            if magic in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                self.format = "pcap"
+                self.endian = endian
+                self.ts_scale = 1e-9 if magic == PCAP_MAGIC_NSEC else 1e-6
+                self.linktype = struct.unpack_from(endian + "I", view, offset + 20)[0] & 0x0FFFFFFF
+                return offset + 24
+        raise ValueError("Not a pcap or pcapng stream (magic 0x%08x)." % magic_le)
+
+    def _iter_pcap(self, view, offset):
+        record = struct.Struct(self.endian + "IIII")
+        end = len(view)
+        linktype, ts_scale = self.linktype, self.ts_scale
+        while offset + 16 <= end:
+            ts_sec, ts_frac, incl_len, orig_len = record.unpack_from(view, offset)
+            start = offset + 16
+            if start + incl_len > end:
+                return
+            offset = start + incl_len
+            yield offset, ts_sec + ts_frac * ts_scale, linktype, view[start:offset], orig_len
+
+    def _iter_pcapng(self, view, offset):
+        end = len(view)
+        while offset + 12 <= end:
+            block_type = struct.unpack_from(self.endian + "I", view, offset)[0]
+            if block_type == PCAPNG_SHB:
+                # Byte order can change per section, so read it before the block length.
+                bom = struct.unpack_from("<I", view, offset + 8)[0]
+                self.endian = "<" if bom == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                self.interfaces = []
+            block_len = struct.unpack_from(self.endian + "I", view, offset + 4)[0]
+            if block_len < 12:
+                raise ValueError("Corrupt pcapng block length %d." % block_len)
+            if offset + block_len > end:
+                return
+            body = offset + 8
+            next_offset = offset + block_len
+            if block_type == PCAPNG_EPB:
+                if_id, ts_high, ts_low, incl_len, orig_len = struct.unpack_from(self.endian + "IIIII", view, body)
+                linktype, ts_scale = self.interfaces[if_id]
+                start = body + 20
+                yield (next_offset, ((ts_high << 32) | ts_low) * ts_scale, linktype,
+                       view[start:start + incl_len], orig_len)
+            elif block_type == PCAPNG_SPB:
+                orig_len = struct.unpack_from(self.endian + "I", view, body)[0]
+                linktype, _ = self.interfaces[0]
+                incl_len = min(orig_len, block_len - 16)
+                yield next_offset, 0.0, linktype, view[body + 4:body + 4 + incl_len], orig_len
+            elif block_type == PCAPNG_IDB:
+                linktype = struct.unpack_from(self.endian + "H", view, body)[0]
+                self.interfaces.append((linktype, self._if_tsresol(view, body + 8, next_offset - 4)))
+                yield next_offset, None, None, None, 0
+            elif block_type == PCAPNG_ISB:
+                self._read_isb(view, body, next_offset - 4)
+                yield next_offset, None, None, None, 0
+            else:
+                yield next_offset, None, None, None, 0
+            offset = next_offset
+
+    def _iter_options(self, view, offset, end):
+        while offset + 4 <= end:
+            code, length = struct.unpack_from(self.endian + "HH", view, offset)
+            if code == 0:
+                return
+            yield code, view[offset + 4:offset + 4 + length]
+            offset += 4 + ((length + 3) & ~3)
+
+    def _if_tsresol(self, view, offset, end):
+        for code, value in self._iter_options(view, offset, end):
+            if code == 9 and len(value):
+                resol = value[0]
+                return 2.0 ** -(resol & 0x7F) if resol & 0x80 else 10.0 ** -resol
+        return 1e-6
+
+    def _read_isb(self, view, offset, end):
+        if_id = struct.unpack_from(self.endian + "I", view, offset)[0]
+        received, dropped = self.interface_stats.get(if_id, (None, None))
+        for code, value in self._iter_options(view, offset + 12, end):
+            if code == 4 and len(value) >= 8:
+                received = struct.unpack_from(self.endian + "Q", value)[0]
+            elif code == 5 and len(value) >= 8:
+                dropped = struct.unpack_from(self.endian + "Q", value)[0]
+        self.interface_stats[if_id] = (received, dropped)
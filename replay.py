@@ -0,0 +1,153 @@
+import argparse
+import mmap
+import threading
+import time
+
+from pcap_decoder import CaptureDecoder
+
+
+# Packet data key carrying the replay sequence number from enqueue to decision.
+REPLAY_SEQ = "replay_seq"
+
+
+class PcapReplay:
+    """Replays a pcap/pcapng file into a PacketPipeline.
+
+    The file is memory-mapped and decoded in place, so multi-GB captures are never read
+    into memory. ``speed=None`` replays as fast as possible; otherwise packets are
+    released at their recorded inter-arrival times divided by ``speed``.
+    """
+    def __init__(self, filepath, pipeline, speed=None):
+        self.filepath = filepath
+        self.pipeline = pipeline
+        self.speed = speed
+        self.sent_at = {}
+        self.latencies = []
+        self.done = threading.Event()
+
+    def run(self, manager_agent=None, consumers=1):
+        """Replay the whole file and return throughput/latency statistics.
+
+        When ``manager_agent`` is given, consumer threads drain the pipeline through
+        ``process_packet`` and end-to-end latency (enqueue -> decision) is measured.
+        Without one, a single thread drains and discards the packets, so a blocking
+        pipeline cannot fill up and stall the replay.
+        """
+        queue_obj = self.pipeline.get_queue()
+        threads = []
+        if manager_agent is not None:
+            for _ in range(consumers):
+                thread = threading.Thread(target=self._consume, args=(queue_obj, manager_agent), daemon=True)
+                thread.start()
+                threads.append(thread)
+        else:
+            thread = threading.Thread(target=self._drain, args=(queue_obj,), daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        started = time.perf_counter()
+        sent = self._produce(queue_obj, track_latency=manager_agent is not None)
+        produced = time.perf_counter()
+        self.done.set()
+        for thread in threads:
+            thread.join()
+        finished = time.perf_counter()
+
+        stats = self._stats(sent, started, produced, finished)
+        print(f"PcapReplay: {stats['packets']} packets in {stats['duration_s']:.3f}s "
+              f"({stats['packets_per_s']:.0f} packets/s)")
+        if stats["latency_ms"]:
+            latency = stats["latency_ms"]
+            print(f"PcapReplay: end-to-end latency p50={latency['p50']:.3f}ms "
+                  f"p99={latency['p99']:.3f}ms max={latency['max']:.3f}ms")
+        return stats
+
+    def _produce(self, queue_obj, track_latency):
+        decoder = CaptureDecoder()
+        sent = 0
+        seq = 0
+        first_ts = None
+        clock_start = None
+        with open(self.filepath, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mapped) as view:
+                for _, ts, linktype, frame, wire_len in decoder.iter_records(view):
+                    if frame is None:
+                        continue
+                    packet = decoder.build_packet(ts, linktype, frame, wire_len)
+                    frame.release()
+                    if packet is None:
+                        continue
+                    if self.speed:
+                        if first_ts is None:
+                            first_ts, clock_start = ts, time.perf_counter()
+                        delay = (ts - first_ts) / self.speed - (time.perf_counter() - clock_start)
+                        if delay > 0.001:
+                            time.sleep(delay)
+                    if track_latency:
+                        # Keyed by sequence number: an id() can be reused once a packet is freed.
+                        seq += 1
+                        packet.data[REPLAY_SEQ] = seq
+                        self.sent_at[seq] = time.perf_counter()
+                    if queue_obj.put(packet):
+                        sent += 1
+                    elif track_latency:
+                        self.sent_at.pop(seq, None)
+        return sent
+
+    def _consume(self, queue_obj, manager_agent):
+        while not (self.done.is_set() and queue_obj.empty()):
+            for packet in self.pipeline.get_batch(timeout=0.1):
+                seq = packet.data.pop(REPLAY_SEQ, None)
+                manager_agent.process_packet(packet)
+                sent_at = self.sent_at.pop(seq, None)
+                if sent_at is not None:
+                    self.latencies.append(time.perf_counter() - sent_at)
+
+    def _drain(self, queue_obj):
+        while not (self.done.is_set() and queue_obj.empty()):
+            self.pipeline.get_batch(timeout=0.1)
+
+    def _stats(self, sent, started, produced, finished):
+        duration = finished - started
+        stats = {
+            "file": self.filepath,
+            "speed": self.speed,
+            "packets": sent,
+            "duration_s": duration,
+            "produce_s": produced - started,
+            "packets_per_s": sent / duration if duration > 0 else 0.0,
+            "latency_ms": None,
+            "pipeline": self.pipeline.stats(),
+        }
+        if self.latencies:
+            latencies = sorted(self.latencies)
+            last = len(latencies) - 1
+            stats["latency_ms"] = {
+                "p50": latencies[int(last * 0.50)] * 1000,
+                "p99": latencies[int(last * 0.99)] * 1000,
+                "max": latencies[-1] * 1000,
+            }
+        return stats
+
+
+if __name__ == '__main__':
+    from agent_entities import FirewallAgent, ManagerAgent, ModelAgent
+    from infra import FirewallRepository, PacketPipeline
+    from use_case import ThreatDetector
+
+    parser = argparse.ArgumentParser(description="Replay a pcap/pcapng capture through the detection pipeline.")
+    parser.add_argument("capture", help="Path to a .pcap or .pcapng file")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="Replay at recorded timing divided by this factor (default: as fast as possible)")
+    parser.add_argument("--consumers", type=int, default=1)
+    parser.add_argument("--state-file", default="firewall_state.json")
+    parser.add_argument("--no-detect", action="store_true", help="Only feed the pipeline, skip ManagerAgent")
+    args = parser.parse_args()
+
+    replay_pipeline = PacketPipeline()
+    agent = None
+    if not args.no_detect:
+        agent = ManagerAgent(ModelAgent(ThreatDetector()), FirewallAgent(FirewallRepository(args.state_file)))
+    PcapReplay(args.capture, replay_pipeline, speed=args.speed).run(agent, consumers=args.consumers)
@@ -0,0 +1,50 @@
+HOUR = 3600.0
+DAY = 24 * HOUR
+
+# Base block duration per threat type, before the confidence factor and escalation.
+DEFAULT_BLOCK_TTLS = {
+    "TCP SYN Flood Attack": HOUR,
+    "Excessive ICMP Requests (Ping Flood)": HOUR,
+    "Slowloris DoS Attack": 6 * HOUR,
+    "Suspicious SSH Brute Force": DAY,
+    "SQL Injection Attempt": DAY,
+    "Outbound Data Exfiltration (Beaconing)": 7 * DAY,
+    # Reputation lists refresh hourly; a source still listed is blocked again on its next packet.
+    "Known Malicious Source (Threat Intel)": HOUR,
+}
+CONFIDENCE_FACTORS = {"High": 1.0, "Medium": 0.5, "Low": 0.25}
+
+
+class BlockTtlPolicy:
+    """How long a block lasts, by threat type, confidence and the source's offense count.
+
+    The base TTL comes from ``ttls`` (``default_ttl`` for unknown threat types) and is
+    scaled by the confidence factor. A source blocked again within ``offense_memory``
+    seconds of its previous block is a repeat offender: its n-th offense lasts
+    ``escalation ** (n - 1)`` times longer, up to ``max_ttl``, and from offense
+    ``permanent_after`` on (if set) the block is permanent. Manual blocks last
+    ``manual_ttl`` seconds, or forever when it is None.
+    """
+    def __init__(self, ttls=None, default_ttl=HOUR, confidence_factors=None, escalation=4.0, max_ttl=30 * DAY,
+                 permanent_after=None, offense_memory=30 * DAY, manual_ttl=None):
+        self.ttls = dict(DEFAULT_BLOCK_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.confidence_factors = dict(CONFIDENCE_FACTORS if confidence_factors is None else confidence_factors)
+        self.escalation = escalation
+        self.max_ttl = max_ttl
+        self.permanent_after = permanent_after
+        self.offense_memory = offense_memory
+        self.manual_ttl = manual_ttl
+
+    def ttl(self, entry, offense=1):
+        """Seconds the block recorded by ``entry`` should last, or None for a permanent block."""
+        if self.permanent_after and offense >= self.permanent_after:
+            return None
+        reason = entry.get("reason")
+        if reason is None:
+            base = self.manual_ttl
+            if base is None:
+                return None
+        else:
+            base = self.ttls.get(reason, self.default_ttl) * self.confidence_factors.get(entry.get("confidence"), 1.0)
+        return min(base * self.escalation ** (offense - 1), self.max_ttl)
@@ -1,23 +1,80 @@
-import json
 from datetime import datetime
 
+from core.cidr_index import parse_prefix
+from core.config import settings
+from repositories.block_ttl import BlockTtlPolicy
+from repositories.journal import JournaledFirewallState
+from repositories.sqlite_store import SQLiteFirewallState
+
+STORAGE_BACKENDS = {
+    "journal": JournaledFirewallState,
+    "sqlite": SQLiteFirewallState,
+}
+
+def block_ttl_policy():
+    """The BlockTtlPolicy configured by the ``BLOCK_TTL_*`` settings, or None when blocks are permanent."""
+    if not settings.BLOCK_TTL_ENABLED:
+        return None
+    return BlockTtlPolicy(
+        ttls=settings.BLOCK_TTL_BY_THREAT or None,
+        default_ttl=settings.BLOCK_TTL_DEFAULT,
+        escalation=settings.BLOCK_TTL_ESCALATION,
+        max_ttl=settings.BLOCK_TTL_MAX,
+        permanent_after=settings.BLOCK_TTL_PERMANENT_AFTER or None,
+        offense_memory=settings.BLOCK_TTL_OFFENSE_MEMORY,
+    )
+
+def store_options():
+    """Durability options from the ``FIREWALL_FSYNC_POLICY``/``FIREWALL_FLUSH_*`` settings, for any store."""
+    return {
+        "fsync_policy": settings.FIREWALL_FSYNC_POLICY,
+        "flush_interval": settings.FIREWALL_FLUSH_INTERVAL_MS / 1000,
+        "flush_max_events": settings.FIREWALL_FLUSH_MAX_EVENTS,
+    }
+
+def create_store(backend=None, path=None):
+    """Build the firewall state store selected by ``settings.FIREWALL_STORAGE_BACKEND``."""
+    backend = backend or settings.FIREWALL_STORAGE_BACKEND
+    if backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend {backend!r}; expected one of {tuple(STORAGE_BACKENDS)}.")
+    if path is None:
+        path = settings.FIREWALL_DB_FILE if backend == "sqlite" else "data/firewall_state.json"
+    return STORAGE_BACKENDS[backend](path, ttl_policy=block_ttl_policy(), **store_options())
+
 class FirewallRepository:
-    def __init__(self):
-        self.file_path = "data/firewall_state.json"
-        try:
-            with open(self.file_path, "r") as f:
-                self.data = json.load(f)
-        except FileNotFoundError:
-            self.data = {"blocked_ips": [], "log": []}
-            self._save()
+    def __init__(self, store=None):
+        self.store = store if store is not None else create_store()
+
+    @property
+    def data(self):
+        return self.store.state()
+
+    def is_blocked(self, ip):
+        return self.store.is_blocked(ip)
+
+    def match(self, ip):
+        return self.store.match(ip)
+
+    @property
+    def version(self):
+        return self.store.version
+
+    def state_page(self, after=None, limit=1000, event=None, include_blocked=True, version=None):
+        return self.store.state_page(after=after, limit=limit, event=event, include_blocked=include_blocked,
+                                     version=version)
+
+    def summary(self):
+        return self.store.summary()
+
+    def query_events(self, ip=None, event=None, since=None, until=None, limit=1000):
+        return self.store.query_events(ip=ip, event=event, since=since, until=until, limit=limit)
 
     def _save(self):
-        with open(self.file_path, "w") as f:
-            json.dump(self.data, f, indent=4)
+        # Events are journaled as they happen; this folds the journal into a new snapshot.
+        self.store.compact()
 
     def block_ip(self, ip, threat):
-        self.data["blocked_ips"].append(ip)
-        self.data["log"].append({
+        self.store.record({
             "event": "Blocked IP",
             "ip": ip,
             "reason": threat["threat_type"],
@@ -25,38 +82,52 @@ class FirewallRepository:
             "action": threat["action"],
             "timestamp": datetime.utcnow().isoformat() + "Z"
         })
-        self._save()
+
+    def block_ips(self, blocks):
+        """Block every (ip, threat) pair with a single group commit."""
+        timestamp = datetime.utcnow().isoformat() + "Z"
+        return self.store.record_many([{
+            "event": "Blocked IP",
+            "ip": ip,
+            "reason": threat["threat_type"],
+            "confidence": threat["confidence"],
+            "action": threat["action"],
+            "timestamp": timestamp
+        } for ip, threat in blocks])
 
     def unblock_ip(self, ip):
-        if ip in self.data["blocked_ips"]:
-            self.data["blocked_ips"].remove(ip)
-            self.data["log"].append({
+        if self.store.is_blocked(ip):
+            self.store.record({
                 "event": "Unblocked IP",
                 "ip": ip,
                 "reason": "Manual unblock",
                 "timestamp": datetime.utcnow().isoformat() + "Z"
             })
-            self._save()
             return {"message": f"{ip} unblocked."}
         else:
             raise ValueError(f"{ip} not found.")
 
     def unblock_all(self):
-        self.data["log"].append({
+        self.store.record({
             "event": "Unblocked All",
             "timestamp": datetime.utcnow().isoformat() + "Z"
         })
-        self.data["blocked_ips"] = []
-        self._save()
         return {"message": "All IPs unblocked."}
 
-    def manual_block(self, ip):
-        if ip not in self.data["blocked_ips"]:
-            self.data["blocked_ips"].append(ip)
-            self.data["log"].append({
-                "event": "Manually Blocked IP",
-                "ip": ip,
-                "timestamp": datetime.utcnow().isoformat() + "Z"
-            })
-            self._save()
+    def record_manual_block(self, ip):
+        """Record a manual block without waiting; returns the CommitHandle, or None if already blocked."""
+        parse_prefix(ip)
+        if self.store.is_blocked(ip):
+            return None
+        return self.store.record({
+            "event": "Manually Blocked IP",
+            "ip": ip,
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        })
+
+    def manual_block(self, ip, durable=True, timeout=5.0):
+        # Manual blocks wait for the group commit (and fsync) so the response means "persisted".
+        handle = self.record_manual_block(ip)
+        if handle is not None and durable and not handle.wait(timeout, durable=True):
+            return {"message": f"{ip} blocked manually; persistence still pending."}
         return {"message": f"{ip} blocked manually."}
@@ -0,0 +1,639 @@
+import itertools
+from collections import Counter
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from core.cidr_index import CidrIndex
+from core.event_log import event_log
+from core.metrics import metrics
+from core.utils import to_epoch
+from timing_wheel import HierarchicalTimingWheel
+
+FSYNC_POLICIES = ("always", "batched", "never")
+BLOCK_EVENTS = ("Blocked IP", "Manually Blocked IP")
+UNBLOCK_EVENTS = ("Unblocked IP", "Expired IP")
+
+
+class CommitHandle:
+    """Completion handle shared by every event in one group commit.
+
+    ``wait()`` returns once the group has been written to the journal; ``wait(durable=True)``
+    additionally waits for an fsync that covers it (requesting one under the "batched" policy).
+    Under the "never" policy a written group counts as durable. ``add_callback`` is the
+    non-blocking form, for callers (such as an event loop) that must not park a thread.
+    """
+    def __init__(self, journal):
+        self.journal = journal
+        self.written = threading.Event()
+        self.synced = threading.Event()
+        self.callbacks = []
+        self.callback_lock = threading.Lock()
+
+    def wait(self, timeout=None, durable=False):
+        if not durable:
+            return self.written.wait(timeout)
+        if not self.synced.is_set():
+            self.journal.request_sync()
+        return self.synced.wait(timeout)
+
+    def add_callback(self, fn, durable=False):
+        """Call ``fn()`` once the group is written (synced if ``durable``); runs on the writer thread."""
+        with self.callback_lock:
+            done = (self.synced if durable else self.written).is_set()
+            if not done:
+                self.callbacks.append((durable, fn))
+        if done:
+            fn()
+        elif durable:
+            self.journal.request_sync()
+
+    def _mark(self, durable):
+        with self.callback_lock:
+            (self.synced if durable else self.written).set()
+            ready = [fn for kind, fn in self.callbacks if kind == durable]
+            self.callbacks = [(kind, fn) for kind, fn in self.callbacks if kind != durable]
+        for fn in ready:
+            fn()
+
+    def mark_written(self):
+        self._mark(False)
+
+    def mark_synced(self):
+        self._mark(True)
+
+
+def apply_event(blocked_ips, entry):
+    """Apply one log entry to the in-memory blocked set (a CidrIndex); ``ip`` may be a CIDR."""
+    event = entry.get("event")
+    if event in BLOCK_EVENTS:
+        blocked_ips.add(entry["ip"])
+    elif event in UNBLOCK_EVENTS:
+        blocked_ips.discard(entry["ip"])
+    elif event == "Unblocked All":
+        blocked_ips.clear()
+
+
+class GroupCommitStore:
+    """Group-commit machinery shared by the firewall state backends.
+
+    ``record`` applies an event to the in-memory blocked set (a CidrIndex), queues it
+    and returns a CommitHandle; a writer thread hands queued events to ``_write_group``
+    every ``flush_interval`` seconds or ``flush_max_events`` events. ``fsync_policy`` is
+    "always" (sync every group), "batched" (at most every ``fsync_interval`` seconds, or
+    when a caller waits for durability) or "never" (leave it to the OS). A second thread
+    calls ``compact`` every ``compact_every`` events or ``compact_interval`` seconds.
+
+    ``seq`` doubles as the state version: it grows by one per event, so a client that saw
+    version N has seen everything up to the N-th event. ``state_page`` serves the log in
+    cursor-delimited pages and ``summary`` only counts.
+
+    With a ``ttl_policy`` (a BlockTtlPolicy) each block gets an ``expires_at`` and an
+    ``offense`` count when it is recorded. Pending expirations sit in a hierarchical
+    timing wheel that the writer thread advances; everything that came due in one tick
+    is recorded as "Expired IP" events in a single group commit. Expirations and offense
+    counts are part of the snapshot, so they survive restarts.
+
+    Subclasses recover their state, then call ``_start``, and implement ``_encode``,
+    ``_write_group``, ``_sync``, ``_log_page``, ``compact`` and ``_close_storage``.
+    """
+    name = "GroupCommitStore"
+
+    def __init__(self, compact_every=10000, compact_interval=300.0, fsync_policy="batched",
+                 flush_interval=0.01, flush_max_events=1000, fsync_interval=1.0, ttl_policy=None):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync_policy!r}; expected one of {FSYNC_POLICIES}.")
+        self.compact_every = compact_every
+        self.compact_interval = compact_interval
+        self.fsync_policy = fsync_policy
+        self.flush_interval = flush_interval
+        self.flush_max_events = flush_max_events
+        self.fsync_interval = fsync_interval
+        self.ttl_policy = ttl_policy
+        self.lock = threading.RLock()
+        self.io_lock = threading.Lock()
+        self.compaction_lock = threading.Lock()
+        self.blocked_ips = CidrIndex()
+        self.seq = 0
+        self.event_counts = Counter()
+        self.since_compaction = 0
+        self.pending = []
+        self.group = CommitHandle(self)
+        self.unsynced = []
+        self.last_sync = time.monotonic()
+        self.sync_requested = False
+        self.groups_written = 0
+        self.bytes_written = 0
+        self.fsyncs = 0
+        self.flush_requested = threading.Event()
+        self.compact_requested = threading.Event()
+        self.closed = False
+        now = time.time()
+        self.expiries = {}
+        self.expiry_wheel = HierarchicalTimingWheel(1.0, 256, 3, now)
+        # ip -> (offense count, epoch of the latest block), forgotten after the policy's offense_memory.
+        self.offenses = {}
+        self.offense_wheel = HierarchicalTimingWheel(60.0, 256, 2, now)
+        self.expired = 0
+
+    def _start(self):
+        self.writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self.writer.start()
+        self.compactor = threading.Thread(target=self._compaction_loop, daemon=True)
+        self.compactor.start()
+
+    def _load_blocked(self, prefixes):
+        self.blocked_ips = CidrIndex()
+        for prefix in prefixes:
+            try:
+                self.blocked_ips.add(prefix)
+            except ValueError as e:
+                event_log.warning("store.skip_blocked_entry", store=self.name, error=str(e))
+
+    def _apply_recovered(self, seq, entry):
+        try:
+            apply_event(self.blocked_ips, entry)
+        except ValueError as e:
+            event_log.warning("store.skip_record", store=self.name, seq=seq, error=str(e))
+            return
+        self._track_expiry(entry)
+
+    def _assign_ttl(self, entry):
+        # Stamp a new block with its offense count and, unless it is permanent, its expiry.
+        now = time.time()
+        ip = entry["ip"]
+        previous = self.offenses.get(ip)
+        offense = 1
+        if previous is not None and now - previous[1] <= self.ttl_policy.offense_memory:
+            offense = previous[0] + 1
+        entry["offense"] = offense
+        ttl = self.ttl_policy.ttl(entry, offense)
+        if ttl is not None:
+            entry["expires_at"] = round(now + ttl, 3)
+
+    def _forget_offense_later(self, ip):
+        # Offense counts only need pruning once the block is gone.
+        offense = self.offenses.get(ip)
+        if offense is not None and self.ttl_policy is not None:
+            self.offense_wheel.schedule(ip, offense[1] + self.ttl_policy.offense_memory)
+
+    def _track_expiry(self, entry, now=None):
+        """Keep the expiry wheel and offense counts in step with an applied event.
+
+        ``now`` is the block time of a live event; recovered events use their timestamp.
+        """
+        event = entry.get("event")
+        ip = entry.get("ip")
+        if event in BLOCK_EVENTS:
+            if "offense" in entry:
+                blocked_at = now if now is not None else to_epoch(entry.get("timestamp")) or time.time()
+                self.offenses[ip] = (entry["offense"], blocked_at)
+                if ip in self.offense_wheel:
+                    self.offense_wheel.cancel(ip)
+            if "/" in ip and self.expiries:
+                # A wider block takes over the timed blocks inside it, so their expiry cannot punch holes in it.
+                covering = CidrIndex([ip])
+                for key in [key for key in self.expiries if key != ip and key in covering]:
+                    self.expiry_wheel.cancel(key)
+                    del self.expiries[key]
+            if entry.get("expires_at") is not None:
+                self.expiries[ip] = entry["expires_at"]
+                self.expiry_wheel.schedule(ip, entry["expires_at"])
+            elif self.expiries.pop(ip, None) is not None:
+                self.expiry_wheel.cancel(ip)
+        elif event in UNBLOCK_EVENTS:
+            if self.expiries.pop(ip, None) is not None:
+                self.expiry_wheel.cancel(ip)
+            self._forget_offense_later(ip)
+        elif event == "Unblocked All":
+            self.expiries = {}
+            self.expiry_wheel = HierarchicalTimingWheel(1.0, 256, 3, time.time())
+            for ip in self.offenses:
+                self._forget_offense_later(ip)
+
+    def expire_due(self, now=None):
+        """Unblock every block whose TTL has passed, in one group commit; returns how many expired."""
+        now = time.time() if now is None else now
+        with self.lock:
+            for ip in self.offense_wheel.advance(now):
+                offense = self.offenses.get(ip)
+                if offense is not None and self.ttl_policy is not None:
+                    forget_at = offense[1] + self.ttl_policy.offense_memory
+                    if forget_at > now:
+                        self.offense_wheel.schedule(ip, forget_at)
+                        continue
+                if ip not in self.expiries:
+                    self.offenses.pop(ip, None)
+            due = self.expiry_wheel.advance(now)
+            if not due:
+                return 0
+            timestamp = datetime.utcnow().isoformat() + "Z"
+            entries = []
+            for ip in due:
+                expires_at = self.expiries.get(ip)
+                if expires_at is None:
+                    continue
+                if expires_at > now:
+                    # Due within the current tick: expire on the next one rather than early.
+                    self.expiry_wheel.schedule(ip, expires_at)
+                    continue
+                del self.expiries[ip]
+                offense = self.offenses.get(ip)
+                entries.append({
+                    "event": "Expired IP",
+                    "ip": ip,
+                    "reason": "Block expired",
+                    "offense": offense[0] if offense is not None else 1,
+                    "expires_at": expires_at,
+                    "timestamp": timestamp
+                })
+            if entries:
+                self.record_many(entries)
+                self.expired += len(entries)
+                event_log.info("store.blocks_expired", store=self.name, count=len(entries))
+            return len(entries)
+
+    def _expiry_state(self):
+        return {
+            "expiries": dict(self.expiries),
+            "offenses": {ip: list(offense) for ip, offense in self.offenses.items()},
+        }
+
+    def _load_expiry_state(self, state):
+        # Called during recovery with a snapshot's _expiry_state() (None for older snapshots).
+        if not state:
+            return
+        for ip, expires_at in state.get("expiries", {}).items():
+            self.expiries[ip] = expires_at
+            self.expiry_wheel.schedule(ip, expires_at)
+        for ip, (offense, blocked_at) in state.get("offenses", {}).items():
+            self.offenses[ip] = (offense, blocked_at)
+            if ip not in self.expiries:
+                self._forget_offense_later(ip)
+
+    def _remember(self, entry):
+        pass
+
+    def record(self, entry):
+        """Apply an event to the in-memory state and queue it for the next group commit.
+
+        Returns the CommitHandle of the group the event belongs to, or None if the event
+        names an invalid address, in which case it is logged and skipped.
+        """
+        with self.lock:
+            # Applied first so an invalid address is dropped before it is stamped or queued.
+            try:
+                apply_event(self.blocked_ips, entry)
+            except ValueError as e:
+                event_log.warning("store.skip_record", store=self.name, ip=entry.get("ip"), error=str(e))
+                return None
+            if self.ttl_policy is not None and entry.get("event") in BLOCK_EVENTS and "offense" not in entry:
+                self._assign_ttl(entry)
+            self._track_expiry(entry, time.time())
+            self.seq += 1
+            self.event_counts[entry.get("event")] += 1
+            self._remember(entry)
+            self.pending.append(self._encode(entry, self.seq))
+            if len(self.pending) >= self.flush_max_events:
+                self.flush_requested.set()
+            self.since_compaction += 1
+            if self.since_compaction >= self.compact_every:
+                self.compact_requested.set()
+            return self.group
+
+    def record_many(self, entries):
+        """Record a batch of events under one lock and flush them as a single group commit.
+
+        Entries are applied in order; ones with an invalid address are logged and skipped.
+        Returns the shared CommitHandle.
+        """
+        with self.lock:
+            for entry in entries:
+                self.record(entry)
+            self.flush_requested.set()
+            return self.group
+
+    def request_sync(self):
+        self.sync_requested = True
+        self.flush_requested.set()
+
+    def flush(self, durable=False):
+        """Write every queued event now (and sync it when ``durable``)."""
+        if durable:
+            self.sync_requested = True
+        self._write_pending()
+
+    def _write_pending(self):
+        with self.io_lock:
+            with self.lock:
+                items, self.pending = self.pending, []
+                if items:
+                    group, self.group = self.group, CommitHandle(self)
+            if items:
+                start = time.perf_counter()
+                written = self._write_group(items)
+                if metrics.enabled:
+                    metrics.histogram("store_write_latency_seconds", "Time to write one group commit.",
+                                      store=self.name).observe(time.perf_counter() - start)
+                    metrics.counter("store_bytes_written_total", "Bytes persisted by the firewall store.",
+                                    store=self.name).inc(written)
+                    metrics.counter("store_events_written_total", "Events persisted by the firewall store.",
+                                    store=self.name).inc(len(items))
+                self.bytes_written += written
+                self.groups_written += 1
+                group.mark_written()
+                self.unsynced.append(group)
+            if not self.unsynced:
+                return
+            now = time.monotonic()
+            if self.fsync_policy == "never":
+                synced = True
+            elif self.fsync_policy == "always" or self.sync_requested or now - self.last_sync >= self.fsync_interval:
+                start = time.perf_counter()
+                self._sync()
+                if metrics.enabled:
+                    metrics.histogram("store_sync_latency_seconds", "Time to fsync (or checkpoint) the store.",
+                                      store=self.name).observe(time.perf_counter() - start)
+                self.fsyncs += 1
+                synced = True
+            else:
+                synced = False
+            if synced:
+                self.sync_requested = False
+                self.last_sync = now
+                for unsynced in self.unsynced:
+                    unsynced.mark_synced()
+                self.unsynced = []
+
+    def _writer_loop(self):
+        while not self.closed:
+            self.flush_requested.wait(self.flush_interval)
+            self.flush_requested.clear()
+            try:
+                if self.expiries or self.offenses:
+                    self.expire_due()
+                self._write_pending()
+            except (OSError, sqlite3.Error) as e:
+                event_log.error("store.write_failed", store=self.name, error=str(e))
+
+    def _compaction_loop(self):
+        while not self.closed:
+            self.compact_requested.wait(self.compact_interval)
+            self.compact_requested.clear()
+            if self.closed:
+                break
+            try:
+                self.compact()
+            except (OSError, sqlite3.Error) as e:
+                event_log.error("store.compaction_failed", store=self.name, error=str(e))
+
+    def is_blocked(self, ip):
+        try:
+            return ip in self.blocked_ips
+        except ValueError:
+            return False
+
+    def match(self, ip):
+        """The blocked prefix covering ``ip`` (e.g. "10.0.0.0/24"), or None."""
+        try:
+            return self.blocked_ips.match(ip)
+        except ValueError:
+            return None
+
+    @property
+    def version(self):
+        return self.seq
+
+    def state_page(self, after=None, limit=1000, event=None, include_blocked=True, version=None):
+        """One page of the firewall state.
+
+        Without ``after`` the page holds the newest ``limit`` log entries; with it, the
+        entries recorded after that sequence number, oldest first. Entries carry their
+        ``seq``, and ``next`` is the cursor to pass as ``after`` for the following page.
+        ``version`` pins the page to an earlier state version (e.g. a cached snapshot's).
+        """
+        with self.lock:
+            version = self.seq if version is None else min(version, self.seq)
+            blocked_ips = list(self.blocked_ips) if include_blocked else None
+        log, next_cursor = self._log_page(version, after, limit, event)
+        page = {"version": version, "log": log, "next": next_cursor}
+        if include_blocked:
+            page["blocked_ips"] = blocked_ips
+        return page
+
+    def summary(self):
+        with self.lock:
+            return {
+                "version": self.seq,
+                "blocked_prefixes": len(self.blocked_ips),
+                "expiring_blocks": len(self.expiries),
+                "log_entries": sum(self.event_counts.values()),
+                "event_counts": dict(self.event_counts),
+            }
+
+    def close(self):
+        self.closed = True
+        self.flush_requested.set()
+        self.compact_requested.set()
+        self.writer.join()
+        self.compactor.join()
+        self.flush(durable=True)
+        self.compact()
+        with self.io_lock:
+            self._close_storage()
+
+    def stats(self):
+        return {
+            "seq": self.seq,
+            "pending": len(self.pending),
+            "groups_written": self.groups_written,
+            "bytes_written": self.bytes_written,
+            "fsyncs": self.fsyncs,
+            "fsync_policy": self.fsync_policy,
+            "pending_expirations": len(self.expiries),
+            "expired": self.expired,
+        }
+
+
+def event_filter(ip=None, event=None, since=None, until=None):
+    """Predicate over log entries for ``query_events``; ``ip`` may be an address or a CIDR."""
+    prefix = CidrIndex([ip]) if ip else None
+    since = to_epoch(since)
+    until = to_epoch(until)
+
+    def matches(entry):
+        if event is not None and entry.get("event") != event:
+            return False
+        if prefix is not None:
+            try:
+                if entry.get("ip") not in prefix:
+                    return False
+            except (TypeError, ValueError):
+                return False
+        if since is not None or until is not None:
+            ts = to_epoch(entry.get("timestamp"))
+            if ts is None or (since is not None and ts < since) or (until is not None and ts > until):
+                return False
+        return True
+    return matches
+
+
+class JournaledFirewallState(GroupCommitStore):
+    """Firewall state persisted as a JSON snapshot plus an append-only journal.
+
+    Every event is appended to ``<snapshot>.journal`` as one compact JSON line carrying a
+    sequence number. A background thread periodically writes a fresh snapshot (the usual
+    ``{"blocked_ips": [...], "log": [...]}`` document plus ``seq``) and starts a new
+    journal. On startup the snapshot is loaded and every journal record with a higher
+    sequence number is replayed on top of it. Blocked addresses and ranges are kept in a
+    CidrIndex, so ``blocked_ips`` lists coalesced prefixes. Writes are group-committed
+    (see GroupCommitStore).
+    """
+    name = "JournaledFirewallState"
+
+    def __init__(self, snapshot_path, compact_every=10000, compact_interval=300.0, fsync_policy="batched",
+                 flush_interval=0.01, flush_max_events=1000, fsync_interval=1.0, ttl_policy=None):
+        super().__init__(compact_every, compact_interval, fsync_policy, flush_interval, flush_max_events,
+                         fsync_interval, ttl_policy)
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + ".journal"
+        self.rotated_path = self.journal_path + ".old"
+        self.log = []
+        self.snapshot_seq = 0
+        self._recover()
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        self._start()
+
+    def _recover(self):
+        try:
+            with open(self.snapshot_path, "r") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = {"blocked_ips": [], "log": []}
+        self._load_blocked(snapshot.get("blocked_ips", []))
+        self._load_expiry_state(snapshot.get("expiry"))
+        self.log = snapshot.get("log", [])
+        # Legacy snapshots have no seq; their log entries are numbered from 1.
+        self.seq = self.snapshot_seq = snapshot.get("seq", len(self.log))
+        replayed = 0
+        for path in (self.rotated_path, self.journal_path):
+            replayed += self._replay(path)
+        if replayed or os.path.exists(self.rotated_path) or not os.path.exists(self.snapshot_path):
+            # Fold the replayed tail into a fresh snapshot so startup stays fast next time.
+            self._write_snapshot(self._snapshot_document())
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+            open(self.journal_path, "w").close()
+            self.snapshot_seq = self.seq
+        self.event_counts = Counter(entry.get("event") for entry in self.log)
+
+    def _replay(self, path):
+        replayed = 0
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn final write: everything after it is lost anyway.
+                        event_log.warning("store.truncated_record", store=self.name, path=path)
+                        break
+                    seq = record.pop("seq", 0)
+                    if seq <= self.seq:
+                        continue
+                    self._apply_recovered(seq, record)
+                    self.log.append(record)
+                    self.seq = seq
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        return replayed
+
+    def _remember(self, entry):
+        self.log.append(entry)
+
+    def _encode(self, entry, seq):
+        return json.dumps(dict(entry, seq=seq), separators=(",", ":"))
+
+    def _write_group(self, lines):
+        data = "\n".join(lines) + "\n"
+        self.journal.write(data)
+        self.journal.flush()
+        return len(data)
+
+    def _sync(self):
+        os.fsync(self.journal.fileno())
+
+    def state(self):
+        """The firewall state in its historical JSON shape."""
+        with self.lock:
+            return {"blocked_ips": list(self.blocked_ips), "log": self.log}
+
+    def _log_page(self, version, after, limit, event):
+        # seq == len(log) always holds, so log[i] is the event with sequence number i + 1.
+        log = self.log
+        entries = []
+        if after is None:
+            i = version
+            while i > 0 and len(entries) < limit:
+                i -= 1
+                if event is None or log[i].get("event") == event:
+                    entries.append(dict(log[i], seq=i + 1))
+            entries.reverse()
+            return entries, version
+        i = max(after, 0)
+        while i < version and len(entries) < limit:
+            if event is None or log[i].get("event") == event:
+                entries.append(dict(log[i], seq=i + 1))
+            i += 1
+        return entries, i
+
+    def query_events(self, ip=None, event=None, since=None, until=None, limit=1000):
+        """Log entries matching every given filter, oldest first (a scan of the in-memory log)."""
+        matches = event_filter(ip, event, since, until)
+        with self.lock:
+            log = list(self.log)
+        return list(itertools.islice((entry for entry in log if matches(entry)), limit))
+
+    def _snapshot_document(self):
+        return {"blocked_ips": list(self.blocked_ips), "log": list(self.log), "seq": self.seq,
+                "expiry": self._expiry_state()}
+
+    def _write_snapshot(self, document):
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(document, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def compact(self):
+        """Write a snapshot of the current state and discard the journal it covers.
+
+        Only the journal rotation happens under the lock; the snapshot itself is written
+        while new events keep appending to the fresh journal.
+        """
+        with self.compaction_lock:
+            # Everything the snapshot will cover must be in the journal being rotated out.
+            self._write_pending()
+            with self.io_lock, self.lock:
+                if not self.since_compaction:
+                    return False
+                # The log is append-only, so its first log_len entries can be copied after unlocking.
+                blocked_ips, log_len, seq = list(self.blocked_ips), len(self.log), self.seq
+                expiry = self._expiry_state()
+                self.journal.close()
+                os.replace(self.journal_path, self.rotated_path)
+                self.journal = open(self.journal_path, "a", encoding="utf-8")
+                self.since_compaction = 0
+            self._write_snapshot({"blocked_ips": blocked_ips, "log": self.log[:log_len], "seq": seq,
+                                  "expiry": expiry})
+            os.remove(self.rotated_path)
+            self.snapshot_seq = seq
+            return True
+
+    def _close_storage(self):
+        self.journal.close()
@@ -0,0 +1,203 @@
+import json
+import sqlite3
+import threading
+from collections import Counter
+
+from core.cidr_index import parse_prefix
+from core.utils import to_epoch
+from repositories.journal import BLOCK_EVENTS, UNBLOCK_EVENTS, GroupCommitStore
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY,
+    ts REAL,
+    event TEXT NOT NULL,
+    ip_key BLOB,
+    ip TEXT,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_ip ON events (ip_key, ts);
+CREATE INDEX IF NOT EXISTS events_event ON events (event, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS snapshot (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seq INTEGER NOT NULL,
+    blocked_ips TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS expiry_snapshot (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seq INTEGER NOT NULL,
+    body TEXT NOT NULL
+);
+"""
+INSERT_EVENT = "INSERT INTO events (seq, ts, event, ip_key, ip, body) VALUES (?, ?, ?, ?, ?, ?)"
+STATE_EVENTS = BLOCK_EVENTS + UNBLOCK_EVENTS + ("Unblocked All",)
+# WAL with synchronous=NORMAL only syncs the WAL at checkpoints, which _sync forces.
+SYNCHRONOUS = {"always": "FULL", "batched": "NORMAL", "never": "OFF"}
+IPV4_MAPPED = 0xFFFF00000000
+
+
+def ip_range(text):
+    """First and last address of an address or CIDR as 16-byte keys (IPv4 is IPv4-mapped)."""
+    version, value, length = parse_prefix(text)
+    host_bits = (32 if version == 4 else 128) - length
+    first = value >> host_bits << host_bits
+    last = first | ((1 << host_bits) - 1)
+    if version == 4:
+        first, last = IPV4_MAPPED | first, IPV4_MAPPED | last
+    return first.to_bytes(16, "big"), last.to_bytes(16, "big")
+
+
+class SQLiteFirewallState(GroupCommitStore):
+    """Firewall state in a SQLite database in WAL mode.
+
+    Events go to an ``events`` table indexed by address, event type and timestamp, so
+    ``query_events`` is an index range scan rather than a pass over the whole history.
+    Addresses are stored as 16-byte big-endian keys (IPv4 as IPv4-mapped), which makes a
+    CIDR filter a ``BETWEEN`` over the key. Each group commit is one transaction with a
+    single prepared INSERT run through ``executemany``.
+
+    Only the blocked prefixes are held in memory. ``compact`` stores them with the current
+    sequence number in the ``snapshot`` table (and pending block expirations in
+    ``expiry_snapshot``); startup loads those rows and replays the block/unblock events
+    recorded after them.
+    """
+    name = "SQLiteFirewallState"
+
+    def __init__(self, db_path, compact_every=10000, compact_interval=300.0, fsync_policy="batched",
+                 flush_interval=0.01, flush_max_events=1000, fsync_interval=1.0, ttl_policy=None):
+        super().__init__(compact_every, compact_interval, fsync_policy, flush_interval, flush_max_events,
+                         fsync_interval, ttl_policy)
+        self.db_path = db_path
+        self.readers = threading.local()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(f"PRAGMA synchronous={SYNCHRONOUS[fsync_policy]}")
+        self.conn.executescript(SCHEMA)
+        self._recover()
+        self._start()
+
+    def _recover(self):
+        row = self.conn.execute("SELECT seq, blocked_ips FROM snapshot WHERE id = 0").fetchone()
+        snapshot_seq, blocked_ips = (row[0], json.loads(row[1])) if row else (0, [])
+        self._load_blocked(blocked_ips)
+        row = self.conn.execute("SELECT body FROM expiry_snapshot WHERE id = 0").fetchone()
+        self._load_expiry_state(json.loads(row[0]) if row else None)
+        placeholders = ", ".join("?" * len(STATE_EVENTS))
+        for seq, body in self.conn.execute(
+                f"SELECT seq, body FROM events WHERE seq > ? AND event IN ({placeholders}) ORDER BY seq",
+                (snapshot_seq,) + STATE_EVENTS):
+            self._apply_recovered(seq, json.loads(body))
+        # The snapshot may cover events that were still queued when it was taken.
+        max_seq = self.conn.execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+        self.seq = max(max_seq, snapshot_seq)
+        self.event_counts = Counter(dict(self.conn.execute("SELECT event, COUNT(*) FROM events GROUP BY event")))
+
+    def _reader(self):
+        # One connection per thread; WAL lets readers run alongside the writer.
+        conn = getattr(self.readers, "conn", None)
+        if conn is None:
+            conn = self.readers.conn = sqlite3.connect(self.db_path)
+        return conn
+
+    def _encode(self, entry, seq):
+        ip = entry.get("ip")
+        ip_key = None
+        if ip:
+            try:
+                ip_key = ip_range(ip)[0]
+            except ValueError:
+                pass
+        try:
+            ts = to_epoch(entry.get("timestamp"))
+        except ValueError:
+            ts = None
+        return (seq, ts, entry.get("event", ""), ip_key, ip, json.dumps(entry, separators=(",", ":")))
+
+    def _write_group(self, rows):
+        with self.conn:
+            self.conn.execute("BEGIN")
+            self.conn.executemany(INSERT_EVENT, rows)
+        return sum(len(row[5]) for row in rows)
+
+    def _sync(self):
+        if self.fsync_policy != "always":
+            self.conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def state(self):
+        """The firewall state in its historical JSON shape (reads the whole event table)."""
+        with self.lock:
+            blocked_ips = list(self.blocked_ips)
+        return {"blocked_ips": blocked_ips, "log": self.query_events(limit=None)}
+
+    def _log_page(self, version, after, limit, event):
+        # Write out queued events first so the page matches ``version``.
+        if self.pending:
+            self._write_pending()
+        clauses = ["seq <= ?"]
+        params = [version]
+        if event is not None:
+            clauses.append("event = ?")
+            params.append(event)
+        if after is None:
+            sql = f"SELECT seq, body FROM events WHERE {' AND '.join(clauses)} ORDER BY seq DESC LIMIT ?"
+        else:
+            clauses.append("seq > ?")
+            params.append(after)
+            sql = f"SELECT seq, body FROM events WHERE {' AND '.join(clauses)} ORDER BY seq LIMIT ?"
+        params.append(limit)
+        entries = [dict(json.loads(body), seq=seq) for seq, body in self._reader().execute(sql, params)]
+        if after is None:
+            entries.reverse()
+            return entries, version
+        return entries, entries[-1]["seq"] if len(entries) == limit else version
+
+    def query_events(self, ip=None, event=None, since=None, until=None, limit=1000):
+        """Events matching every given filter, oldest first; ``ip`` may be an address or a CIDR.
+
+        ``since``/``until`` are epoch seconds or ISO-8601 timestamps. Events still waiting
+        for their group commit are not visible yet.
+        """
+        clauses = []
+        params = []
+        if ip:
+            clauses.append("ip_key BETWEEN ? AND ?")
+            params.extend(ip_range(ip))
+        if event is not None:
+            clauses.append("event = ?")
+            params.append(event)
+        if since is not None:
+            clauses.append("ts >= ?")
+            params.append(to_epoch(since))
+        if until is not None:
+            clauses.append("ts <= ?")
+            params.append(to_epoch(until))
+        sql = "SELECT body FROM events"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return [json.loads(row[0]) for row in self._reader().execute(sql, params)]
+
+    def compact(self):
+        """Store the blocked prefixes with the latest sequence number; history is never trimmed."""
+        with self.compaction_lock:
+            self._write_pending()
+            with self.io_lock, self.lock:
+                if not self.since_compaction:
+                    return False
+                blocked_ips, seq, expiry = list(self.blocked_ips), self.seq, self._expiry_state()
+                self.since_compaction = 0
+                with self.conn:
+                    self.conn.execute("BEGIN")
+                    self.conn.execute("INSERT OR REPLACE INTO snapshot (id, seq, blocked_ips) VALUES (0, ?, ?)",
+                                      (seq, json.dumps(blocked_ips)))
+                    self.conn.execute("INSERT OR REPLACE INTO expiry_snapshot (id, seq, body) VALUES (0, ?, ?)",
+                                      (seq, json.dumps(expiry)))
+            return True
+
+    def _close_storage(self):
+        self.conn.close()
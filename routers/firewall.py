@@ -1,26 +1,100 @@
-from fastapi import APIRouter, HTTPException
+import json
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from core.bulk_codec import aiter_batches, framing_for
+from core.config import settings
+from core.decision_hub import decision_hub
 from models.packet import Packet
-from services.firewall_service import FirewallService # type: ignore
+from services.async_firewall_service import AsyncFirewallService
 
 router = APIRouter(prefix="/firewall", tags=["Firewall"])
-service = FirewallService()
+service = AsyncFirewallService(hub=decision_hub)
 
 @router.post("/analyze")
-def analyze_packet(packet: Packet):
-    return service.analyze_packet(packet)
+async def analyze_packet(packet: Packet):
+    try:
+        return await service.analyze_packet(packet)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _etag(version):
+    return f'W/"{version}"'
+
+def _not_modified(request, etag):
+    tags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    return etag in tags or "*" in tags
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse that does not listen for a disconnect while streaming.
+
+    The disconnect listener reads from ``receive`` and would swallow the request body
+    chunks that the generator is still consuming.
+    """
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+@router.post("/analyze/bulk")
+async def analyze_bulk(request: Request):
+    # NDJSON body, or length-prefixed JSON records with Content-Type: application/octet-stream.
+    # Decisions stream back as NDJSON, one batch at a time, each tagged with its record index.
+    framing = framing_for(request.headers.get("content-type"))
+
+    async def decisions():
+        start = 0
+        try:
+            async for batch in aiter_batches(request.stream(), framing, settings.BULK_BATCH_SIZE,
+                                             settings.BULK_MAX_RECORD_BYTES):
+                results = await service.analyze_batch(batch, start)
+                start += len(batch)
+                yield "".join(json.dumps(result) + "\n" for result in results)
+        except ValueError as e:
+            yield json.dumps({"index": start, "error": str(e), "fatal": True}) + "\n"
+
+    return DuplexStreamingResponse(decisions(), media_type="application/x-ndjson")
 
 @router.get("/state")
-def get_state():
-    return service.get_firewall_state()
+async def get_state(request: Request,
+                    limit: int = Query(settings.FIREWALL_STATE_PAGE_SIZE, ge=1, le=10000),
+                    since: Optional[int] = Query(None, ge=0),
+                    event: Optional[str] = None,
+                    view: str = Query("full", pattern="^(full|summary)$"),
+                    include_blocked: bool = True):
+    # The ETag is the state version, so a poll with nothing new is answered before building a page.
+    etag = _etag(service.state_version())
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    if view == "summary":
+        body = await service.get_state_summary()
+    else:
+        body = await service.get_firewall_state(since=since, limit=limit, event=event,
+                                                include_blocked=include_blocked)
+    return JSONResponse(body, headers={"ETag": _etag(body["version"])})
+
+@router.get("/events")
+async def get_events(ip: Optional[str] = None, event: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, last: Optional[float] = None, limit: int = 1000):
+    # e.g. /firewall/events?ip=10.0.0.0/8&last=3600
+    try:
+        return await service.query_events(ip=ip, event=event, since=since, until=until, last=last, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-@router.delete("/unblock/{ip}")
-def unblock(ip: str):
-    return service.unblock_ip(ip)
+@router.delete("/unblock/{ip:path}")
+async def unblock(ip: str):
+    return await service.unblock_ip(ip)
 
-@router.post("/block/{ip}")
-def block_ip(ip: str):
-    return service.manual_block(ip)
+@router.post("/block/{ip:path}")
+async def block_ip(ip: str):
+    # ``ip`` may also be a CIDR such as 10.0.0.0/24.
+    try:
+        return await service.manual_block(ip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 @router.delete("/unblock_all")
-def unblock_all():
-    return service.unblock_all()
+async def unblock_all():
+    return await service.unblock_all()
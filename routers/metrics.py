@@ -0,0 +1,12 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import Response
+from core.metrics import CONTENT_TYPE, metrics
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics")
+def get_metrics():
+    # Prometheus text format; METRICS_ENABLED=false turns instrumentation off.
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
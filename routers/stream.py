@@ -0,0 +1,77 @@
+import asyncio
+import json
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from core.config import settings
+from core.decision_hub import DecisionFilter, decision_hub
+
+router = APIRouter(prefix="/stream", tags=["Stream"])
+
+KEEPALIVE_SECONDS = 15
+
+def _subscribe(threat_type, action, cidr, threats_only):
+    # Raises ValueError for a malformed CIDR.
+    event_filter = DecisionFilter(threat_types=threat_type, actions=action, cidrs=cidr, threats_only=threats_only)
+    return decision_hub.subscribe(event_filter, max_pending=settings.STREAM_MAX_PENDING,
+                                  overflow=settings.STREAM_OVERFLOW)
+
+async def _frames(subscription):
+    # Yields {"events", "dropped"} frames, at most one per frame interval, or None as a keepalive.
+    interval = settings.STREAM_FRAME_INTERVAL_MS / 1000
+    while not subscription.closed:
+        events, dropped = await subscription.aget_batch(settings.STREAM_MAX_BATCH, timeout=KEEPALIVE_SECONDS)
+        if events or dropped:
+            yield {"events": events, "dropped": dropped}
+            await asyncio.sleep(interval)
+        elif not subscription.closed:
+            yield None
+
+@router.websocket("/decisions")
+async def stream_decisions(websocket: WebSocket,
+                           threat_type: Optional[List[str]] = Query(None),
+                           action: Optional[List[str]] = Query(None),
+                           cidr: Optional[List[str]] = Query(None),
+                           threats_only: bool = False):
+    # e.g. ws://host/stream/decisions?action=BLOCK&cidr=10.0.0.0/8
+    try:
+        subscription = _subscribe(threat_type, action, cidr, threats_only)
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+    await websocket.accept()
+    try:
+        async for frame in _frames(subscription):
+            if frame is not None:
+                await websocket.send_json(frame)
+        # Closed by the hub: the client fell too far behind under the "disconnect" policy.
+        await websocket.close(code=1013, reason=subscription.close_reason or "stream closed")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscription.close()
+
+@router.get("/decisions/sse")
+async def stream_decisions_sse(threat_type: Optional[List[str]] = Query(None),
+                               action: Optional[List[str]] = Query(None),
+                               cidr: Optional[List[str]] = Query(None),
+                               threats_only: bool = False):
+    # Server-sent events; each "data:" line is one frame of the WebSocket stream.
+    try:
+        subscription = _subscribe(threat_type, action, cidr, threats_only)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        try:
+            async for frame in _frames(subscription):
+                if frame is None:
+                    yield ": keepalive\n\n"
+                else:
+                    yield f"data: {json.dumps(frame)}\n\n"
+            yield f"event: close\ndata: {json.dumps({'reason': subscription.close_reason})}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
@@ -0,0 +1,232 @@
+import asyncio
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from core.cidr_index import parse_address
+from core.config import settings
+from core.decision_hub import decision_event
+from core.metrics import count_decision, count_decisions, metrics
+from core.utils import BLOCKED_SOURCE
+from models.packet import Packet
+from repositories.firewall_repository import FirewallRepository
+from services.firewall_service import decide_batch, decide_packets, score_packets, threat_response
+
+# Read-only view of the state at one version; replaced, never modified.
+FirewallSnapshot = namedtuple("FirewallSnapshot", ["version", "blocked_ips", "summary"])
+
+
+async def wait_for_commit(handle, durable=True, timeout=None):
+    """Await a CommitHandle without parking a thread on it; returns False on timeout."""
+    loop = asyncio.get_running_loop()
+    committed = loop.create_future()
+
+    def resolve():
+        if not committed.done():
+            committed.set_result(True)
+
+    handle.add_callback(lambda: loop.call_soon_threadsafe(resolve), durable=durable)
+    try:
+        await asyncio.wait_for(committed, timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+STAGE_HELP = "Time per call spent in each pipeline stage."
+ANALYZE_LATENCY = metrics.histogram("stage_latency_seconds", STAGE_HELP, stage="api_analyze")
+BULK_LATENCY = metrics.histogram("stage_latency_seconds", STAGE_HELP, stage="api_bulk_batch")
+CAPTURE_LATENCY = metrics.histogram("stage_latency_seconds", STAGE_HELP, stage="capture_batch")
+PACKETS_DECIDED = metrics.counter("packets_total", "Packets handled by each pipeline stage.", stage="decided")
+
+
+class AsyncFirewallService:
+    """asyncio front end to the firewall repository.
+
+    Every mutation goes through an asyncio queue to one owner task, which applies them in
+    order; the store only updates memory and queues a group commit there, so the owner
+    never blocks the loop. Reads of the blocked list and counts come from an immutable
+    FirewallSnapshot, rebuilt at most once per state version. Calls that can block or walk
+    the whole state (log pages, event queries, snapshot rebuilds, closing the store) run
+    on a dedicated executor, and durable manual blocks await their group commit through a
+    callback. Decisions are published to ``hub`` (a DecisionHub) when it has subscribers.
+    """
+    def __init__(self, repo=None, io_workers=None, hub=None):
+        self.repo = repo if repo is not None else FirewallRepository()
+        self.hub = hub
+        self.io_executor = ThreadPoolExecutor(max_workers=io_workers or settings.FIREWALL_IO_WORKERS,
+                                              thread_name_prefix="firewall-io")
+        # Captured packets are scored one batch at a time, since the model agent's FlowTable is not thread-safe.
+        self.model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="firewall-model")
+        self.queue = None
+        self.owner = None
+        self.cached_snapshot = None
+
+    async def start(self):
+        if self.owner is None:
+            self.queue = asyncio.Queue()
+            self.owner = asyncio.create_task(self._own())
+
+    async def stop(self):
+        if self.owner is not None:
+            self.queue.put_nowait(None)
+            await self.owner
+            self.owner = None
+        await asyncio.get_running_loop().run_in_executor(self.io_executor, self.repo.store.close)
+        self.io_executor.shutdown()
+        self.model_executor.shutdown()
+
+    async def _own(self):
+        while True:
+            mutations = [await self.queue.get()]
+            while not self.queue.empty():
+                mutations.append(self.queue.get_nowait())
+            stopping = False
+            for mutation in mutations:
+                if mutation is None:
+                    stopping = True
+                    continue
+                method, args, future = mutation
+                try:
+                    result = method(*args)
+                except Exception as e:
+                    if not future.cancelled():
+                        future.set_exception(e)
+                else:
+                    if not future.cancelled():
+                        future.set_result(result)
+            if stopping:
+                return
+
+    async def _mutate(self, method, *args):
+        await self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((method, args, future))
+        return await future
+
+    def _run_io(self, fn, *args, **kwargs):
+        return asyncio.get_running_loop().run_in_executor(self.io_executor, partial(fn, *args, **kwargs))
+
+    def _block_new(self, blocks):
+        # Runs on the owner task, so the already-blocked check cannot race another block.
+        blocks = [(ip, threat) for ip, threat in blocks if not self.repo.is_blocked(ip)]
+        return self.repo.block_ips(blocks) if blocks else None
+
+    async def snapshot(self):
+        snapshot = self.cached_snapshot
+        if snapshot is not None and snapshot.version == self.repo.version:
+            return snapshot
+        return await self._run_io(self._build_snapshot)
+
+    def _build_snapshot(self):
+        # Runs on the io executor: copying the blocked set is O(prefixes), and holding the
+        # store lock keeps it consistent with the version and summary taken with it.
+        store = self.repo.store
+        with store.lock:
+            snapshot = self.cached_snapshot
+            if snapshot is None or snapshot.version != store.version:
+                summary = store.summary()
+                snapshot = self.cached_snapshot = FirewallSnapshot(
+                    summary["version"], tuple(store.blocked_ips), summary)
+            return snapshot
+
+    def state_version(self):
+        return self.repo.version
+
+    def _publish(self, packet, response):
+        if self.hub is not None and self.hub.active:
+            self.hub.publish([decision_event(time.time(), packet.src_ip, packet.dst_ip, packet.protocol,
+                                             response["threat_detected"], response["threat_type"],
+                                             response["confidence"], response["action"], response["block_cidr"])])
+
+    async def analyze_packet(self, packet: Packet):
+        parse_address(packet.src_ip)
+        parse_address(packet.dst_ip)
+        started = time.perf_counter() if metrics.enabled else None
+        response = await self._analyze_packet(packet)
+        if started is not None:
+            ANALYZE_LATENCY.observe(time.perf_counter() - started)
+            PACKETS_DECIDED.inc()
+            count_decision(response["threat_type"])
+        return response
+
+    async def _analyze_packet(self, packet):
+        ip = packet.src_ip
+        blocked_by = self.repo.match(ip)
+        if blocked_by is not None:
+            response = dict(BLOCKED_SOURCE, threat_detected=True, block_cidr=blocked_by)
+            self._publish(packet, response)
+            return response
+        response = threat_response(score_packets([packet.dict()]).decision(0))
+
+        if response["threat_detected"]:
+            await self._mutate(self._block_new, [(ip, response)])
+
+        self._publish(packet, response)
+        return response
+
+    async def analyze_batch(self, records, start=0):
+        # Validation and scoring are CPU work off the loop; the blocks are one owner mutation.
+        started = time.perf_counter() if metrics.enabled else None
+        events = [] if self.hub is not None and self.hub.active else None
+        results, blocks = await asyncio.get_running_loop().run_in_executor(
+            None, decide_batch, records, start, self.repo.match, events)
+        if blocks:
+            await self._mutate(self._block_new, blocks)
+        if events:
+            self.hub.publish(events)
+        if started is not None:
+            BULK_LATENCY.observe(time.perf_counter() - started)
+            decided = [result["threat_type"] for result in results if "error" not in result]
+            PACKETS_DECIDED.inc(len(decided))
+            count_decisions(decided)
+        return results
+
+    async def analyze_capture(self, packets, model_agent):
+        """Score captured Packets with ``model_agent`` (see ``decide_packets``) and block the threats.
+
+        Scoring runs on the model executor; the blocks are one owner mutation.
+        """
+        started = time.perf_counter() if metrics.enabled else None
+        events = [] if self.hub is not None and self.hub.active else None
+        threat_types, blocks = await asyncio.get_running_loop().run_in_executor(
+            self.model_executor, decide_packets, packets, self.repo.match, model_agent, events)
+        if blocks:
+            await self._mutate(self._block_new, blocks)
+        if events:
+            self.hub.publish(events)
+        if started is not None:
+            CAPTURE_LATENCY.observe(time.perf_counter() - started)
+            PACKETS_DECIDED.inc(len(threat_types))
+            count_decisions(threat_types)
+        return threat_types
+
+    async def get_firewall_state(self, since=None, limit=1000, event=None, include_blocked=True):
+        snapshot = await self.snapshot()
+        page = await self._run_io(self.repo.state_page, after=since, limit=limit, event=event,
+                                  include_blocked=False, version=snapshot.version)
+        if include_blocked:
+            page["blocked_ips"] = list(snapshot.blocked_ips)
+        return page
+
+    async def get_state_summary(self):
+        return (await self.snapshot()).summary
+
+    async def query_events(self, ip=None, event=None, since=None, until=None, last=None, limit=1000):
+        if last is not None:
+            since = time.time() - last
+        return await self._run_io(self.repo.query_events, ip=ip, event=event, since=since, until=until,
+                                  limit=limit)
+
+    async def unblock_ip(self, ip):
+        return await self._mutate(self.repo.unblock_ip, ip)
+
+    async def unblock_all(self):
+        return await self._mutate(self.repo.unblock_all)
+
+    async def manual_block(self, ip, timeout=5.0):
+        handle = await self._mutate(self.repo.record_manual_block, ip)
+        if handle is not None and not await wait_for_commit(handle, durable=True, timeout=timeout):
+            return {"message": f"{ip} blocked manually; persistence still pending."}
+        return {"message": f"{ip} blocked manually."}
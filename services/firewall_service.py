@@ -1,32 +1,173 @@
-import random
+import json
+import time
 from datetime import datetime
 from models.packet import Packet
+from packet_batch import PacketBatch
 from repositories.firewall_repository import FirewallRepository
-from core.utils import get_threat
+from core.cidr_index import parse_address
+from core.config import settings
+from core.decision_hub import decision_event
+from core.utils import BLOCKED_SOURCE
+from threat_models import feature_matrix, model_for
+from use_case import ThreatDetector
+
+PACKET_FIELDS = {"src_ip": str, "dst_ip": str, "protocol": str, "port": int}
+
+def parse_bulk_packet(record):
+    """Validate one bulk record (JSON bytes or a dict) against the Packet fields without pydantic."""
+    item = json.loads(record) if isinstance(record, (bytes, str)) else record
+    if not isinstance(item, dict):
+        raise ValueError("record is not a JSON object")
+    for field, field_type in PACKET_FIELDS.items():
+        value = item.get(field)
+        if not isinstance(value, field_type) or isinstance(value, bool):
+            raise ValueError(f"{field} must be a {field_type.__name__}")
+    parse_address(item["src_ip"])
+    parse_address(item["dst_ip"])
+    return item
+
+# API packets are scored by the configured DETECTOR_MODEL, like the capture path. They carry
+# no timestamps or flow history, so only the packet columns of the feature matrix are set.
+detector = ThreatDetector(model=model_for(settings.DETECTOR_MODEL))
+
+def score_packets(packets):
+    """Score validated packet dicts (src_ip, dst_ip, protocol, port) in one ``evaluate_batch`` call."""
+    batch = PacketBatch(max(len(packets), 1))
+    now = time.time()
+    for packet in packets:
+        batch.append(packet["src_ip"], packet["dst_ip"], packet["protocol"], 0, now, dst_port=packet["port"])
+    return detector.evaluate_batch(feature_matrix(batch), [packet["src_ip"] for packet in packets])
+
+def threat_response(decision):
+    # analyze_packet response fields for one ThreatDecision.
+    return {
+        "threat_detected": decision.threat_detected,
+        "threat_type": decision.threat_type,
+        "confidence": decision.confidence,
+        "action": decision.action,
+        "block_cidr": decision.block_cidr
+    }
+
+def decide_batch(records, start, match, events=None):
+    """Validate and score a batch of bulk records without touching the repository.
+
+    Returns ``(results, blocks)``: one result per record, in order (the ``analyze_packet``
+    response plus the record's ``index`` in the stream, or ``{"index", "error"}`` if it
+    failed validation), and the (ip, threat) pairs to block. ``match`` is the repository's
+    blocked-prefix lookup. If ``events`` is a list, a DecisionHub event is appended to it
+    for every valid record.
+    """
+    now = time.time()
+    results = [None] * len(records)
+    valid = []
+    for i, record in enumerate(records):
+        try:
+            valid.append((i, parse_bulk_packet(record)))
+        except ValueError as e:
+            results[i] = {"index": start + i, "error": str(e)}
+    blocked_by = {}
+    blocks = {}
+    decisions = score_packets([packet for _, packet in valid]) if valid else None
+    for j, (i, packet) in enumerate(valid):
+        ip = packet["src_ip"]
+        if ip not in blocked_by:
+            blocked_by[ip] = match(ip)
+        if blocked_by[ip] is not None:
+            results[i] = dict(BLOCKED_SOURCE, index=start + i, threat_detected=True, block_cidr=blocked_by[ip])
+        else:
+            decision = decisions.decision(j)
+            results[i] = dict(threat_response(decision), index=start + i)
+            if decision.threat_detected:
+                blocks.setdefault(ip, results[i])
+        if events is not None:
+            result = results[i]
+            events.append(decision_event(now, ip, packet["dst_ip"], packet["protocol"], result["threat_detected"],
+                                         result["threat_type"], result["confidence"], result["action"],
+                                         result["block_cidr"]))
+    return results, list(blocks.items())
+
+def decide_packets(packets, match, model_agent, events=None):
+    """Score captured Packets with ``model_agent``: the configured model over its FlowTable's rates.
+
+    The capture counterpart of ``decide_batch``; sources inside a blocked prefix are not
+    scored. Returns ``(threat_types, blocks)``: the threat type of every parsable packet, in
+    order, and the (ip, threat) pairs to block. If ``events`` is a list, a DecisionHub event
+    is appended to it for every parsable packet.
+    """
+    batch = PacketBatch.from_packets(packets)
+    if not len(batch):
+        return [], []
+    src_ips = batch.src_ips()
+    blocked_by = {ip: match(ip) for ip in set(src_ips)}
+    responses = [None] * len(src_ips)
+    rows = []
+    for i, ip in enumerate(src_ips):
+        if blocked_by[ip] is not None:
+            responses[i] = dict(BLOCKED_SOURCE, threat_detected=True, block_cidr=blocked_by[ip])
+        else:
+            rows.append(i)
+    blocks = {}
+    if rows:
+        scored = batch if len(rows) == len(src_ips) else batch.take(rows)
+        decisions = model_agent.analyze_batch(scored, [src_ips[i] for i in rows])
+        for j, i in enumerate(rows):
+            response = responses[i] = threat_response(decisions.decision(j))
+            if response["threat_detected"]:
+                blocks.setdefault(src_ips[i], response)
+    if events is not None:
+        now = time.time()
+        columns = batch.columns
+        name_for = batch.protocols.name_for
+        for response, src_ip, dst_ip, protocol in zip(responses, src_ips, batch.dst_ips(),
+                                                      columns["protocol"].tolist()):
+            events.append(decision_event(now, src_ip, dst_ip, name_for(protocol), response["threat_detected"],
+                                         response["threat_type"], response["confidence"], response["action"],
+                                         response["block_cidr"]))
+    return [response["threat_type"] for response in responses], list(blocks.items())
 
 class FirewallService:
-    def __init__(self):
-        self.repo = FirewallRepository()
+    def __init__(self, repo=None):
+        self.repo = repo if repo is not None else FirewallRepository()
 
     def analyze_packet(self, packet: Packet):
         ip = packet.src_ip
-        threat = get_threat()
-
-        response = {
-            "threat_detected": threat["action"] == "BLOCK",
-            "threat_type": threat["threat_type"],
-            "confidence": threat["confidence"],
-            "action": threat["action"],
-            "block_cidr": f"{ip}/32" if threat["action"] == "BLOCK" else None
-        }
+        parse_address(ip)
+        parse_address(packet.dst_ip)
+        blocked_by = self.repo.match(ip)
+        if blocked_by is not None:
+            return dict(BLOCKED_SOURCE, threat_detected=True, block_cidr=blocked_by)
+        response = threat_response(score_packets([packet.dict()]).decision(0))
 
-        if response["threat_detected"] and ip not in self.repo.data["blocked_ips"]:
-            self.repo.block_ip(ip, threat)
+        if response["threat_detected"] and not self.repo.is_blocked(ip):
+            self.repo.block_ip(ip, response)
 
         return response
 
-    def get_firewall_state(self):
-        return self.repo.data
+    def analyze_batch(self, records, start=0):
+        """Validate and analyze a batch of bulk records (see ``decide_batch``).
+
+        The blocks found in the batch are persisted in a single commit.
+        """
+        results, blocks = decide_batch(records, start, self.repo.match)
+        if blocks:
+            self.repo.block_ips(blocks)
+        return results
+
+    def get_firewall_state(self, since=None, limit=1000, event=None, include_blocked=True):
+        # ``since`` is the ``next`` cursor of the previous page; without it the newest entries are returned.
+        return self.repo.state_page(after=since, limit=limit, event=event, include_blocked=include_blocked)
+
+    def get_state_summary(self):
+        return self.repo.summary()
+
+    def state_version(self):
+        return self.repo.version
+
+    def query_events(self, ip=None, event=None, since=None, until=None, last=None, limit=1000):
+        # ``last`` is a window in seconds ending now, e.g. last=3600 for the past hour.
+        if last is not None:
+            since = time.time() - last
+        return self.repo.query_events(ip=ip, event=event, since=since, until=until, limit=limit)
 
     def unblock_ip(self, ip):
         return self.repo.unblock_ip(ip)
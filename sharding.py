@@ -0,0 +1,235 @@
+import multiprocessing
+import queue
+import threading
+import zlib
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from agent_entities import model_agent_from_settings
+from core.event_log import event_log
+from packet_batch import PACKET_DTYPE, PROTOCOLS, PacketBatch
+
+
+def shard_for(src_ip, num_shards):
+    """Stable shard index for a source IP, identical across processes and restarts."""
+    return zlib.crc32(src_ip.encode()) % num_shards
+
+
+def _score(model_agent, buffer, batch_size, offset, count):
+    # Views into the shared ring only live for this call, so the slot can be reused afterwards.
+    batch = PacketBatch.from_buffer(buffer, batch_size, offset=offset, size=count)
+    src_ips = batch.src_ips()
+    decisions = model_agent.analyze_batch(batch, src_ips)
+    detected = decisions.threat_detected.nonzero()[0].tolist()
+    if not detected:
+        return []
+    columns = batch.columns
+    dst_ips = batch.dst_ips()
+    verdicts = []
+    for i in detected:
+        row = columns[i]
+        flow = (src_ips[i], dst_ips[i], batch.protocols.name_for(int(row["protocol"])),
+                int(row["src_port"]) or None, int(row["dst_port"]) or None)
+        verdicts.append((src_ips[i], flow, decisions.decision(i)))
+    return verdicts
+
+
+def _shard_worker(shm_name, slots, batch_size, inbox, free_slots, results, agent_factory):
+    """Worker process: read batches from its shared-memory ring and run detection."""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    model_agent = agent_factory()
+    slot_bytes = batch_size * PACKET_DTYPE.itemsize
+    try:
+        while True:
+            message = inbox.get()
+            if message is None:
+                break
+            if message[0] == "protocol":
+                PROTOCOLS.register(message[1], message[2])
+                continue
+            _, slot, count = message
+            try:
+                verdicts = _score(model_agent, shm.buf, batch_size, slot * slot_bytes, count)
+            except Exception as e:
+                # One bad batch must not end the worker, or its shard stops being scored.
+                event_log.error("shard.batch_failed", packets=count, error=str(e))
+                verdicts = []
+            finally:
+                # The slot can be refilled as soon as the batch has been scored.
+                free_slots.put(slot)
+            results.put((count, verdicts))
+    finally:
+        shm.close()
+
+
+class ShardedProcessor:
+    """Hash-partitions packets by source IP across worker processes.
+
+    Every packet from a given source lands on the same worker, so the per-source state in
+    the worker's FlowTable stays local to that process. Each worker builds its ModelAgent
+    with ``agent_factory`` (by default the configured DETECTOR_MODEL and FlowTable).
+
+    The parent screens each batch with the ManagerAgent first: rows from blocked prefixes,
+    threat intel hits and cached verdicts are decided there, as on the in-process path, and
+    only the rest is shipped. Batches are written as ``PacketBatch`` rows into one
+    shared-memory ring per worker (only the slot index is sent over the queue), and block
+    verdicts come back to a single writer thread that caches them and blocks through the
+    ManagerAgent. A worker found dead while the parent waits for one of its slots is
+    replaced, and the batches it held are counted in ``lost``.
+    """
+    def __init__(self, manager_agent, num_workers=None, batch_size=1024, slots_per_worker=8,
+                 agent_factory=model_agent_from_settings, slot_timeout=1.0):
+        self.manager_agent = manager_agent
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.batch_size = batch_size
+        self.slots_per_worker = slots_per_worker
+        self.agent_factory = agent_factory
+        self.slot_timeout = slot_timeout
+        self.context = multiprocessing.get_context("spawn")
+        self.shards = []
+        self.pending = [[] for _ in range(self.num_workers)]
+        self.pending_rows = [0] * self.num_workers
+        self.announced_protocols = 0
+        self.results = None
+        self.writer = None
+        self.shipped = [0] * self.num_workers
+        self.scored = 0
+        self.blocked = 0
+        self.lost = 0
+        self.restarts = 0
+
+    def start(self):
+        self.results = self.context.Queue()
+        self.shards = [self._spawn() for _ in range(self.num_workers)]
+        self.writer = threading.Thread(target=self._write_decisions, daemon=True)
+        self.writer.start()
+
+    def _spawn(self):
+        slot_bytes = self.batch_size * PACKET_DTYPE.itemsize
+        shm = shared_memory.SharedMemory(create=True, size=slot_bytes * self.slots_per_worker)
+        inbox = self.context.Queue()
+        free_slots = self.context.Queue()
+        for slot in range(self.slots_per_worker):
+            free_slots.put(slot)
+        # A replacement worker learns every protocol id announced so far before its first batch.
+        for offset, name in enumerate(PROTOCOLS.dynamic[:self.announced_protocols]):
+            inbox.put(("protocol", 256 + offset, name))
+        process = self.context.Process(
+            target=_shard_worker,
+            args=(shm.name, self.slots_per_worker, self.batch_size, inbox, free_slots, self.results,
+                  self.agent_factory),
+            daemon=True
+        )
+        process.start()
+        return {"shm": shm, "inbox": inbox, "free_slots": free_slots, "process": process}
+
+    def submit(self, packets):
+        """Screen packets, then partition the rest by source IP, shipping every shard batch that fills up."""
+        batch = PacketBatch.from_packets(packets)
+        if batch.rejected:
+            event_log.warning("batch.rejected_packets", count=len(batch.rejected))
+        src_ips = batch.src_ips()
+        decisions, _ = self.manager_agent.screen_batch(batch, src_ips)
+        rows_by_shard = {}
+        num_workers = self.num_workers
+        for i, decision in enumerate(decisions):
+            if decision is None:
+                rows_by_shard.setdefault(shard_for(src_ips[i], num_workers), []).append(i)
+        columns = batch.columns
+        for shard, rows in rows_by_shard.items():
+            self.pending[shard].append(columns[rows])
+            self.pending_rows[shard] += len(rows)
+            if self.pending_rows[shard] >= self.batch_size:
+                self._ship(shard)
+
+    def flush(self):
+        """Ship every partially filled shard batch."""
+        for shard, rows in enumerate(self.pending_rows):
+            if rows:
+                self._ship(shard)
+
+    def _announce_protocols(self):
+        # Workers learn dynamically assigned protocol ids before any row that uses them.
+        dynamic = PROTOCOLS.dynamic
+        while self.announced_protocols < len(dynamic):
+            protocol_id = 256 + self.announced_protocols
+            for shard in self.shards:
+                shard["inbox"].put(("protocol", protocol_id, dynamic[self.announced_protocols]))
+            self.announced_protocols += 1
+
+    def _free_slot(self, shard_index):
+        # Waits while the worker still holds every slot, which backpressures the caller,
+        # but checks that the worker is alive every ``slot_timeout`` seconds.
+        while True:
+            shard = self.shards[shard_index]
+            try:
+                return shard, shard["free_slots"].get(timeout=self.slot_timeout)
+            except queue.Empty:
+                if shard["process"].is_alive():
+                    continue
+            lost = self.slots_per_worker - shard["free_slots"].qsize()
+            event_log.error("shard.worker_died", shard=shard_index, exitcode=shard["process"].exitcode,
+                            lost_batches=lost)
+            self.lost += lost
+            self.restarts += 1
+            shard["shm"].close()
+            shard["shm"].unlink()
+            self.shards[shard_index] = self._spawn()
+
+    def _ship(self, shard_index):
+        rows = np.concatenate(self.pending[shard_index])
+        self.pending[shard_index] = []
+        self.pending_rows[shard_index] = 0
+        self._announce_protocols()
+        slot_rows = self.batch_size
+        for start in range(0, len(rows), slot_rows):
+            chunk = rows[start:start + slot_rows]
+            shard, slot = self._free_slot(shard_index)
+            offset = slot * slot_rows * PACKET_DTYPE.itemsize
+            ring = np.ndarray((slot_rows,), PACKET_DTYPE, buffer=shard["shm"].buf, offset=offset)
+            ring[:len(chunk)] = chunk
+            del ring
+            shard["inbox"].put(("batch", slot, len(chunk)))
+            self.shipped[shard_index] += len(chunk)
+
+    def _write_decisions(self):
+        while True:
+            result = self.results.get()
+            if result is None:
+                break
+            count, verdicts = result
+            self.scored += count
+            if verdicts:
+                try:
+                    self.manager_agent.apply_verdicts(verdicts)
+                except Exception as e:
+                    event_log.error("shard.block_failed", blocks=len(verdicts), error=str(e))
+                    continue
+                self.blocked += len(verdicts)
+
+    def stop(self, timeout=10.0):
+        self.flush()
+        for shard in self.shards:
+            shard["inbox"].put(None)
+        for shard in self.shards:
+            shard["process"].join(timeout)
+            if shard["process"].is_alive():
+                shard["process"].terminate()
+                shard["process"].join()
+            shard["shm"].close()
+            shard["shm"].unlink()
+        self.results.put(None)
+        self.writer.join()
+        self.shards = []
+
+    def stats(self):
+        return {
+            "workers": self.num_workers,
+            "packets_per_shard": list(self.shipped),
+            "scored": self.scored,
+            "blocked": self.blocked,
+            "lost": self.lost,
+            "restarts": self.restarts,
+            "alive": [shard["process"].is_alive() for shard in self.shards],
+        }
@@ -0,0 +1,24 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Settings read .env and the stores default to paths under the working directory, so the
+# tests run from a scratch directory rather than the checkout.
+WORKDIR = tempfile.mkdtemp(prefix="packet-analyzer-tests-")
+os.makedirs(os.path.join(WORKDIR, "data"))
+os.chdir(WORKDIR)
+
+
+@pytest.fixture(scope="session")
+def client():
+    # The FastAPI lifespan stops the firewall service for good, so one client serves every test.
+    from fastapi.testclient import TestClient
+    from main import app
+
+    with TestClient(app) as client:
+        yield client
@@ -0,0 +1,44 @@
+"""Builders for small synthetic captures used by the decoder and replay tests."""
+import socket
+import struct
+
+
+def ipv4_tcp_frame(src_ip, dst_ip, src_port=1234, dst_port=80, flags=0x02, payload=b""):
+    tcp = struct.pack("!HHIIBBHHH", src_port, dst_port, 0, 0, 5 << 4, flags, 65535, 0, 0) + payload
+    ip = struct.pack("!BBHHHBBH4s4s", 0x45, 0, 20 + len(tcp), 0, 0, 64, 6, 0,
+                     socket.inet_aton(src_ip), socket.inet_aton(dst_ip))
+    return b"\x00" * 12 + b"\x08\x00" + ip + tcp
+
+
+def ipv6_udp_frame(src_ip, dst_ip, src_port=5353, dst_port=53):
+    udp = struct.pack("!HHHH", src_port, dst_port, 8, 0)
+    ip = struct.pack("!IHBB16s16s", 6 << 28, len(udp), 17, 64, socket.inet_pton(socket.AF_INET6, src_ip),
+                     socket.inet_pton(socket.AF_INET6, dst_ip))
+    return b"\x00" * 12 + b"\x86\xdd" + ip + udp
+
+
+def pcap_bytes(frames, start=1700000000.0, step=0.001):
+    data = bytearray(struct.pack("<IHHiIII", 0xA1B2C3D4, 2, 4, 0, 0, 65535, 1))
+    for i, frame in enumerate(frames):
+        ts = start + i * step
+        data += struct.pack("<IIII", int(ts), round((ts % 1) * 1e6), len(frame), len(frame)) + frame
+    return bytes(data)
+
+
+def _block(block_type, body):
+    body += b"\x00" * (-len(body) % 4)
+    length = len(body) + 12
+    return struct.pack("<II", block_type, length) + body + struct.pack("<I", length)
+
+
+def pcapng_bytes(frames, start=1700000000.0, step=0.001, dropped=None):
+    data = bytearray(_block(0x0A0D0D0A, struct.pack("<IHHq", 0x1A2B3C4D, 1, 0, -1)))
+    # Nanosecond timestamps (if_tsresol = 9).
+    data += _block(0x00000001, struct.pack("<HHI", 1, 0, 65535) + struct.pack("<HHB3x", 9, 1, 9) + b"\x00" * 4)
+    for i, frame in enumerate(frames):
+        ts = round((start + i * step) * 1e9)
+        data += _block(0x00000006, struct.pack("<IIIII", 0, ts >> 32, ts & 0xFFFFFFFF, len(frame), len(frame)) + frame)
+    if dropped is not None:
+        options = struct.pack("<HHQ", 4, 8, len(frames)) + struct.pack("<HHQ", 5, 8, dropped) + b"\x00" * 4
+        data += _block(0x00000005, struct.pack("<III", 0, 0, 0) + options)
+    return bytes(data)
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+import pytest
+
+from repositories.firewall_repository import FirewallRepository, create_store
+from services.async_firewall_service import AsyncFirewallService, wait_for_commit
+
+
+@pytest.fixture
+def service(tmp_path):
+    return AsyncFirewallService(FirewallRepository(create_store("journal", str(tmp_path / "state.json"))),
+                                io_workers=1)
+
+
+def test_owner_task_applies_mutations_in_submission_order(service):
+    async def run():
+        results = await asyncio.gather(
+            service.manual_block("10.0.0.1"),
+            service.unblock_ip("10.0.0.1"),
+            service.manual_block("10.0.0.2"),
+            service.unblock_ip("10.0.0.9"),
+            service.manual_block("10.0.0.1"),
+            return_exceptions=True,
+        )
+        state = await service.get_firewall_state()
+        await service.stop()
+        return results, state
+
+    results, state = asyncio.run(run())
+    # The unblock of an address that was never blocked fails alone; the rest still apply in order.
+    assert isinstance(results[3], ValueError)
+    assert [(entry["event"], entry["ip"]) for entry in state["log"]] == [
+        ("Manually Blocked IP", "10.0.0.1"), ("Unblocked IP", "10.0.0.1"), ("Manually Blocked IP", "10.0.0.2"),
+        ("Manually Blocked IP", "10.0.0.1")]
+    assert sorted(state["blocked_ips"]) == ["10.0.0.1", "10.0.0.2"]
+
+
+def test_snapshot_is_built_off_the_loop_once_per_version(service, monkeypatch):
+    threads = []
+    build = service._build_snapshot
+
+    def recording_build():
+        threads.append(threading.current_thread().name)
+        return build()
+
+    monkeypatch.setattr(service, "_build_snapshot", recording_build)
+
+    async def run():
+        first = await service.snapshot()
+        again = await service.snapshot()
+        await service.manual_block("10.0.0.0/24")
+        changed = await service.get_state_summary()
+        await service.stop()
+        return first, again, changed
+
+    first, again, changed = asyncio.run(run())
+    assert again is first and first.blocked_ips == ()
+    assert changed["version"] == first.version + 1 and changed["blocked_prefixes"] == 1
+    assert len(threads) == 2 and all(name.startswith("firewall-io") for name in threads)
+
+
+class NeverCommitted:
+    def add_callback(self, fn, durable=False):
+        pass
+
+
+def test_wait_for_commit(service):
+    async def run():
+        handle = service.repo.record_manual_block("10.0.0.1")
+        committed = await wait_for_commit(handle, durable=True, timeout=5)
+        timed_out = await wait_for_commit(NeverCommitted(), timeout=0.05)
+        await service.stop()
+        return committed, timed_out
+
+    assert asyncio.run(run()) == (True, False)
@@ -0,0 +1,148 @@
+import asyncio
+import sys
+import threading
+
+import async_runtime
+from agent_entities import ModelAgent
+from async_runtime import AsyncCapture, AsyncRuntime, service_handler
+from domain import Packet
+from pcap_decoder import CaptureDecoder
+from pcap_files import ipv4_tcp_frame, pcap_bytes
+from repositories.firewall_repository import FirewallRepository, create_store
+from services.async_firewall_service import AsyncFirewallService
+from threat_models import RuleModel
+from use_case import ThreatDetector
+
+
+def _writer(data):
+    # A stand-in capture process that writes ``data`` to stdout in small pieces.
+    return [sys.executable, "-c",
+            "import sys\n"
+            f"data = {data!r}\n"
+            "for i in range(0, len(data), 7):\n"
+            "    sys.stdout.buffer.write(data[i:i + 7]); sys.stdout.flush()\n"]
+
+
+async def _collect(capture):
+    packets = []
+
+    async def deliver(chunk):
+        packets.extend(chunk)
+
+    code = await capture.run(deliver)
+    return code, packets
+
+
+def test_fields_feed():
+    capture = AsyncCapture(chunk_size=16)
+    capture.spec.command = lambda: _writer(b"10.0.0.1\t10.0.0.2\tTCP\t60\t1700000000.5\n"
+                                           b"bad line\n"
+                                           b"10.0.0.3\t10.0.0.4\tUDP\t80\t1700000001.0")
+    code, packets = asyncio.run(_collect(capture))
+    assert code == 0
+    assert [(p.src_ip, p.protocol, p.data["length"], p.ts) for p in packets] == [
+        ("10.0.0.1", "TCP", "60", 1700000000.5), ("10.0.0.3", "UDP", "80", 1700000001.0)]
+
+
+def test_pcap_feed_decodes_off_the_loop(monkeypatch):
+    threads = set()
+
+    class RecordingDecoder(CaptureDecoder):
+        def feed(self, chunk):
+            threads.add(threading.current_thread())
+            return super().feed(chunk)
+
+    monkeypatch.setattr(async_runtime, "CaptureDecoder", RecordingDecoder)
+    frames = [ipv4_tcp_frame("10.0.0.%d" % i, "10.0.0.99", dst_port=22) for i in range(1, 6)]
+    capture = AsyncCapture(capture_format="pcap", chunk_size=32)
+    capture.spec.command = lambda: _writer(pcap_bytes(frames))
+    code, packets = asyncio.run(_collect(capture))
+    assert code == 0
+    assert [packet.src_ip for packet in packets] == ["10.0.0.%d" % i for i in range(1, 6)]
+    assert threads and threading.main_thread() not in threads
+
+
+class ScriptedCapture:
+    """Delivers ``batches`` and then waits, like a capture process, until ``terminate``."""
+    def __init__(self, batches):
+        self.batches = batches
+        self.done = None
+
+    async def run(self, deliver):
+        self.done = asyncio.Event()
+        batches, self.batches = self.batches, []
+        for packets in batches:
+            await deliver(packets)
+        await self.done.wait()
+        return 0
+
+    def terminate(self):
+        if self.done is not None:
+            self.done.set()
+
+
+def _packets(count, dst_port=80):
+    return [Packet("10.1.0.%d" % (i % 250 + 1), "10.0.0.1", "TCP", {"length": 60, "dst_port": dst_port})
+            for i in range(count)]
+
+
+def test_consumers_merge_queued_lists_up_to_batch_size():
+    sizes = []
+
+    async def handler(batch):
+        sizes.append(len(batch))
+
+    async def run():
+        runtime = AsyncRuntime(handler, batch_size=100)
+        runtime.capture = ScriptedCapture([_packets(30) for _ in range(10)])
+        await runtime.start()
+        while runtime.processed < 300:
+            await asyncio.sleep(0.01)
+        await runtime.stop()
+        return runtime.stats()
+
+    stats = asyncio.run(run())
+    assert sizes == [120, 120, 60]
+    assert (stats["captured"], stats["processed"], stats["batches"]) == (300, 300, 3)
+
+
+def test_stop_drains_queued_batches_and_cancels_stuck_ones():
+    async def slow(batch):
+        await asyncio.sleep(0.01)
+
+    async def stuck(batch):
+        await asyncio.Event().wait()
+
+    async def run(handler, drain_timeout):
+        runtime = AsyncRuntime(handler, batch_size=10)
+        runtime.capture = ScriptedCapture([_packets(10) for _ in range(20)])
+        await runtime.start()
+        await asyncio.sleep(0)
+        await runtime.stop(drain_timeout)
+        return runtime.stats()
+
+    drained = asyncio.run(run(slow, 5.0))
+    assert (drained["processed"], drained["batches"], drained["queued"]) == (200, 20, 0)
+    cancelled = asyncio.run(run(stuck, 0.1))
+    assert cancelled["processed"] == 0 and cancelled["queued"] > 0
+
+
+def test_service_handler_scores_with_the_model_agent(tmp_path):
+    repo = FirewallRepository(create_store("journal", str(tmp_path / "state.json")))
+    service = AsyncFirewallService(repo, io_workers=1)
+    # Port 22 is flagged as SSH brute force; everything else is normal traffic.
+    model_agent = ModelAgent(ThreatDetector(model=RuleModel([(3, [("dst_port", "==", 22)])], default_class=6)))
+    handler = service_handler(service, model_agent)
+
+    async def run():
+        await handler(_packets(3, dst_port=22) + [Packet("10.2.0.1", "10.0.0.1", "TCP", {"length": 60})])
+        threat_types = await service.analyze_capture(_packets(2, dst_port=22), model_agent)
+        blocked = (await service.snapshot()).blocked_ips
+        await service.stop()
+        return threat_types, blocked
+
+    threat_types, blocked = asyncio.run(run())
+    # The second batch comes from sources blocked by the first and is not scored again.
+    assert threat_types == ["Blocked Source (Firewall Rule)"] * 2
+    # 10.1.0.2 and 10.1.0.3 are merged into one prefix; 10.2.0.1 was normal traffic.
+    assert sorted(blocked) == ["10.1.0.1", "10.1.0.2/31"]
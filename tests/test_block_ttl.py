@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+from repositories.block_ttl import HOUR, BlockTtlPolicy
+from repositories.journal import JournaledFirewallState
+
+SYN_FLOOD = "TCP SYN Flood Attack"
+
+
+def _block(ip, confidence="High", reason=SYN_FLOOD):
+    return {"event": "Blocked IP", "ip": ip, "reason": reason, "confidence": confidence, "action": "BLOCK",
+            "timestamp": "2024-01-01T00:00:00Z"}
+
+
+def test_policy_ttls():
+    policy = BlockTtlPolicy(escalation=4.0, max_ttl=10 * HOUR, permanent_after=4)
+    assert policy.ttl(_block("10.0.0.1")) == HOUR
+    assert policy.ttl(_block("10.0.0.1", confidence="Low")) == HOUR / 4
+    assert policy.ttl(_block("10.0.0.1", reason="Something new")) == policy.default_ttl
+    assert policy.ttl(_block("10.0.0.1"), offense=2) == 4 * HOUR
+    assert policy.ttl(_block("10.0.0.1"), offense=3) == 10 * HOUR
+    assert policy.ttl(_block("10.0.0.1"), offense=4) is None
+    manual = {"event": "Manually Blocked IP", "ip": "10.0.0.1"}
+    assert policy.ttl(manual) is None
+    assert BlockTtlPolicy(manual_ttl=60).ttl(manual) == 60
+
+
+def test_blocks_expire_and_escalate(tmp_path):
+    policy = BlockTtlPolicy(ttls={SYN_FLOOD: 100}, escalation=2.0)
+    store = JournaledFirewallState(str(tmp_path / "state.json"), ttl_policy=policy)
+    now = time.time()
+    entry = _block("10.0.0.1")
+    store.record(entry)
+    assert entry["offense"] == 1
+    assert entry["expires_at"] == pytest.approx(now + 100, abs=5)
+    assert store.expire_due(now + 50) == 0
+    assert store.expire_due(now + 110) == 1
+    assert not store.is_blocked("10.0.0.1")
+    expired = store.state()["log"][-1]
+    assert (expired["event"], expired["ip"], expired["offense"]) == ("Expired IP", "10.0.0.1", 1)
+
+    # Blocked again within offense_memory: the second offense lasts twice as long.
+    entry = _block("10.0.0.1")
+    store.record(entry)
+    assert entry["offense"] == 2
+    assert entry["expires_at"] == pytest.approx(now + 200, abs=5)
+    store.close()
+
+
+def test_pending_expirations_survive_restart(tmp_path):
+    path = str(tmp_path / "state.json")
+    policy = BlockTtlPolicy(ttls={SYN_FLOOD: 100})
+    store = JournaledFirewallState(path, ttl_policy=policy)
+    store.record(_block("10.0.0.1"))
+    store.record({"event": "Manually Blocked IP", "ip": "10.0.0.2"})
+    store.close()
+    store = JournaledFirewallState(path, ttl_policy=policy)
+    assert store.summary()["expiring_blocks"] == 1
+    assert store.expire_due(time.time() + 110) == 1
+    assert list(store.blocked_ips) == ["10.0.0.2"]
+    store.close()
+
+
+def test_policy_follows_settings(monkeypatch):
+    from core.config import settings
+    from repositories.firewall_repository import block_ttl_policy
+
+    monkeypatch.setattr(settings, "BLOCK_TTL_BY_THREAT", {SYN_FLOOD: 120.0})
+    monkeypatch.setattr(settings, "BLOCK_TTL_ESCALATION", 2.0)
+    policy = block_ttl_policy()
+    assert policy.ttl(_block("10.0.0.1")) == 120.0
+    assert policy.ttl(_block("10.0.0.1"), offense=2) == 240.0
+    monkeypatch.setattr(settings, "BLOCK_TTL_ENABLED", False)
+    assert block_ttl_policy() is None
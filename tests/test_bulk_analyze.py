@@ -0,0 +1,40 @@
+import json
+
+
+def _ndjson(records):
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+
+def test_bulk_results_carry_stream_indexes(client):
+    records = [{"src_ip": f"10.1.{i // 256}.{i % 256}", "dst_ip": "10.0.0.1", "protocol": "TCP", "port": 80}
+               for i in range(25)]
+    records[3] = {"src_ip": "10.0.0.0/8", "dst_ip": "10.0.0.1", "protocol": "TCP", "port": 80}
+    response = client.post("/firewall/analyze/bulk", content=_ndjson(records),
+                           headers={"content-type": "application/x-ndjson"})
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result["index"] for result in results] == list(range(len(records)))
+    assert all(isinstance(result["index"], int) for result in results)
+    assert "error" in results[3]
+
+
+def test_bulk_is_scored_by_the_detector(client, monkeypatch):
+    from services import firewall_service
+    from threat_models import RuleModel
+    from use_case import ThreatDetector
+
+    # Port 22 is flagged as SSH brute force; everything else is normal traffic.
+    monkeypatch.setattr(firewall_service, "detector",
+                        ThreatDetector(model=RuleModel([(3, [("dst_port", "==", 22)])], default_class=6)))
+    records = [{"src_ip": "10.2.0.%d" % i, "dst_ip": "10.0.0.1", "protocol": "TCP", "port": 22 if i % 2 else 80}
+               for i in range(1, 7)]
+    records.append({"src_ip": "10.2.0.9", "dst_ip": "not-an-ip", "protocol": "TCP", "port": 22})
+    response = client.post("/firewall/analyze/bulk", content=_ndjson(records),
+                           headers={"content-type": "application/x-ndjson"})
+    results = [json.loads(line) for line in response.text.splitlines()]
+    assert [result.get("action") for result in results] == ["BLOCK", "ALLOW"] * 3 + [None]
+    assert results[0]["threat_type"] == "Suspicious SSH Brute Force"
+    assert results[0]["block_cidr"] == "10.2.0.1/32"
+    assert "error" in results[-1]
+    blocked = client.get("/firewall/state", params={"limit": 1}).json()["blocked_ips"]
+    assert {"10.2.0.1", "10.2.0.3", "10.2.0.5"} <= set(blocked)
@@ -0,0 +1,66 @@
+import asyncio
+import struct
+
+import pytest
+
+from core.bulk_codec import RecordReader, aiter_batches, framing_for, iter_batches
+
+
+def _frame(payload):
+    return struct.pack("!I", len(payload)) + payload
+
+
+def test_framing_from_content_type():
+    assert framing_for("application/octet-stream; charset=binary") == "length-prefixed"
+    assert framing_for("application/x-ndjson") == "ndjson"
+    assert framing_for(None) == "ndjson"
+
+
+def test_ndjson_records_split_across_chunks():
+    reader = RecordReader("ndjson")
+    assert reader.feed(b'{"a": 1}\n{"b"') == [b'{"a": 1}']
+    assert reader.feed(b': 2}\n\n{"c": 3}') == [b'{"b": 2}']
+    assert reader.finish() == [b'{"c": 3}']
+
+
+def test_length_prefixed_records_split_across_chunks():
+    body = _frame(b'{"a": 1}') + _frame(b'{"b": 2}')
+    reader = RecordReader("length-prefixed")
+    records = []
+    for i in range(0, len(body), 3):
+        records += reader.feed(body[i:i + 3])
+    assert records + reader.finish() == [b'{"a": 1}', b'{"b": 2}']
+
+
+def test_truncated_frame_is_an_error():
+    reader = RecordReader("length-prefixed")
+    reader.feed(_frame(b'{"a": 1}')[:-2])
+    with pytest.raises(ValueError):
+        reader.finish()
+
+
+def test_oversized_record_is_an_error():
+    with pytest.raises(ValueError):
+        RecordReader("ndjson", max_record_bytes=8).feed(b'{"a": "0123456789"}')
+    with pytest.raises(ValueError):
+        RecordReader("length-prefixed", max_record_bytes=8).feed(_frame(b'{"a": "0123456789"}'))
+
+
+def test_batches_keep_records_before_an_error():
+    chunks = [b"1\n2\n3\n4\n5\n", b"x" * 20]
+    batches = iter_batches(chunks, "ndjson", batch_size=2, max_record_bytes=8)
+    assert [next(batches), next(batches), next(batches)] == [[b"1", b"2"], [b"3", b"4"], [b"5"]]
+    with pytest.raises(ValueError):
+        next(batches)
+
+
+def test_async_batches_of_length_prefixed_records():
+    async def chunks():
+        body = b"".join(_frame(b"%d" % i) for i in range(5))
+        for i in range(0, len(body), 4):
+            yield body[i:i + 4]
+
+    async def collect():
+        return [batch async for batch in aiter_batches(chunks(), "length-prefixed", batch_size=2)]
+
+    assert asyncio.run(collect()) == [[b"0", b"1"], [b"2", b"3"], [b"4"]]
@@ -0,0 +1,134 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import capture_supervisor
+from capture_supervisor import CaptureSupervisor
+from domain import Packet
+
+WARM_UP = "192.0.2.250"
+
+
+class ListQueue:
+    def __init__(self):
+        self.packets = []
+        self.lock = threading.Lock()
+
+    def put(self, packet, block=True, timeout=None):
+        with self.lock:
+            self.packets.append(packet)
+        return True
+
+    def put_many(self, packets, block=True, timeout=None):
+        with self.lock:
+            self.packets.extend(packets)
+        return len(packets)
+
+    def delivered(self):
+        with self.lock:
+            return [packet for packet in self.packets if packet.src_ip != WARM_UP]
+
+
+class FakeCapture:
+    """Stands in for TSharkCapture: one warm-up packet, then ``packets`` each time ``emit`` is set."""
+    launched = []
+
+    def __init__(self, interface="eth0", filter_expr="ip", queue_obj=None, **options):
+        self.filter_expr = filter_expr
+        self.queue = queue_obj
+        self.proc = None
+        self.packets = []
+        self.emit = threading.Event()
+        self.stopped = threading.Event()
+        self.launched_at = time.monotonic()
+        FakeCapture.launched.append(self)
+
+    def start_capture(self):
+        # A capture is ready once it delivers a packet; the gate discards this one.
+        self.queue.put(Packet(WARM_UP, "10.0.0.1", "TCP", {"length": "60"}, ts=0.0))
+        while not self.stopped.is_set():
+            if self.emit.wait(0.01):
+                self.emit.clear()
+                self.queue.put_many(self.packets)
+
+    def stop_capture(self):
+        self.stopped.set()
+
+
+class DyingCapture(FakeCapture):
+    def start_capture(self):
+        return
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    FakeCapture.launched = []
+    monkeypatch.setattr(capture_supervisor, "TSharkCapture", FakeCapture)
+    return SimpleNamespace(store=SimpleNamespace(lock=threading.Lock(), version=0, blocked_ips=[]))
+
+
+def _block(repo, prefix):
+    repo.store.blocked_ips.append(prefix)
+    repo.store.version += 1
+
+
+def _wire(count):
+    return [Packet("10.0.0.%d" % i, "10.0.0.1", "TCP", {"length": "60"}, ts=1000.0 + i) for i in range(count)]
+
+
+def test_overlap_handoff_queues_each_packet_once(repo):
+    queue = ListQueue()
+    supervisor = CaptureSupervisor(repo, queue_obj=queue, startup_grace=5.0, overlap=0.5)
+    supervisor.swap(*supervisor.build_filter())
+    old = supervisor.capture
+    _block(repo, "10.9.0.0/16")
+    swapper = threading.Thread(target=supervisor.swap, args=supervisor.build_filter())
+    swapper.start()
+    while supervisor.capture is old:
+        time.sleep(0.01)
+    new = supervisor.capture
+    assert "not (src net 10.9.0.0/16)" in new.filter_expr
+    wire = _wire(8)
+    # A capture's own repeats are distinct packets and stay; only the other capture's copies go.
+    old.packets = wire[:5] + [wire[4]]
+    new.packets = wire[2:]
+    old.emit.set()
+    while len(queue.delivered()) < 6:
+        time.sleep(0.01)
+    new.emit.set()
+    swapper.join()
+    assert old.stopped.is_set() and not new.stopped.is_set()
+    assert [packet.ts for packet in queue.delivered()] == [1000.0 + i for i in (0, 1, 2, 3, 4, 4, 5, 6, 7)]
+    assert supervisor.stats()["overlap_duplicates"] == 3
+    assert supervisor.gated.dedupe is None
+    supervisor.stop()
+
+
+def test_filter_changes_wait_for_min_restart_interval(repo):
+    supervisor = CaptureSupervisor(repo, queue_obj=ListQueue(), min_restart_interval=60.0, overlap=0.0)
+    supervisor.swap(*supervisor.build_filter())
+    _block(repo, "10.9.0.0/16")
+    assert not supervisor.check()
+    supervisor.last_restart -= 60.0
+    assert supervisor.check()
+    assert supervisor.stats()["restarts"] == 1 and len(FakeCapture.launched) == 2
+    # A change that leaves the filter as it is needs no restart.
+    repo.store.version += 1
+    supervisor.last_restart -= 60.0
+    assert not supervisor.check()
+    supervisor.stop()
+
+
+def test_dead_capture_restarts_with_backoff(repo, monkeypatch):
+    monkeypatch.setattr(capture_supervisor, "TSharkCapture", DyingCapture)
+    supervisor = CaptureSupervisor(repo, queue_obj=ListQueue(), check_interval=0.01, min_restart_interval=0.2)
+    runner = threading.Thread(target=supervisor.run)
+    runner.start()
+    time.sleep(0.7)
+    supervisor.stop()
+    runner.join(5)
+    starts = [capture.launched_at for capture in FakeCapture.launched]
+    assert 2 <= len(starts) <= 5
+    assert all(later - earlier >= 0.2 for earlier, later in zip(starts, starts[1:]))
@@ -0,0 +1,77 @@
+import pytest
+
+from core.cidr_index import CidrIndex, parse_address, parse_prefix
+from packet_batch import ip_to_int
+
+
+def test_parse_prefix():
+    assert parse_prefix("10.1.2.3") == (4, 0x0A010203, 32)
+    assert parse_prefix("10.1.2.3/8") == (4, 0x0A000000, 8)
+    assert parse_prefix("::ffff:10.1.2.3") == (4, 0x0A010203, 32)
+    assert parse_prefix("2001:db8::/32") == (6, 0x20010DB8 << 96, 32)
+    with pytest.raises(ValueError):
+        parse_prefix("10.0.0.1,10.0.0.2")
+    with pytest.raises(ValueError):
+        parse_address("10.0.0.0/24")
+
+
+def test_lookup():
+    index = CidrIndex(["10.0.0.0/24", "2001:db8::/32", "192.0.2.7"])
+    assert "10.0.0.99" in index
+    assert "10.0.0.0/25" in index
+    assert "10.0.0.0/23" not in index
+    assert "10.0.1.1" not in index
+    assert "2001:db8:1::5" in index
+    assert index.match("10.0.0.99") == "10.0.0.0/24"
+    assert index.match("192.0.2.7") == "192.0.2.7/32"
+    assert index.match("192.0.2.8") is None
+    assert index.contains_int(*ip_to_int("10.0.0.5"))
+    assert index.contains_int(*ip_to_int("2001:db8::9"))
+    assert not index.contains_int(*ip_to_int("2001:db9::9"))
+
+
+def test_siblings_coalesce():
+    index = CidrIndex()
+    for host in range(4):
+        assert index.add("10.0.0.%d" % host)
+    assert list(index) == ["10.0.0.0/30"]
+    assert len(index) == 1
+    assert not index.add("10.0.0.2")
+
+
+def test_wider_prefix_replaces_narrower_ones():
+    index = CidrIndex(["10.0.0.1", "10.0.0.9", "10.0.1.1"])
+    index.add("10.0.0.0/24")
+    assert list(index) == ["10.0.0.0/24", "10.0.1.1"]
+    assert len(index) == 2
+
+
+def test_discard_splits_a_range():
+    index = CidrIndex(["10.0.0.0/30"])
+    assert index.discard("10.0.0.2")
+    assert sorted(index) == ["10.0.0.0/31", "10.0.0.3"]
+    assert len(index) == 2
+    assert "10.0.0.2" not in index
+    assert not index.discard("10.0.0.2")
+
+
+def test_discard_removes_everything_under_a_prefix():
+    index = CidrIndex(["10.0.0.1", "10.0.0.200", "2001:db8::1"])
+    assert index.discard("10.0.0.0/24")
+    assert list(index) == ["2001:db8::1"]
+    assert len(index) == 1
+    assert not index.discard("10.0.0.0/24")
+    index.clear()
+    assert len(index) == 0 and list(index) == []
+
+
+def test_merges_cascade_and_ipv6_splits():
+    index = CidrIndex(["10.0.0.0/31", "10.0.0.2", "10.0.0.4/30"])
+    index.add("10.0.0.3")
+    assert list(index) == ["10.0.0.0/29"]
+    assert index.match("10.0.0.7") == "10.0.0.0/29"
+    index = CidrIndex(["2001:db8::/126"])
+    assert index.discard("2001:db8::1")
+    assert list(index) == ["2001:db8::", "2001:db8::2/127"]
+    assert index.match("2001:db8::3") == "2001:db8::2/127"
+    assert not index.contains_int(*ip_to_int("2001:db8::1"))
@@ -0,0 +1,44 @@
+from agent_entities import FirewallAgent, ManagerAgent, ModelAgent
+from core.decision_hub import DecisionFilter, DecisionHub, decision_event
+from domain import Packet
+from infra import FirewallRepository
+from threat_models import default_rule_model
+from use_case import ThreatDetector
+
+
+def _event(src_ip, action="ALLOW"):
+    detected = action == "BLOCK"
+    return decision_event(1.0, src_ip, "10.9.9.9", "TCP", detected, "Test" if detected else "Normal traffic",
+                          "High", action, f"{src_ip}/32" if detected else None)
+
+
+def test_filters_and_sampled_overflow():
+    hub = DecisionHub(max_pending=2)
+    threats = hub.subscribe(DecisionFilter(threats_only=True))
+    subnet = hub.subscribe(DecisionFilter(cidrs=["10.1.0.0/16"]))
+    hub.publish([_event("10.1.0.1"), _event("10.2.0.1", "BLOCK"), _event("10.1.0.2", "BLOCK"),
+                 _event("10.1.0.3")])
+    events, dropped = threats.take()
+    assert [event["src_ip"] for event in events] == ["10.2.0.1", "10.1.0.2"] and dropped == 0
+    events, dropped = subnet.take()
+    assert [event["src_ip"] for event in events] == ["10.1.0.1", "10.1.0.2"] and dropped == 1
+
+
+def test_disconnect_policy_closes_slow_subscribers():
+    hub = DecisionHub(max_pending=1, overflow="disconnect")
+    subscription = hub.subscribe()
+    hub.publish([_event("10.0.0.1"), _event("10.0.0.2")])
+    assert subscription.closed and not hub.active
+
+
+def test_manager_agent_publishes_batch_decisions(tmp_path):
+    repo = FirewallRepository(str(tmp_path / "firewall_state.json"))
+    hub = DecisionHub()
+    manager = ManagerAgent(ModelAgent(ThreatDetector(model=default_rule_model())), FirewallAgent(repo),
+                           decision_hub=hub)
+    subscription = hub.subscribe()
+    manager.process_packets([Packet(f"10.0.0.{i}", "10.9.9.9", "TCP", {"length": 60}) for i in range(1, 4)])
+    events, _ = subscription.get_batch(timeout=1.0)
+    assert [event["src_ip"] for event in events] == ["10.0.0.1", "10.0.0.2", "10.0.0.3"]
+    assert events[0]["protocol"] == "TCP"
+    repo.store.close()
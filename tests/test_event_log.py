@@ -0,0 +1,54 @@
+import io
+import json
+import time
+
+from core.config import settings
+from core.event_log import DEBUG, INFO, EventLogger, event_log, parse_level
+
+
+def _records(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_global_logger_follows_settings():
+    assert event_log.threshold == parse_level(settings.LOG_LEVEL)
+    assert event_log.rate_limit == (settings.LOG_RATE_LIMIT or None)
+    assert event_log.sample_every == {event: round(1 / rate) for event, rate in settings.LOG_SAMPLE_RATES.items()}
+
+
+def test_level_and_sampling():
+    stream = io.StringIO()
+    logger = EventLogger(stream, level=DEBUG, sample_rates={"packet.analyzed": 0.25, "noisy": 0})
+    for i in range(8):
+        logger.debug("packet.analyzed", i=i)
+        logger.info("noisy", i=i)
+    logger.configure(level=INFO)
+    logger.debug("packet.analyzed", i=99)
+    logger.close()
+    records = _records(stream)
+    # Every 4th record is kept; the suppressed counts are reported on close.
+    assert [r["i"] for r in records if r["event"] == "packet.analyzed"] == [3, 7]
+    assert records[-1]["event"] == "log.suppressed"
+    assert records[-1]["counts"] == {"packet.analyzed": {"sampled": 6}, "noisy": {"sampled": 8}}
+
+
+def test_rate_limit_and_max_pending(monkeypatch):
+    # One rate-limit window for the whole test.
+    monkeypatch.setattr(time, "time", lambda: 1000.5)
+    stream = io.StringIO()
+    logger = EventLogger(stream, rate_limit=3, rate_limits={"burst": 5}, max_pending=6, flush_interval=60)
+    # Keep the writer thread out of the way so the queue fills up.
+    logger.writer = object()
+    for i in range(10):
+        logger.info("steady", i=i)
+        logger.info("burst", i=i)
+    assert len(logger.pending) == 6
+    logger.writer = None
+    logger.close()
+    records = _records(stream)
+    kept = [(r["event"], r["i"]) for r in records if r["event"] != "log.suppressed"]
+    assert kept == [("steady", 0), ("burst", 0), ("steady", 1), ("burst", 1), ("steady", 2), ("burst", 2)]
+    counts = records[-1]["counts"]
+    assert counts["steady"] == {"rate_limited": 7}
+    # burst allows 5 a second, but the queue only had room for 6 records in total.
+    assert counts["burst"] == {"dropped": 2, "rate_limited": 5}
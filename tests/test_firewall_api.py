@@ -0,0 +1,46 @@
+def test_analyze_rejects_invalid_source_address(client):
+    for src_ip in ("not-an-ip", "10.0.0.1,10.0.0.2", "10.0.0.0/24"):
+        response = client.post("/firewall/analyze",
+                               json={"src_ip": src_ip, "dst_ip": "10.0.0.9", "protocol": "TCP", "port": 80})
+        assert response.status_code == 400, src_ip
+    response = client.post("/firewall/analyze",
+                           json={"src_ip": "10.0.0.1", "dst_ip": "10.0.0.9", "protocol": "TCP", "port": 80})
+    assert response.status_code == 200
+
+
+def test_manual_block_rejects_invalid_address(client):
+    assert client.post("/firewall/block/not-an-ip").status_code == 400
+
+
+def test_state_pages_by_cursor(client):
+    start = client.get("/firewall/state", params={"view": "summary"}).json()["version"]
+    for host in range(1, 4):
+        assert client.post("/firewall/block/198.51.100.%d" % host).status_code == 200
+    first = client.get("/firewall/state", params={"since": start, "limit": 2, "include_blocked": False}).json()
+    assert [entry["seq"] for entry in first["log"]] == [start + 1, start + 2]
+    assert first["next"] == start + 2
+    assert "blocked_ips" not in first
+    rest = client.get("/firewall/state", params={"since": first["next"], "limit": 2}).json()
+    assert [entry["ip"] for entry in rest["log"]] == ["198.51.100.3"]
+    assert rest["next"] == rest["version"] == start + 3
+    assert "198.51.100.1" in rest["blocked_ips"]
+    newest = client.get("/firewall/state", params={"limit": 1}).json()
+    assert [entry["seq"] for entry in newest["log"]] == [start + 3]
+
+
+def test_state_etag(client):
+    response = client.get("/firewall/state", params={"view": "summary"})
+    etag = response.headers["ETag"]
+    assert etag == 'W/"%d"' % response.json()["version"]
+    assert "log" not in response.json()
+    cached = client.get("/firewall/state", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    client.post("/firewall/block/203.0.113.9")
+    changed = client.get("/firewall/state", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_state_view_is_validated(client):
+    assert client.get("/firewall/state", params={"view": "everything"}).status_code == 422
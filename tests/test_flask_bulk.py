@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+import app as flask_app
+from agent_entities import FirewallAgent, ManagerAgent, ModelAgent
+from domain import Packet
+from infra import FirewallRepository
+from use_case import ThreatDetector
+
+
+@pytest.fixture
+def bulk_client(tmp_path, monkeypatch):
+    # app.py uses the module globals that agent_components provides.
+    repo = FirewallRepository(str(tmp_path / "firewall_state.json"))
+    manager = ManagerAgent(ModelAgent(ThreatDetector()), FirewallAgent(repo))
+    monkeypatch.setattr(flask_app, "Packet", Packet, raising=False)
+    monkeypatch.setattr(flask_app, "manager_agent", manager, raising=False)
+    yield flask_app.app.test_client()
+    repo.store.close()
+
+
+def _post(client, records):
+    body = "".join(json.dumps(record) + "\n" for record in records)
+    response = client.post("/analyze/bulk", data=body, content_type="application/x-ndjson")
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_invalid_records_get_error_rows(bulk_client):
+    records = [
+        {"src_ip": "10.0.0.1", "dst_ip": "10.0.0.9", "protocol": "TCP"},
+        {"src_ip": "10.0.0.0/24", "dst_ip": "10.0.0.9", "protocol": "TCP"},
+        {"src_ip": "10.0.0.2", "dst_ip": "10.0.0.9,10.0.0.8", "protocol": "ICMP"},
+        {"src_ip": "10.0.0.3", "dst_ip": "10.0.0.9", "protocol": 6},
+        {"src_ip": "10.0.0.4"},
+    ]
+    results = _post(bulk_client, records)
+    assert [result["index"] for result in results] == [0, 1, 2, 3, 4]
+    assert [("error" in result) for result in results] == [False, True, True, True, False]
+
+
+def test_failed_batch_yields_error_rows(bulk_client, monkeypatch):
+    def fail(packets, weights=None):
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(flask_app.manager_agent, "process_packets", fail)
+    results = _post(bulk_client, [{"src_ip": "10.0.0.1"}, {"src_ip": "10.0.0.2"}])
+    assert [result["index"] for result in results] == [0, 1]
+    assert all(result["error"] == "Analysis failed." for result in results)
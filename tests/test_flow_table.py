@@ -0,0 +1,40 @@
+from agent_entities import ModelAgent
+from domain import Packet
+from flow_table import AGGREGATE_COLUMNS, FlowTable
+from packet_batch import PacketBatch
+from threat_models import default_rule_model
+from use_case import ThreatDetector
+
+
+def _syn(src_ip, ts, dst_port=80):
+    return Packet(src_ip, "10.9.9.9", "TCP", {"length": 60, "src_port": 40000, "dst_port": dst_port,
+                                             "tcp_flags": 0x02}, ts=ts)
+
+
+def test_source_rates_over_the_window():
+    table = FlowTable(window=10.0, buckets=10)
+    for i in range(200):
+        features = dict(zip(AGGREGATE_COLUMNS, table.update_packet(_syn("10.0.0.1", 100.0 + i * 0.005))))
+    assert features["src_syn_ratio"] == 1.0
+    assert features["src_syn_rate"] >= 100
+    assert features["src_icmp_rate"] == 0
+
+
+def test_idle_entries_are_evicted():
+    table = FlowTable(window=10.0, idle_timeout=5.0)
+    table.update_packet(_syn("10.0.0.1", 100.0))
+    table.update_packet(_syn("10.0.0.2", 103.0))
+    assert table.stats()["sources"] == 2
+    table.update_packet(_syn("10.0.0.2", 107.0))
+    assert table.expire(107.0) + table.evicted >= 2
+    assert set(table.sources) == {(0, 0xFFFF0A000002)}
+
+
+def test_syn_flood_is_detected_only_with_flow_state():
+    flood = [_syn("10.0.0.1", 100.0 + i * 0.002) for i in range(400)]
+    batch = PacketBatch.from_packets(flood)
+    stateless = ModelAgent(ThreatDetector(model=default_rule_model())).analyze_batch(batch)
+    assert not stateless.threat_detected.any()
+    stateful = ModelAgent(ThreatDetector(model=default_rule_model()), FlowTable()).analyze_batch(batch)
+    assert stateful.threat_detected[-1]
+    assert stateful.threat_type[-1] == "TCP SYN Flood Attack"
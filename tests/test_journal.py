@@ -0,0 +1,125 @@
+import json
+
+import pytest
+
+from repositories.journal import JournaledFirewallState
+
+
+def _block(ip):
+    return {"event": "Blocked IP", "ip": ip, "reason": "TCP SYN Flood Attack", "confidence": "High",
+            "action": "BLOCK", "timestamp": "2024-01-01T00:00:00Z"}
+
+
+def test_invalid_addresses_are_skipped(tmp_path):
+    store = JournaledFirewallState(str(tmp_path / "state.json"))
+    assert store.record(_block("not-an-ip")) is None
+    handle = store.record_many([_block("10.0.0.1,10.0.0.2"), _block("10.0.0.1")])
+    assert handle.wait(5)
+    assert store.is_blocked("10.0.0.1")
+    assert store.seq == 1
+    assert [entry["ip"] for entry in store.state()["log"]] == ["10.0.0.1"]
+    store.close()
+
+
+def test_state_survives_restart(tmp_path):
+    path = str(tmp_path / "state.json")
+    store = JournaledFirewallState(path)
+    for entry in (_block("10.0.0.1"), _block("10.0.0.2"), dict(_block("10.0.0.1"), event="Unblocked IP")):
+        store.record(entry)
+    store.close()
+    store = JournaledFirewallState(path)
+    assert store.seq == 3
+    assert store.state()["blocked_ips"] == ["10.0.0.2"]
+    assert [entry["event"] for entry in store.state()["log"]] == ["Blocked IP", "Blocked IP", "Unblocked IP"]
+    store.close()
+
+
+def test_journal_replayed_on_top_of_snapshot(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"blocked_ips": ["10.0.0.1"], "log": [_block("10.0.0.1")], "seq": 1}))
+    records = [dict(_block("10.0.0.1"), seq=1), dict(_block("10.0.0.2"), seq=2)]
+    (tmp_path / "state.json.journal").write_text("".join(json.dumps(r) + "\n" for r in records) + '{"event": "Bl')
+    store = JournaledFirewallState(str(path))
+    assert store.seq == 2
+    assert sorted(store.state()["blocked_ips"]) == ["10.0.0.1", "10.0.0.2"]
+    # Recovery folds the replayed tail into the snapshot and starts an empty journal.
+    assert json.loads(path.read_text())["seq"] == 2
+    assert (tmp_path / "state.json.journal").read_text() == ""
+    store.close()
+
+
+def test_legacy_snapshot_without_seq(tmp_path):
+    path = tmp_path / "state.json"
+    path.write_text(json.dumps({"blocked_ips": ["10.0.0.1"], "log": [_block("10.0.0.1")]}))
+    store = JournaledFirewallState(str(path))
+    assert store.seq == 1
+    assert store.is_blocked("10.0.0.1")
+    store.close()
+
+
+def test_compaction_rotates_the_journal(tmp_path):
+    path = tmp_path / "state.json"
+    store = JournaledFirewallState(str(path), compact_interval=60)
+    store.record(_block("10.0.0.1"))
+    store.record(_block("10.0.0.2"))
+    assert store.compact()
+    assert not store.compact()
+    snapshot = json.loads(path.read_text())
+    assert (snapshot["seq"], sorted(snapshot["blocked_ips"])) == (2, ["10.0.0.1", "10.0.0.2"])
+    assert (tmp_path / "state.json.journal").read_text() == ""
+    assert not (tmp_path / "state.json.journal.old").exists()
+    store.close()
+
+
+def test_unknown_fsync_policy(tmp_path):
+    with pytest.raises(ValueError):
+        JournaledFirewallState(str(tmp_path / "state.json"), fsync_policy="sometimes")
+
+
+def test_events_share_one_group_commit(tmp_path):
+    store = JournaledFirewallState(str(tmp_path / "state.json"), flush_interval=60, fsync_interval=60)
+    handles = [store.record(_block("10.0.0.%d" % i)) for i in range(1, 4)]
+    assert handles[0] is handles[1] is handles[2]
+    assert not handles[0].written.is_set()
+    store.flush()
+    assert handles[0].wait(0)
+    assert store.groups_written == 1
+    assert len((tmp_path / "state.json.journal").read_text().splitlines()) == 3
+    assert store.record(_block("10.0.0.4")) is not handles[0]
+    store.close()
+
+
+def test_durable_wait_requests_a_sync(tmp_path):
+    store = JournaledFirewallState(str(tmp_path / "state.json"), fsync_interval=60)
+    handle = store.record(_block("10.0.0.1"))
+    assert handle.wait(5)
+    called = []
+    handle.add_callback(lambda: called.append(True), durable=True)
+    assert handle.wait(5, durable=True)
+    assert called == [True]
+    assert store.fsyncs == 1
+    store.close()
+
+
+@pytest.mark.parametrize("policy, fsyncs", [("always", 2), ("never", 0)])
+def test_fsync_policies(tmp_path, policy, fsyncs):
+    store = JournaledFirewallState(str(tmp_path / "state.json"), fsync_policy=policy, flush_interval=60)
+    for ip in ("10.0.0.1", "10.0.0.2"):
+        handle = store.record(_block(ip))
+        store.flush()
+        assert handle.synced.is_set()
+    assert store.fsyncs == fsyncs
+    store.close()
+
+
+def test_store_options_follow_settings(tmp_path, monkeypatch):
+    from core.config import settings
+    from infra import FirewallRepository
+    from repositories.firewall_repository import store_options
+
+    monkeypatch.setattr(settings, "FIREWALL_FSYNC_POLICY", "always")
+    monkeypatch.setattr(settings, "FIREWALL_FLUSH_INTERVAL_MS", 50)
+    monkeypatch.setattr(settings, "FIREWALL_FLUSH_MAX_EVENTS", 7)
+    repo = FirewallRepository(str(tmp_path / "state.json"), **store_options())
+    assert (repo.store.fsync_policy, repo.store.flush_interval, repo.store.flush_max_events) == ("always", 0.05, 7)
+    repo.store.close()
@@ -0,0 +1,62 @@
+from domain import Packet
+from load_shedding import FLOW_HEADS, NORMAL, SAMPLING, LoadShedder
+
+
+def _packets(src_ip, count, dst_port=80):
+    return [Packet(src_ip, "10.0.0.1", "TCP", {"length": 60, "src_port": 40000, "dst_port": dst_port})
+            for _ in range(count)]
+
+
+def test_steps_up_and_back_down():
+    # interval=0 re-evaluates the level on every observation.
+    shedder = LoadShedder(high_lag=0.5, low_lag=0.1, interval=0, min_sample_rate=0.2)
+    levels = []
+    for lag in (1.0, 1.0, 1.0, 1.0, 1.0, 0.3, 0.0, 0.0, 0.0, 0.0):
+        shedder.observe(lag)
+        levels.append((shedder.level, shedder.sample_rate))
+    assert levels == [
+        (FLOW_HEADS, 1.0), (SAMPLING, 0.5), (SAMPLING, 0.25), (SAMPLING, 0.2), (SAMPLING, 0.2),
+        (SAMPLING, 0.2), (SAMPLING, 0.4), (SAMPLING, 0.8), (FLOW_HEADS, 1.0), (NORMAL, 1.0),
+    ]
+    assert shedder.steps == 8
+
+
+def test_normal_keeps_everything():
+    shedder = LoadShedder()
+    packets = _packets("192.0.2.1", 5)
+    assert shedder.shed(packets, 0.0) == (packets, None)
+
+
+def test_flow_heads():
+    shedder = LoadShedder(interval=0, flow_head=2)
+    kept, weights = shedder.shed(_packets("192.0.2.1", 5) + _packets("192.0.2.1", 5, dst_port=443), 1.0)
+    assert shedder.level == FLOW_HEADS
+    assert [p.data["dst_port"] for p in kept] == [80, 80, 443, 443]
+    assert weights is None
+    assert shedder.stats()["shed"] == 6
+
+
+def test_sampling_weights_account_for_every_packet():
+    shedder = LoadShedder(interval=0, source_head=3, seed=7)
+    shedder.observe(1.0)
+    shedder.observe(1.0)
+    assert shedder.level == SAMPLING
+    shedder.interval = 60
+    packets = _packets("192.0.2.1", 200) + _packets("192.0.2.2", 2)
+    kept, weights = shedder.shed(packets, 1.0)
+    assert len(kept) == len(weights) < 200
+    # A source's first packets are always kept, and each kept packet stands in for the shed ones before it.
+    assert weights[:3] == [1.0, 1.0, 1.0]
+    assert [p.src_ip for p in kept[-2:]] == ["192.0.2.2", "192.0.2.2"]
+    assert sum(weights) + shedder.sources[("192.0.2.1", "TCP")][1] == len(packets)
+
+
+def test_seed_makes_sampling_reproducible():
+    def sample():
+        shedder = LoadShedder(interval=0, source_head=1, seed=3)
+        shedder.observe(1.0)
+        shedder.observe(1.0)
+        shedder.interval = 60
+        return shedder.shed(_packets("192.0.2.1", 50), 1.0)[1]
+
+    assert sample() == sample()
@@ -0,0 +1,28 @@
+import re
+
+
+def _series(text, name, **labels):
+    # Value of the sample whose name and labels (in rendered order) match exactly.
+    wanted = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    line = re.search(rf"^packet_analyzer_{name}(?:\{{{re.escape(wanted)}\}})? (\S+)$", text, re.MULTILINE)
+    return None if line is None else float(line.group(1))
+
+
+def test_metrics_after_analyze(client):
+    before = client.get("/metrics").text
+    decided = _series(before, "packets_total", stage="decided") or 0
+    count = _series(before, "stage_latency_seconds_count", stage="api_analyze") or 0
+    for host in range(1, 4):
+        response = client.post("/firewall/analyze",
+                               json={"src_ip": f"192.0.2.{host}", "dst_ip": "10.0.0.9", "protocol": "TCP", "port": 80})
+        assert response.status_code == 200
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "# TYPE packet_analyzer_stage_latency_seconds histogram" in text
+    assert "# TYPE packet_analyzer_packets_total counter" in text
+    assert _series(text, "packets_total", stage="decided") == decided + 3
+    assert _series(text, "stage_latency_seconds_count", stage="api_analyze") == count + 3
+    assert _series(text, "stage_latency_seconds_bucket", stage="api_analyze", le="+Inf") == count + 3
+    assert _series(text, "stage_latency_seconds_sum", stage="api_analyze") > 0
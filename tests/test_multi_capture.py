@@ -0,0 +1,38 @@
+import queue
+import time
+
+from domain import Packet
+from multi_capture import _ChunkForwarder
+
+
+def _packet(i):
+    return Packet(f"10.0.0.{i}", "10.9.9.9", "TCP", {"length": 60}, ts=float(i))
+
+
+def test_full_chunks_are_sent_at_once():
+    out = queue.Queue()
+    forwarder = _ChunkForwarder("eth0", out, chunk_size=3, max_delay=60.0)
+    for i in range(1, 8):
+        forwarder.put(_packet(i))
+    assert [len(out.get_nowait()[1]), len(out.get_nowait()[1])] == [3, 3]
+    assert out.empty()
+    forwarder.flush()
+    name, rows = out.get_nowait()
+    assert name == "eth0" and rows == [("10.0.0.7", "10.9.9.9", "TCP", {"length": 60}, 7.0)]
+
+
+def test_partial_chunk_is_flushed_after_a_quiet_period():
+    out = queue.Queue()
+    forwarder = _ChunkForwarder("eth0", out, chunk_size=256, max_delay=0.02)
+    forwarder.start()
+    try:
+        forwarder.put(_packet(1))
+        forwarder.put(_packet(2))
+        # No further packets arrive: the timer must ship the partial chunk.
+        _, rows = out.get(timeout=1.0)
+        time.sleep(0.05)
+        while not out.empty():
+            rows += out.get_nowait()[1]
+        assert [row[0] for row in rows] == ["10.0.0.1", "10.0.0.2"]
+    finally:
+        forwarder.stop()
@@ -0,0 +1,37 @@
+from domain import Packet
+from packet_batch import PacketBatch, ProtocolTable, int_to_ip, ip_to_int
+
+
+def _packet(src_ip, dst_ip="10.0.0.1", protocol="TCP", **data):
+    return Packet(src_ip, dst_ip, protocol, dict({"length": 60}, **data), ts=1.0)
+
+
+def test_addresses_round_trip():
+    for ip in ("192.0.2.7", "2001:db8::1", ""):
+        assert int_to_ip(*ip_to_int(ip)) == ip
+
+
+def test_unparsable_packets_are_rejected():
+    packets = [
+        _packet("10.0.0.1"),
+        _packet("10.0.0.1,10.0.0.2"),
+        _packet("10.0.0.3", dst_ip="fe80::1,fe80::2"),
+        _packet("10.0.0.4", length="n/a"),
+        _packet("2001:db8::5", protocol=17),
+    ]
+    batch = PacketBatch.from_packets(packets)
+    assert batch.rejected == [1, 2, 3]
+    assert batch.src_ips() == ["10.0.0.1", "2001:db8::5"]
+    assert batch.packet(1).protocol == "UDP"
+
+
+def test_protocol_ids():
+    table = ProtocolTable()
+    assert table.id_for("TCP") == 6
+    assert table.id_for("6") == 6
+    assert table.id_for(17) == 17
+    assert table.name_for(6) == "TCP"
+    assert table.id_for("HTTP") == 256
+    assert table.id_for("DNS") == 257
+    assert table.id_for(None) == 258
+    assert table.name_for(256) == "HTTP"
@@ -0,0 +1,66 @@
+import queue
+import threading
+
+import pytest
+
+from infra import BoundedPacketQueue
+
+
+def _filled(policy, capacity=3, **kwargs):
+    packets = BoundedPacketQueue(capacity, policy, **kwargs)
+    assert packets.put_many(range(capacity)) == capacity
+    return packets
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        BoundedPacketQueue(overflow_policy="spill")
+
+
+def test_drop_newest():
+    packets = _filled("drop_newest")
+    assert not packets.put(3)
+    assert list(packets.items) == [0, 1, 2]
+    assert packets.stats()["dropped"]["newest"] == 1
+
+
+def test_drop_oldest():
+    packets = _filled("drop_oldest")
+    assert packets.put(3)
+    assert list(packets.items) == [1, 2, 3]
+    assert packets.stats()["dropped"]["oldest"] == 1
+
+
+def test_sample_admits_every_nth_overflow():
+    packets = _filled("sample", sample_every=3)
+    assert packets.put_many(range(3, 9)) == 2
+    assert list(packets.items) == [2, 5, 8]
+    assert packets.stats()["dropped"] == {"newest": 0, "oldest": 2, "sampled_out": 4, "timeout": 0}
+
+
+def test_block_times_out():
+    packets = _filled("block")
+    assert not packets.put(3, timeout=0.01)
+    assert packets.stats()["dropped"]["timeout"] == 1
+
+
+def test_block_waits_for_room():
+    packets = _filled("block")
+    threading.Timer(0.05, packets.get).start()
+    assert packets.put(3, timeout=5)
+    assert list(packets.items) == [1, 2, 3]
+
+
+def test_get_batch():
+    packets = BoundedPacketQueue(16)
+    packets.put_many(range(5))
+    assert packets.get_batch(max_items=4, max_wait=0) == [0, 1, 2, 3]
+    assert packets.get_batch(max_items=4, max_wait=0.01) == [4]
+    assert packets.get_batch(timeout=0.01) == []
+    stats = packets.stats()
+    assert (stats["dequeued"], stats["batches"], stats["batch_size_histogram"]) == (5, 2, {1: 1, 4: 1})
+
+
+def test_get_raises_empty():
+    with pytest.raises(queue.Empty):
+        BoundedPacketQueue().get(block=False)
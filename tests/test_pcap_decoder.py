@@ -0,0 +1,94 @@
+import struct
+
+import pytest
+
+from infra import TSharkCapture
+from packet_batch import PacketBatch
+from pcap_decoder import LINKTYPE_ETHERNET, CaptureDecoder, decode_frame
+from pcap_files import ipv4_tcp_frame, ipv6_udp_frame, pcap_bytes, pcapng_bytes
+
+FRAMES = [
+    ipv4_tcp_frame("192.0.2.1", "198.51.100.2", src_port=40000, dst_port=443, flags=0x12),
+    ipv6_udp_frame("2001:db8::1", "2001:db8::2"),
+    ipv4_tcp_frame("192.0.2.3", "198.51.100.4"),
+]
+
+
+def _summary(packet):
+    data = packet.data
+    return packet.src_ip, packet.dst_ip, packet.protocol, data["src_port"], data["dst_port"], data["tcp_flags"]
+
+
+@pytest.mark.parametrize("build", [pcap_bytes, pcapng_bytes])
+def test_decodes_whole_stream(build):
+    decoder = CaptureDecoder()
+    packets = decoder.feed(build(FRAMES))
+    assert [_summary(p) for p in packets] == [
+        ("192.0.2.1", "198.51.100.2", "TCP", 40000, 443, 0x12),
+        ("2001:db8::1", "2001:db8::2", "UDP", 5353, 53, None),
+        ("192.0.2.3", "198.51.100.4", "TCP", 1234, 80, 0x02),
+    ]
+    assert packets[0].data["length"] == len(FRAMES[0])
+    assert packets[1].ts == pytest.approx(1700000000.001, abs=1e-6)
+    assert decoder.format == ("pcap" if build is pcap_bytes else "pcapng")
+    assert not decoder.buffer
+
+
+@pytest.mark.parametrize("build", [pcap_bytes, pcapng_bytes])
+def test_records_split_across_chunks(build):
+    stream = build(FRAMES)
+    decoder = CaptureDecoder()
+    packets = []
+    for i in range(0, len(stream), 7):
+        packets += decoder.feed(stream[i:i + 7])
+    assert [p.src_ip for p in packets] == ["192.0.2.1", "2001:db8::1", "192.0.2.3"]
+    assert not decoder.buffer
+
+
+def test_statistics_block():
+    decoder = CaptureDecoder()
+    decoder.feed(pcapng_bytes(FRAMES, dropped=5))
+    assert decoder.interface_stats == {0: (3, 5)}
+
+
+def test_rejects_unknown_magic():
+    with pytest.raises(ValueError):
+        CaptureDecoder().feed(b"\x00" * 32)
+
+
+def test_vlan_tagged_frame():
+    frame = ipv4_tcp_frame("10.1.1.1", "10.2.2.2")
+    tagged = frame[:12] + struct.pack("!HH", 0x8100, 42) + frame[12:]
+    assert decode_frame(LINKTYPE_ETHERNET, tagged) == ("10.1.1.1", "10.2.2.2", "TCP", 1234, 80, 0x02)
+
+
+def test_non_ip_frame():
+    assert decode_frame(LINKTYPE_ETHERNET, b"\x00" * 12 + b"\x08\x06" + b"\x00" * 28) is None
+
+
+def test_feed_into_stops_when_batch_is_full():
+    decoder = CaptureDecoder()
+    batch = PacketBatch(2)
+    assert decoder.feed_into(pcapng_bytes(FRAMES), batch) == 2
+    assert batch.src_ips() == ["192.0.2.1", "2001:db8::1"]
+    assert batch.packet(0).data["dst_port"] == 443
+    batch.clear()
+    assert decoder.feed_into(b"", batch) == 1
+    assert batch.src_ips() == ["192.0.2.3"]
+
+
+def test_tshark_commands():
+    fields = TSharkCapture(interface="eth1", filter_expr="tcp")
+    assert fields.command()[:5] == ["tshark", "-i", "eth1", "-f", "tcp"]
+    pcap = TSharkCapture(capture_format="pcap")
+    assert pcap.command()[-2:] == ["-F", "pcapng"]
+    assert "-F" not in TSharkCapture(capture_format="pcap", capture_tool="dumpcap").command()
+
+
+def test_parse_field_line():
+    packet = TSharkCapture.parse_line("10.0.0.1\t10.0.0.2\tDNS\t74\n")
+    assert (packet.src_ip, packet.dst_ip, packet.protocol, packet.data) == ("10.0.0.1", "10.0.0.2", "DNS",
+                                                                            {"length": "74"})
+    assert TSharkCapture.parse_line("10.0.0.1\t10.0.0.2\tDNS\t74\t1700000000.123456\n").ts == 1700000000.123456
+    assert TSharkCapture.parse_line("10.0.0.1\t10.0.0.2\n") is None
+    assert TSharkCapture.parse_line("\n") is None
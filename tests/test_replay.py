@@ -0,0 +1,35 @@
+from infra import PacketPipeline
+from pcap_files import ipv4_tcp_frame, pcap_bytes
+from replay import REPLAY_SEQ, PcapReplay
+
+
+class RecordingAgent:
+    def __init__(self):
+        self.packets = []
+
+    def process_packet(self, packet):
+        self.packets.append(packet)
+
+
+def _capture(tmp_path, count):
+    frames = [ipv4_tcp_frame(f"10.0.{i // 256 % 256}.{i % 256}", "10.9.9.9") for i in range(count)]
+    path = tmp_path / "capture.pcap"
+    path.write_bytes(pcap_bytes(frames))
+    return str(path)
+
+
+def test_replay_without_detection_drains_a_full_pipeline(tmp_path):
+    # More packets than the blocking pipeline holds, and nobody detecting.
+    stats = PcapReplay(_capture(tmp_path, 500), PacketPipeline(capacity=64)).run(None)
+    assert stats["packets"] == 500
+    assert stats["pipeline"]["dropped"] == {"newest": 0, "oldest": 0, "sampled_out": 0, "timeout": 0}
+
+
+def test_replay_measures_latency_per_packet(tmp_path):
+    agent = RecordingAgent()
+    replay = PcapReplay(_capture(tmp_path, 300), PacketPipeline(capacity=64))
+    stats = replay.run(agent, consumers=2)
+    assert stats["packets"] == len(agent.packets) == 300
+    assert len(replay.latencies) == 300
+    assert not replay.sent_at
+    assert all(REPLAY_SEQ not in packet.data for packet in agent.packets)
@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from agent_entities import FirewallAgent, ManagerAgent, ModelAgent
+from domain import Packet
+from infra import FirewallRepository
+from sharding import ShardedProcessor, shard_for
+from threat_models import RuleModel
+from use_case import ThreatDetector
+from verdict_cache import VerdictCache
+
+
+def _blocking_agent():
+    # Module-level so spawned workers can import it: flags every TCP SYN Flood.
+    return ModelAgent(ThreatDetector(model=RuleModel([(0, [("frame_length", ">", 0)])], default_class=6)))
+
+
+def _packet(src_ip):
+    return Packet(src_ip, "10.9.9.9", "TCP", {"length": 60, "src_port": 40000, "dst_port": 443})
+
+
+@pytest.fixture
+def manager(tmp_path):
+    repo = FirewallRepository(str(tmp_path / "firewall_state.json"))
+    yield ManagerAgent(_blocking_agent(), FirewallAgent(repo), verdict_cache=VerdictCache())
+    repo.store.close()
+
+
+def _wait_for(condition, timeout=30.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.05)
+
+
+def test_shard_for_is_stable():
+    assert shard_for("10.0.0.1", 4) == shard_for("10.0.0.1", 4)
+    assert {shard_for(f"10.0.0.{i}", 4) for i in range(64)} == {0, 1, 2, 3}
+
+
+def test_decisions_come_back_and_block(manager):
+    processor = ShardedProcessor(manager, num_workers=2, batch_size=8, agent_factory=_blocking_agent)
+    processor.start()
+    sources = [f"10.0.0.{i}" for i in range(1, 11)]
+    processor.submit([_packet(ip) for ip in sources for _ in range(3)])
+    processor.flush()
+    _wait_for(lambda: processor.scored == 30)
+    _wait_for(lambda: all(manager.firewall_agent.blocked_prefix(ip) for ip in sources))
+    assert sum(processor.stats()["packets_per_shard"]) == 30
+    # Blocked sources are screened in the parent and never shipped again.
+    processor.submit([_packet(ip) for ip in sources])
+    processor.flush()
+    assert sum(processor.stats()["packets_per_shard"]) == 30
+    processes = [shard["process"] for shard in processor.shards]
+    processor.stop()
+    assert not any(process.is_alive() for process in processes)
+    assert manager.verdict_cache.get("10.0.0.1").action == "BLOCK"
+
+
+def test_dead_worker_is_replaced(manager):
+    processor = ShardedProcessor(manager, num_workers=1, batch_size=8, slots_per_worker=1,
+                                 agent_factory=_blocking_agent, slot_timeout=0.2)
+    processor.start()
+    processor.shards[0]["process"].terminate()
+    processor.shards[0]["process"].join()
+    # The first batch takes the dead worker's only free slot; the second finds it dead.
+    processor.submit([_packet("10.0.0.1")])
+    processor.flush()
+    processor.submit([_packet("10.0.0.2")])
+    processor.flush()
+    assert processor.stats()["restarts"] == 1 and processor.stats()["lost"] == 1
+    _wait_for(lambda: manager.firewall_agent.blocked_prefix("10.0.0.2"))
+    processor.stop()
@@ -0,0 +1,45 @@
+from repositories.sqlite_store import SQLiteFirewallState, ip_range
+
+
+def _event(event, ip, timestamp="2024-01-01T00:00:00Z"):
+    return {"event": event, "ip": ip, "reason": "TCP SYN Flood Attack", "timestamp": timestamp}
+
+
+def test_ip_range():
+    assert ip_range("10.0.0.0/31") == ((0xFFFF0A000000).to_bytes(16, "big"), (0xFFFF0A000001).to_bytes(16, "big"))
+    first, last = ip_range("2001:db8::/32")
+    assert first.hex() == "20010db8" + "00" * 12
+    assert last.hex() == "20010db8" + "ff" * 12
+
+
+def test_query_events(tmp_path):
+    store = SQLiteFirewallState(str(tmp_path / "state.db"))
+    for entry in (_event("Blocked IP", "10.0.0.1", "2024-01-01T00:00:00Z"),
+                  _event("Blocked IP", "10.0.1.1", "2024-01-02T00:00:00Z"),
+                  _event("Unblocked IP", "10.0.0.1", "2024-01-03T00:00:00Z"),
+                  _event("Blocked IP", "2001:db8::1", "2024-01-04T00:00:00Z")):
+        store.record(entry)
+    store.flush()
+    assert [e["ip"] for e in store.query_events(ip="10.0.0.0/24")] == ["10.0.0.1", "10.0.0.1"]
+    assert [e["ip"] for e in store.query_events(event="Blocked IP", since="2024-01-02T00:00:00Z")] == [
+        "10.0.1.1", "2001:db8::1"]
+    assert [e["ip"] for e in store.query_events(until="2024-01-01T12:00:00Z")] == ["10.0.0.1"]
+    assert len(store.query_events(limit=2)) == 2
+    store.close()
+
+
+def test_recovers_snapshot_and_later_events(tmp_path):
+    path = str(tmp_path / "state.db")
+    store = SQLiteFirewallState(path, compact_interval=60)
+    store.record(_event("Blocked IP", "10.0.0.1"))
+    store.record(_event("Blocked IP", "10.0.0.2"))
+    assert store.compact()
+    store.record(_event("Unblocked IP", "10.0.0.1"))
+    store.flush()
+    # A second instance sees the snapshot plus the unblock written after it.
+    recovered = SQLiteFirewallState(path)
+    assert recovered.seq == 3
+    assert list(recovered.blocked_ips) == ["10.0.0.2"]
+    assert recovered.summary()["event_counts"] == {"Blocked IP": 2, "Unblocked IP": 1}
+    recovered.close()
+    store.close()
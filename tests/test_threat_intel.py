@@ -0,0 +1,74 @@
+import numpy as np
+
+from domain import Packet
+from packet_batch import PacketBatch
+from threat_intel import IntelIndex, ThreatIntel, parse_feed, parse_range
+
+
+FEED = """# source,first_seen
+198.51.100.0/24,2024-01-01
+"203.0.113.5",2024-01-02
+192.0.2.10-192.0.2.20
+2001:db8::1
+2001:db8:1::/48
+not an address
+"""
+
+
+def test_parse_feed_skips_comments_and_junk():
+    assert list(parse_feed(FEED.splitlines())) == [
+        parse_range("198.51.100.0/24"), parse_range("203.0.113.5"), parse_range("192.0.2.10-192.0.2.20"),
+        parse_range("2001:db8::1"), parse_range("2001:db8:1::/48"),
+    ]
+    assert parse_range("2001:db8::1") == (6, 0x20010DB8 << 96 | 1, 0x20010DB8 << 96 | 1)
+
+
+def test_ranges_are_coalesced():
+    entries = ("10.0.0.0/25", "10.0.0.128/25", "10.0.0.5", "10.0.2.0/24", "2001:db8::/127", "2001:db8::2")
+    index = IntelIndex.build(parse_range(entry) for entry in entries)
+    assert index.meta["entries"] == 6
+    assert index.meta["v4_ranges"] == 2
+    assert index.meta["v6_ranges"] == 1
+
+
+def test_ipv6_hosts_do_not_cover_their_network():
+    index = IntelIndex.build(parse_feed(FEED.splitlines()))
+    assert index.contains("2001:db8::1")
+    assert not index.contains("2001:db8::2")
+    assert index.contains("2001:db8:1:ffff::9")
+    assert not index.contains("2001:db8:2::1")
+    assert index.contains("198.51.100.77") and index.contains("192.0.2.20")
+    assert not index.contains("192.0.2.21") and not index.contains("10.0.0.1,10.0.0.2")
+
+
+def test_listed_rows_match_contains():
+    index = IntelIndex.build(parse_feed(FEED.splitlines()))
+    sources = ["198.51.100.1", "2001:db8::1", "2001:db8::2", "10.0.0.1", "2001:db8:1::1", "203.0.113.5"]
+    batch = PacketBatch.from_packets(Packet(ip, "10.9.9.9", "TCP", {"length": 60}) for ip in sources)
+    expected = [i for i, ip in enumerate(sources) if index.contains(ip)]
+    assert index.listed_rows(batch).tolist() == expected == [0, 1, 4, 5]
+
+
+def test_saved_index_is_memory_mapped(tmp_path):
+    index = IntelIndex.build(parse_feed(FEED.splitlines()), {"version": "v1"})
+    index.save(str(tmp_path / "v1"))
+    loaded = IntelIndex.load(str(tmp_path / "v1"))
+    assert isinstance(loaded.v6_starts, np.memmap)
+    assert loaded.meta["version"] == "v1"
+    assert loaded.contains("2001:db8::1") and not loaded.contains("2001:db8::2")
+
+
+def test_refresh_publishes_a_new_version(tmp_path):
+    feed = tmp_path / "feed.txt"
+    feed.write_text("192.0.2.1\n")
+    intel = ThreatIntel(str(tmp_path / "intel"), [str(feed)], keep_versions=1)
+    assert not intel.contains("192.0.2.1")
+    first = intel.refresh()
+    assert intel.contains("192.0.2.1")
+    feed.write_text("192.0.2.2\n")
+    second = intel.refresh()
+    assert second != first
+    assert intel.contains("192.0.2.2") and not intel.contains("192.0.2.1")
+    # Another process picks up the published version from CURRENT.
+    reader = ThreatIntel(str(tmp_path / "intel"))
+    assert reader.version == second and reader.contains("192.0.2.2")
@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from threat_models import (FEATURE_COLUMNS, LinearModel, RuleModel, TreeModel, default_rule_model, load_model,
+                           model_for)
+from use_case import ThreatDetector
+
+N_CLASSES = 7
+
+
+def _features(seed=0, n=200):
+    rng = np.random.default_rng(seed)
+    X = rng.uniform(0, 200, size=(n, len(FEATURE_COLUMNS)))
+    X[:, FEATURE_COLUMNS.index("dst_port")] = rng.choice([22, 80, 443], size=n)
+    X[:, FEATURE_COLUMNS.index("src_syn_ratio")] = rng.uniform(0, 1, size=n)
+    X[:, FEATURE_COLUMNS.index("src_interarrival_cv")] = rng.uniform(0, 0.5, size=n)
+    X[:, FEATURE_COLUMNS.index("src_pps")] = rng.uniform(0, 2, size=n)
+    return X
+
+
+def _linear_model(seed=1):
+    rng = np.random.default_rng(seed)
+    return LinearModel(rng.normal(size=(N_CLASSES, len(FEATURE_COLUMNS))), rng.normal(size=N_CLASSES),
+                       mean=np.full(len(FEATURE_COLUMNS), 100.0), scale=np.full(len(FEATURE_COLUMNS), 50.0))
+
+
+def _tree_model():
+    # Root splits on dst_port, its right child on src_syn_rate; leaves hold per-class counts.
+    value = np.zeros((5, N_CLASSES))
+    value[1, 3] = value[3, 6] = 9.0
+    value[1, 6] = value[3, 0] = 1.0
+    value[4, 0] = 10.0
+    return TreeModel(feature=[FEATURE_COLUMNS.index("dst_port"), -2, FEATURE_COLUMNS.index("src_syn_rate"), -2, -2],
+                     threshold=[22.5, -2, 100.0, -2, -2], left=[1, -1, 3, -1, -1], right=[2, -1, 4, -1, -1],
+                     value=value)
+
+
+def _assert_batch_matches_rows(detector, X):
+    src_ips = [f"10.0.{i // 256}.{i % 256}" for i in range(len(X))]
+    batch = detector.evaluate_batch(X, src_ips)
+    for i, row in enumerate(X):
+        features = dict(zip(FEATURE_COLUMNS, row.tolist()), src_ip=src_ips[i])
+        assert vars(detector.evaluate(features)) == vars(batch.decision(i))
+
+
+@pytest.mark.parametrize("model", [default_rule_model(), _linear_model(), _tree_model()],
+                         ids=["rules", "linear", "tree"])
+def test_batch_matches_per_packet_evaluate(model):
+    _assert_batch_matches_rows(ThreatDetector(model=model), _features())
+
+
+def test_rule_model_first_matching_rule_wins():
+    model = RuleModel([(0, [("dst_port", "==", 22)]), (3, [("tcp_flags", "&", 0x02)])], default_class=6)
+    X = np.zeros((3, len(FEATURE_COLUMNS)))
+    X[0, FEATURE_COLUMNS.index("dst_port")] = 22
+    X[0, FEATURE_COLUMNS.index("tcp_flags")] = 0x12
+    X[1, FEATURE_COLUMNS.index("tcp_flags")] = 0x12
+    classes, scores = model.predict(X)
+    assert classes.tolist() == [0, 3, 6]
+    assert scores.tolist() == [1.0, 1.0, 1.0]
+
+
+def test_tree_model_scores_leaf_probabilities():
+    X = np.zeros((3, len(FEATURE_COLUMNS)))
+    X[1, FEATURE_COLUMNS.index("dst_port")] = 443
+    X[2, FEATURE_COLUMNS.index("dst_port")] = 443
+    X[2, FEATURE_COLUMNS.index("src_syn_rate")] = 500
+    classes, scores = _tree_model().predict(X)
+    assert classes.tolist() == [3, 6, 0]
+    assert scores.tolist() == pytest.approx([0.9, 0.9, 1.0])
+
+
+def test_load_model_round_trip(tmp_path):
+    X = _features(seed=2)
+    linear = _linear_model()
+    np.savez(tmp_path / "linear.npz", kind="linear", weights=linear.weights, bias=linear.bias, mean=linear.mean,
+             scale=linear.scale)
+    tree = _tree_model()
+    np.savez(tmp_path / "tree.npz", kind="tree", feature=tree.feature, threshold=tree.threshold, left=tree.left,
+             right=tree.right, value=tree.value)
+    for original, path in ((linear, tmp_path / "linear.npz"), (tree, tmp_path / "tree.npz")):
+        loaded = load_model(str(path))
+        expected, got = original.predict(X), loaded.predict(X)
+        assert np.array_equal(expected[0], got[0]) and np.allclose(expected[1], got[1])
+        _assert_batch_matches_rows(ThreatDetector(model=model_for(str(path))), X)
+    np.savez(tmp_path / "other.npz", kind="svm")
+    with pytest.raises(ValueError):
+        load_model(str(tmp_path / "other.npz"))
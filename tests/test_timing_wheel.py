@@ -0,0 +1,45 @@
+from timing_wheel import HierarchicalTimingWheel, TimingWheel
+
+
+def test_keys_expire_once_their_tick_passes():
+    wheel = TimingWheel(tick=1.0, slots=8, now=0.0)
+    wheel.schedule("a", 2.5)
+    wheel.schedule("b", 5.0)
+    wheel.schedule("c", 30.0)  # several revolutions out
+    assert wheel.advance(1.9) == []
+    assert wheel.advance(2.0) == ["a"]
+    assert wheel.advance(5.0) == ["b"]
+    assert wheel.advance(29.0) == []
+    assert wheel.advance(31.0) == ["c"]
+    assert len(wheel) == 0
+
+
+def test_reschedule_and_cancel():
+    wheel = TimingWheel(tick=1.0, slots=8)
+    wheel.schedule("a", 2.0)
+    wheel.schedule("a", 6.0)
+    wheel.schedule("b", 3.0)
+    assert wheel.cancel("b")
+    assert not wheel.cancel("b")
+    assert wheel.advance(4.0) == []
+    assert wheel.deadline("a") == 6.0
+    assert wheel.advance(6.0) == ["a"]
+
+
+def test_hierarchical_wheel_cascades_far_deadlines():
+    # Levels of 1 s, 4 s and 16 s ticks, each spanning 4 of its ticks.
+    wheel = HierarchicalTimingWheel(tick=1.0, slots=4, levels=3, now=0.0)
+    deadlines = {"near": 2.0, "mid": 9.0, "far": 50.0, "cancelled": 30.0}
+    for key, deadline in deadlines.items():
+        wheel.schedule(key, deadline)
+    assert wheel.levels == {"near": 0, "mid": 1, "far": 2, "cancelled": 2}
+    assert wheel.cancel("cancelled")
+    expired_at = {}
+    for now in range(1, 61):
+        for key in wheel.advance(float(now)):
+            expired_at[key] = now
+        if now == 48:
+            # The 16 s tick holding "far" has passed, so it cascaded down to the finest level.
+            assert wheel.levels["far"] == 0
+    assert expired_at == {"near": 2, "mid": 9, "far": 50}
+    assert len(wheel) == 0
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from agent_entities import FirewallAgent, ManagerAgent, ModelAgent
+from domain import Packet, ThreatDecision
+from infra import FirewallRepository
+from threat_models import default_rule_model
+from use_case import ThreatDetector
+from verdict_cache import VerdictCache
+
+
+class CountingModelAgent(ModelAgent):
+    def __init__(self, detector):
+        super().__init__(detector)
+        self.packets = 0
+
+    def analyze_packet(self, packet):
+        self.packets += 1
+        return super().analyze_packet(packet)
+
+    def analyze_batch(self, batch, src_ips=None, weights=None):
+        self.packets += len(batch)
+        return super().analyze_batch(batch, src_ips, weights)
+
+
+@pytest.fixture
+def agents(tmp_path):
+    repo = FirewallRepository(str(tmp_path / "firewall_state.json"))
+    model_agent = CountingModelAgent(ThreatDetector(model=default_rule_model()))
+    manager = ManagerAgent(model_agent, FirewallAgent(repo),
+                           verdict_cache=VerdictCache(block_ttl=60.0, allow_ttl=0.2))
+    yield manager, model_agent
+    repo.store.close()
+
+
+def _packet(src_ip):
+    return Packet(src_ip, "10.9.9.9", "TCP", {"length": 60, "dst_port": 443, "tcp_flags": 0x18})
+
+
+def test_cached_verdict_skips_the_model_until_it_expires(agents):
+    manager, model_agent = agents
+    assert manager.process_packet(_packet("10.0.0.1")).action == "ALLOW"
+    assert manager.process_packet(_packet("10.0.0.1")).action == "ALLOW"
+    assert model_agent.packets == 1
+    time.sleep(0.25)
+    manager.process_packet(_packet("10.0.0.1"))
+    assert model_agent.packets == 2
+    assert manager.verdict_cache.stats()["expirations"] == 1
+
+
+def test_batch_path_uses_the_cache(agents):
+    manager, model_agent = agents
+    manager.process_packets([_packet("10.0.0.1"), _packet("10.0.0.2")])
+    manager.process_packets([_packet("10.0.0.1"), _packet("10.0.0.3")])
+    assert model_agent.packets == 3
+
+
+def test_lru_eviction_and_ttls():
+    block = ThreatDecision(True, "TCP SYN Flood Attack", "High", "BLOCK", "10.0.0.1/32")
+    allow = ThreatDecision(False, "Normal traffic", "Low", "ALLOW")
+    cache = VerdictCache(max_entries=2, block_ttl=10.0)
+    cache.put("10.0.0.1", block, now=0.0)
+    cache.put("10.0.0.2", allow, now=0.0)  # allow verdicts are not cached without allow_ttl
+    cache.put("10.0.0.3", block, now=0.0)
+    assert cache.get("10.0.0.1", now=1.0) is block
+    cache.put("10.0.0.4", block, now=1.0)  # evicts 10.0.0.3, the least recently used
+    assert cache.get("10.0.0.3", now=1.0) is None
+    assert cache.get("10.0.0.1", now=9.9) is block
+    assert cache.get("10.0.0.1", now=10.0) is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_stats_are_exported_as_metrics():
+    from core.metrics import metrics
+
+    cache = VerdictCache(block_ttl=10.0)
+    cache.put("10.0.0.1", ThreatDecision(True, "TCP SYN Flood Attack", "High", "BLOCK", "10.0.0.1/32"))
+    cache.get("10.0.0.1")
+    cache.get("10.0.0.2")
+    cache.get("10.0.0.3")
+    lines = metrics.render().splitlines()
+    assert "packet_analyzer_verdict_cache_entries 1" in lines
+    assert "packet_analyzer_verdict_cache_hits 1" in lines
+    assert "packet_analyzer_verdict_cache_misses 2" in lines
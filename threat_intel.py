@@ -0,0 +1,358 @@
+import argparse
+import gzip
+import io
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import urllib.request
+from array import array
+from contextlib import contextmanager
+
+import numpy as np
+
+from core.cidr_index import parse_prefix
+from core.event_log import event_log
+from core.metrics import metrics
+from packet_batch import ip_to_int
+
+
+INTEL_THREAT_TYPE = "Known Malicious Source (Threat Intel)"
+CURRENT_FILE = "CURRENT"
+ARRAY_FILES = ("v4_starts", "v4_ends", "v6_starts", "v6_ends")
+FIELD_SEPARATORS = re.compile(r"[,;\s]+")
+U32_MAX = 0xFFFFFFFF
+U64_MAX = 0xFFFFFFFFFFFFFFFF
+
+INTEL_HITS = metrics.counter("threat_intel_hits_total", "Packets whose source is on a reputation list.")
+
+
+def parse_range(token):
+    """(version, first, last) for an address, CIDR or ``first-last`` range, as integers."""
+    if "-" in token:
+        first_text, _, last_text = token.partition("-")
+        version, first, _ = parse_prefix(first_text.strip())
+        last_version, last, _ = parse_prefix(last_text.strip())
+        if last_version != version or last < first:
+            raise ValueError(f"Invalid address range {token!r}.")
+    else:
+        version, first, length = parse_prefix(token)
+        host_bits = (32 if version == 4 else 128) - length
+        last = first | ((1 << host_bits) - 1)
+    return version, first, last
+
+
+def parse_feed(lines, column=None):
+    """Stream the ranges listed in a plaintext or CSV feed as (version, first, last) tuples.
+
+    Blank lines and lines starting with "#" or ";" are skipped. With ``column`` the entry
+    is that comma-separated field; otherwise it is the first field on the line (split on
+    commas, semicolons or whitespace) that parses as an address, CIDR or range, so
+    headers and trailing comments fall out. Lines without one are skipped.
+    """
+    for line in lines:
+        line = line.strip()
+        if not line or line[0] in "#;":
+            continue
+        fields = line.split(",")[column:column + 1] if column is not None else FIELD_SEPARATORS.split(line)
+        for field in fields:
+            field = field.strip().strip("\"'")
+            if not field or not (field[0].isdigit() or ":" in field):
+                continue
+            try:
+                yield parse_range(field)
+                break
+            except ValueError:
+                continue
+
+
+@contextmanager
+def open_feed(source):
+    """Text lines of a feed: an http(s) URL or a local path, gzip-compressed if it ends in ".gz"."""
+    if source.startswith(("http://", "https://")):
+        raw = urllib.request.urlopen(source, timeout=60)
+    else:
+        raw = open(source, "rb")
+    try:
+        stream = gzip.GzipFile(fileobj=raw) if source.endswith(".gz") else raw
+        yield io.TextIOWrapper(stream, encoding="utf-8", errors="replace")
+    finally:
+        raw.close()
+
+
+def _keys128(hi, lo):
+    # 128-bit values as 16-byte big-endian strings, which NumPy sorts and searches in numeric order.
+    keys = np.empty(len(hi), dtype=[("hi", ">u8"), ("lo", ">u8")])
+    keys["hi"] = hi
+    keys["lo"] = lo
+    return keys.view("S16")
+
+
+def _coalesce(starts, ends):
+    # Sort by start and merge overlapping or adjacent ranges into disjoint ones.
+    if not len(starts):
+        return starts, ends
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], np.maximum.accumulate(ends[order])
+    previous = ends[:-1]
+    following = starts[1:]
+    # ``following - previous`` is only meaningful (and only used) where following > previous.
+    breaks = np.flatnonzero((following > previous) & (following - previous > 1)) + 1
+    firsts = np.concatenate(([0], breaks))
+    return starts[firsts], np.maximum.reduceat(ends, firsts)
+
+
+def _coalesce128(first_hi, first_lo, last_hi, last_lo):
+    # _coalesce for IPv6, where the values do not fit a NumPy integer type.
+    order = np.lexsort((first_lo, first_hi))
+    columns = (first_hi, first_lo, last_hi, last_lo)
+    first_hi, first_lo, last_hi, last_lo = (column[order].tolist() for column in columns)
+    merged_starts, merged_ends = [], []
+    start = end = None
+    for first_high, first_low, last_high, last_low in zip(first_hi, first_lo, last_hi, last_lo):
+        first = first_high << 64 | first_low
+        last = last_high << 64 | last_low
+        if end is not None and first <= end + 1:
+            if last > end:
+                end = last
+            continue
+        if end is not None:
+            merged_starts.append(start)
+            merged_ends.append(end)
+        start, end = first, last
+    if end is not None:
+        merged_starts.append(start)
+        merged_ends.append(end)
+    starts = np.array([value.to_bytes(16, "big") for value in merged_starts], dtype="S16")
+    ends = np.array([value.to_bytes(16, "big") for value in merged_ends], dtype="S16")
+    return starts, ends
+
+
+class IntelIndex:
+    """Immutable reputation index: sorted, disjoint [start, end] ranges per address family.
+
+    IPv4 ranges are uint32 pairs; IPv6 ranges are full 128-bit values stored as 16-byte
+    big-endian strings, so a listed host blocks only itself. A lookup is a binary search
+    over the starts and one over the ends. The arrays may be memory-mapped ``.npy``
+    files, so loading a saved index costs nothing until it is probed.
+    """
+    def __init__(self, v4_starts, v4_ends, v6_starts, v6_ends, meta=None):
+        self.v4_starts = v4_starts
+        self.v4_ends = v4_ends
+        self.v6_starts = v6_starts
+        self.v6_ends = v6_ends
+        self.meta = meta or {}
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, np.uint32), np.empty(0, np.uint32), np.empty(0, "S16"), np.empty(0, "S16"))
+
+    @classmethod
+    def build(cls, ranges, meta=None):
+        """Build from an iterable of (version, first, last) without holding it as Python objects."""
+        v4_columns = (array("I"), array("I"))
+        v6_columns = (array("Q"), array("Q"), array("Q"), array("Q"))
+        v4_starts, v4_ends = (column.append for column in v4_columns)
+        v6_first_hi, v6_first_lo, v6_last_hi, v6_last_lo = (column.append for column in v6_columns)
+        entries = 0
+        for version, first, last in ranges:
+            if version == 4:
+                v4_starts(first)
+                v4_ends(last)
+            else:
+                v6_first_hi(first >> 64)
+                v6_first_lo(first & U64_MAX)
+                v6_last_hi(last >> 64)
+                v6_last_lo(last & U64_MAX)
+            entries += 1
+        v4 = _coalesce(*(np.frombuffer(column, np.uint32) for column in v4_columns))
+        v6 = _coalesce128(*(np.frombuffer(column, np.uint64) for column in v6_columns))
+        meta = dict(meta or {}, entries=entries, v4_ranges=len(v4[0]), v6_ranges=len(v6[0]))
+        return cls(v4[0], v4[1], v6[0], v6[1], meta)
+
+    def __len__(self):
+        return len(self.v4_starts) + len(self.v6_starts)
+
+    @staticmethod
+    def _probe(starts, ends, keys):
+        # The ranges are disjoint, so the ends are sorted too: a key is inside the last range
+        # starting at or before it exactly when that range is also the first ending at or after it.
+        i = np.searchsorted(starts, keys, side="right") - 1
+        return (i >= 0) & (np.searchsorted(ends, keys, side="left") == i)
+
+    def contains(self, ip):
+        try:
+            hi, lo, version = ip_to_int(ip)
+        except (OSError, ValueError, TypeError):
+            return False
+        if version == 6:
+            return bool(self._probe(self.v6_starts, self.v6_ends, _keys128([hi], [lo]))[0])
+        # A typed key: with a Python int NumPy would cast the whole array for every lookup.
+        key = np.uint32(lo & U32_MAX)
+        i = int(np.searchsorted(self.v4_starts, key, side="right")) - 1
+        return i >= 0 and key <= int(self.v4_ends[i])
+
+    def listed_rows(self, batch):
+        """Indices of the PacketBatch rows whose source is listed."""
+        columns = batch.columns
+        if not len(columns) or not len(self):
+            return np.empty(0, dtype=np.intp)
+        is_v4 = columns["ip_version"] == 4
+        hits = np.zeros(len(columns), dtype=bool)
+        if len(self.v4_starts):
+            keys = (columns["src_lo"][is_v4] & U32_MAX).astype(np.uint32)
+            hits[is_v4] = self._probe(self.v4_starts, self.v4_ends, keys)
+        if len(self.v6_starts) and not is_v4.all():
+            is_v6 = ~is_v4
+            hits[is_v6] = self._probe(self.v6_starts, self.v6_ends,
+                                      _keys128(columns["src_hi"][is_v6], columns["src_lo"][is_v6]))
+        return np.flatnonzero(hits)
+
+    def save(self, directory):
+        """Write the arrays as ``.npy`` files plus ``meta.json`` into a new ``directory``."""
+        os.makedirs(directory)
+        for name in ARRAY_FILES:
+            with open(os.path.join(directory, name + ".npy"), "wb") as f:
+                np.save(f, np.ascontiguousarray(getattr(self, name)))
+                f.flush()
+                os.fsync(f.fileno())
+        with open(os.path.join(directory, "meta.json"), "w") as f:
+            json.dump(self.meta, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        arrays = [np.load(os.path.join(directory, name + ".npy"), mmap_mode="r" if mmap else None)
+                  for name in ARRAY_FILES]
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            meta = json.load(f)
+        return cls(*arrays, meta=meta)
+
+
+class ThreatIntel:
+    """Reputation feeds compiled into an IntelIndex that every packet is checked against.
+
+    ``refresh`` streams every feed in ``sources`` (paths or URLs, see ``parse_feed``),
+    builds a new index, saves it as a new version under ``directory`` and publishes it
+    by atomically replacing the ``CURRENT`` pointer file. The in-memory index is swapped
+    with a single reference assignment, so lookups never wait for a refresh. On startup
+    the current version is memory-mapped, and ``reload`` picks up versions built by
+    another process (e.g. ``python -m threat_intel <feeds>``). ``run`` refreshes every
+    ``refresh_interval`` seconds, or only watches ``CURRENT`` when there are no sources.
+    """
+    def __init__(self, directory="data/threat_intel", sources=(), refresh_interval=3600.0, check_interval=10.0,
+                 keep_versions=2):
+        self.directory = directory
+        self.sources = list(sources)
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self.keep_versions = keep_versions
+        self.index = IntelIndex.empty()
+        self.version = None
+        self.refreshes = 0
+        self.failed_refreshes = 0
+        self.stopping = threading.Event()
+        self.refresh_lock = threading.Lock()
+        self.reload()
+
+    def _current_version(self):
+        try:
+            with open(os.path.join(self.directory, CURRENT_FILE), "r") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def reload(self):
+        """Map the version named by ``CURRENT`` if it is not the one in use; returns True if swapped."""
+        version = self._current_version()
+        if version is None or version == self.version:
+            return False
+        self.index = IntelIndex.load(os.path.join(self.directory, version))
+        self.version = version
+        event_log.info("intel.loaded", version=version, ranges=len(self.index))
+        return True
+
+    def refresh(self):
+        """Rebuild the index from the sources, publish it and swap it in; returns the new version."""
+        with self.refresh_lock:
+            started = time.time()
+            version = time.strftime("%Y%m%dT%H%M%S", time.gmtime(started)) + f"-{int(started * 1000) % 1000:03d}"
+            index = IntelIndex.build(self._ranges(),
+                                     {"version": version, "sources": self.sources, "built_at": started})
+            os.makedirs(self.directory, exist_ok=True)
+            index.save(os.path.join(self.directory, version))
+            pointer = os.path.join(self.directory, CURRENT_FILE + ".tmp")
+            with open(pointer, "w") as f:
+                f.write(version)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(pointer, os.path.join(self.directory, CURRENT_FILE))
+            # Serve the mapped copy, like a restart would, and let the built arrays go.
+            self.index = IntelIndex.load(os.path.join(self.directory, version))
+            self.version = version
+            self.refreshes += 1
+            self._prune()
+            event_log.info("intel.refreshed", version=version, entries=index.meta["entries"], ranges=len(index),
+                           seconds=round(time.time() - started, 2))
+            return version
+
+    def _ranges(self):
+        for source in self.sources:
+            with open_feed(source) as lines:
+                yield from parse_feed(lines)
+
+    def _prune(self):
+        # Old versions are deleted; pages still mapped by a reader stay valid until it lets go.
+        versions = sorted(name for name in os.listdir(self.directory)
+                          if os.path.isdir(os.path.join(self.directory, name)))
+        for name in versions[:-self.keep_versions]:
+            if name != self.version:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def run(self):
+        last_refresh = 0.0
+        while not self.stopping.is_set():
+            try:
+                if self.sources and time.monotonic() - last_refresh >= self.refresh_interval:
+                    last_refresh = time.monotonic()
+                    self.refresh()
+                else:
+                    self.reload()
+            except (OSError, ValueError) as e:
+                self.failed_refreshes += 1
+                event_log.error("intel.refresh_failed", error=str(e))
+            self.stopping.wait(self.check_interval)
+
+    def stop(self):
+        self.stopping.set()
+
+    def contains(self, ip):
+        return self.index.contains(ip)
+
+    def listed_rows(self, batch):
+        rows = self.index.listed_rows(batch)
+        if len(rows):
+            INTEL_HITS.inc(len(rows))
+        return rows
+
+    def stats(self):
+        index = self.index
+        return {
+            "version": self.version,
+            "ranges": len(index),
+            "entries": index.meta.get("entries"),
+            "refreshes": self.refreshes,
+            "failed_refreshes": self.failed_refreshes,
+        }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compile IP reputation feeds into a memory-mappable index.")
+    parser.add_argument("sources", nargs="+", help="Feed paths or http(s) URLs (plaintext or CSV, optionally .gz)")
+    parser.add_argument("--directory", default="data/threat_intel")
+    args = parser.parse_args()
+
+    intel = ThreatIntel(args.directory, args.sources)
+    intel.refresh()
+    print(json.dumps(intel.stats()))
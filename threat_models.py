@@ -0,0 +1,172 @@
+import numpy as np
+
+from flow_table import AGGREGATE_COLUMNS
+from packet_batch import PROTOCOLS
+
+
+# Column order of the feature matrix handed to ThreatDetector.evaluate_batch.
+# Per-packet fields come first, followed by the FlowTable sliding-window aggregates
+# (zero when the ModelAgent has no flow table).
+PACKET_COLUMNS = ("protocol", "frame_length", "src_port", "dst_port", "tcp_flags")
+FEATURE_COLUMNS = PACKET_COLUMNS + AGGREGATE_COLUMNS
+
+
+def feature_matrix(batch, aggregates=None):
+    """Build the (n, len(FEATURE_COLUMNS)) float64 feature matrix for a PacketBatch.
+
+    ``aggregates`` is the matrix returned by FlowTable.update_batch for the same batch.
+    """
+    columns = batch.columns
+    matrix = np.zeros((len(columns), len(FEATURE_COLUMNS)), dtype=np.float64)
+    matrix[:, 0] = columns["protocol"]
+    matrix[:, 1] = columns["length"]
+    matrix[:, 2] = columns["src_port"]
+    matrix[:, 3] = columns["dst_port"]
+    matrix[:, 4] = columns["tcp_flags"]
+    if aggregates is not None:
+        matrix[:, len(PACKET_COLUMNS):] = aggregates
+    return matrix
+
+
+def feature_row(features):
+    """Convert a ModelAgent features dict into a single feature matrix row."""
+    protocol = features.get("protocol", 0)
+    if isinstance(protocol, str):
+        protocol = PROTOCOLS.id_for(protocol)
+    row = [protocol] + [features.get(name) or 0 for name in FEATURE_COLUMNS[1:]]
+    return np.array([row], dtype=np.float64)
+
+
+def default_rule_model():
+    """Threshold rules over the FlowTable aggregates for the scenarios in ThreatDetector.
+
+    Class indices follow ThreatDetector.THREAT_SCENARIOS.
+    """
+    return RuleModel([
+        # TCP SYN Flood Attack: mostly bare SYNs at a high rate.
+        (0, [("src_syn_ratio", ">=", 0.8), ("src_syn_rate", ">=", 100)]),
+        # Excessive ICMP Requests (Ping Flood)
+        (4, [("src_icmp_rate", ">=", 50)]),
+        # Suspicious SSH Brute Force: repeated new connections to port 22.
+        (3, [("dst_port", "==", 22), ("src_syn_rate", ">=", 1)]),
+        # Outbound Data Exfiltration (Beaconing): steady, low-rate, clock-like gaps.
+        # src_pps > 0 keeps rows without flow state (all aggregates zero) out of it.
+        (5, [("src_interarrival_cv", "<=", 0.1), ("src_pps", "<=", 1), ("src_pps", ">", 0)]),
+    ], default_class=6)
+
+
+class RandomModel:
+    """Simulated detector: picks a scenario uniformly at random for every row."""
+    def __init__(self, n_classes, seed=None):
+        self.n_classes = n_classes
+        self.rng = np.random.default_rng(seed)
+
+    def predict(self, X):
+        classes = self.rng.integers(0, self.n_classes, size=len(X))
+        return classes, np.ones(len(X))
+
+
+class RuleModel:
+    """Threshold rules evaluated as NumPy masks.
+
+    ``rules`` is a list of (class index, [(column, op, threshold), ...]); a row takes the
+    class of the first rule whose conditions all hold, otherwise ``default_class``.
+    """
+    OPS = {
+        ">": np.greater,
+        ">=": np.greater_equal,
+        "<": np.less,
+        "<=": np.less_equal,
+        "==": np.equal,
+        "!=": np.not_equal,
+        "&": lambda values, mask: (values.astype(np.int64) & int(mask)) == int(mask),
+    }
+
+    def __init__(self, rules, default_class, columns=FEATURE_COLUMNS):
+        self.default_class = default_class
+        self.rules = [
+            (class_index, [(columns.index(column), self.OPS[op], threshold) for column, op, threshold in conditions])
+            for class_index, conditions in rules
+        ]
+
+    def predict(self, X):
+        classes = np.full(len(X), self.default_class, dtype=np.int64)
+        undecided = np.ones(len(X), dtype=bool)
+        for class_index, conditions in self.rules:
+            mask = undecided.copy()
+            for column, op, threshold in conditions:
+                mask &= op(X[:, column], threshold)
+            classes[mask] = class_index
+            undecided &= ~mask
+        return classes, np.ones(len(X))
+
+
+class LinearModel:
+    """Multinomial linear model: softmax(X @ weights.T + bias), scored in NumPy."""
+    def __init__(self, weights, bias, mean=None, scale=None):
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.bias = np.asarray(bias, dtype=np.float64)
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float64)
+        self.scale = None if scale is None else np.asarray(scale, dtype=np.float64)
+
+    def predict(self, X):
+        if self.mean is not None:
+            X = (X - self.mean) / self.scale
+        logits = X @ self.weights.T + self.bias
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        classes = probabilities.argmax(axis=1)
+        return classes, probabilities[np.arange(len(X)), classes]
+
+
+class TreeModel:
+    """Decision tree in flat-array form (as exported from scikit-learn's ``tree_``).
+
+    ``left``/``right`` are -1 at leaves and ``value[node]`` holds per-class counts or
+    probabilities. All rows descend one level per step, so scoring is O(depth) NumPy ops.
+    """
+    def __init__(self, feature, threshold, left, right, value):
+        self.feature = np.asarray(feature, dtype=np.int64)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        value = np.asarray(value, dtype=np.float64).reshape(len(self.left), -1)
+        self.value = value / np.maximum(value.sum(axis=1, keepdims=True), 1e-12)
+
+    def predict(self, X):
+        rows = np.arange(len(X))
+        nodes = np.zeros(len(X), dtype=np.int64)
+        active = self.left[nodes] != -1
+        while active.any():
+            current = nodes[active]
+            go_left = X[rows[active], self.feature[current]] <= self.threshold[current]
+            nodes[active] = np.where(go_left, self.left[current], self.right[current])
+            active = self.left[nodes] != -1
+        probabilities = self.value[nodes]
+        classes = probabilities.argmax(axis=1)
+        return classes, probabilities[rows, classes]
+
+
+def model_for(name):
+    """The model named by a DETECTOR_MODEL setting: "rules", "random" (None, the simulated
+    detector) or the path of a saved ``.npz`` model."""
+    if name == "random":
+        return None
+    if name == "rules":
+        return default_rule_model()
+    return load_model(name)
+
+
+def load_model(path):
+    """Load a serialized linear or tree model from an ``.npz`` file with a ``kind`` entry."""
+    with np.load(path, allow_pickle=False) as archive:
+        kind = str(archive["kind"])
+        if kind == "linear":
+            return LinearModel(archive["weights"], archive["bias"],
+                               archive["mean"] if "mean" in archive else None,
+                               archive["scale"] if "scale" in archive else None)
+        if kind == "tree":
+            return TreeModel(archive["feature"], archive["threshold"], archive["left"], archive["right"],
+                             archive["value"])
+    raise ValueError(f"Unknown model kind {kind!r} in {path}.")
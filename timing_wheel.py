@@ -0,0 +1,127 @@
+class TimingWheel:
+    """Hashed timing wheel.
+
+    Keys are scheduled into ``slots`` buckets of ``tick`` seconds each; deadlines further
+    out than one revolution simply stay in their bucket until their round comes up.
+    ``schedule`` and ``cancel`` are O(1) and ``advance`` only visits the buckets whose
+    tick has passed.
+    """
+    def __init__(self, tick=1.0, slots=512, now=0.0):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]
+        self.deadlines = {}
+        self.current_tick = int(now / tick)
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def schedule(self, key, deadline):
+        """(Re)schedule ``key`` to expire at ``deadline`` (same clock as ``advance``)."""
+        tick = max(int(deadline / self.tick), self.current_tick + 1)
+        old_tick = self.deadlines.get(key)
+        if old_tick is not None:
+            if old_tick == tick:
+                return
+            del self.slots[old_tick % len(self.slots)][key]
+        self.deadlines[key] = tick
+        self.slots[tick % len(self.slots)][key] = None
+
+    def cancel(self, key):
+        tick = self.deadlines.pop(key, None)
+        if tick is not None:
+            del self.slots[tick % len(self.slots)][key]
+            return True
+        return False
+
+    def deadline(self, key):
+        tick = self.deadlines.get(key)
+        return None if tick is None else tick * self.tick
+
+    def advance(self, now):
+        """Move the wheel to ``now`` and return the keys whose deadline has passed."""
+        target = int(now / self.tick)
+        if target <= self.current_tick:
+            return []
+        expired = []
+        slots = self.slots
+        deadlines = self.deadlines
+        # Past one full revolution every bucket is due, so visit each at most once.
+        first = max(self.current_tick + 1, target - len(slots) + 1)
+        for tick in range(first, target + 1):
+            slot = slots[tick % len(slots)]
+            if not slot:
+                continue
+            due = [key for key in slot if deadlines[key] <= target]
+            for key in due:
+                del slot[key]
+                del deadlines[key]
+            expired.extend(due)
+        self.current_tick = target
+        return expired
+
+
+class HierarchicalTimingWheel:
+    """Hashed timing wheels stacked by resolution, for deadlines spread over days.
+
+    Level ``i`` has ticks of ``tick * slots ** i`` seconds. A key goes into the finest
+    level whose revolution covers its remaining delay; when a coarse tick passes, its keys
+    cascade into a finer level. Each key is therefore touched at most once per level, so
+    ``schedule``, ``cancel`` and the amortized cost of ``advance`` stay O(1) per key
+    however many deadlines are pending.
+    """
+    def __init__(self, tick=1.0, slots=256, levels=3, now=0.0):
+        self.wheels = [TimingWheel(tick * slots ** level, slots, now) for level in range(levels)]
+        self.spans = [tick * slots ** (level + 1) for level in range(levels)]
+        self.deadlines = {}
+        self.levels = {}
+        self.now = now
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def __contains__(self, key):
+        return key in self.deadlines
+
+    def _place(self, key, deadline):
+        delay = deadline - self.now
+        level = 0
+        while level < len(self.wheels) - 1 and delay >= self.spans[level]:
+            level += 1
+        self.levels[key] = level
+        self.wheels[level].schedule(key, deadline)
+
+    def schedule(self, key, deadline):
+        """(Re)schedule ``key`` to expire at ``deadline`` (same clock as ``advance``)."""
+        level = self.levels.get(key)
+        if level is not None:
+            self.wheels[level].cancel(key)
+        self.deadlines[key] = deadline
+        self._place(key, deadline)
+
+    def cancel(self, key):
+        level = self.levels.pop(key, None)
+        if level is None:
+            return False
+        self.wheels[level].cancel(key)
+        del self.deadlines[key]
+        return True
+
+    def deadline(self, key):
+        return self.deadlines.get(key)
+
+    def advance(self, now):
+        """Move the wheels to ``now`` and return the keys whose deadline has passed."""
+        if now > self.now:
+            self.now = now
+        deadlines = self.deadlines
+        for level in range(len(self.wheels) - 1, 0, -1):
+            for key in self.wheels[level].advance(now):
+                self._place(key, deadlines[key])
+        expired = self.wheels[0].advance(now)
+        for key in expired:
+            del deadlines[key]
+            del self.levels[key]
+        return expired
@@ -1,17 +1,59 @@
 # Create TShark capture instance to push packets into our pipeline.
-from app import TSharkCapture
+import time
 
+from capture_supervisor import CaptureSupervisor
+from core.event_log import DEBUG, event_log
+from core.metrics import metrics
+from load_shedding import LoadShedder
+from multi_capture import MultiInterfaceCapture
 
-ts_capture = TSharkCapture(interface="eth0", filter_expr="ip", queue_obj=pipeline.get_queue())
+
+# The supervisor keeps blocked sources out of the capture filter, so they are dropped in the kernel.
+capture_supervisor = CaptureSupervisor(firewall_repo, interface="eth0", base_filter="ip",
+                                       queue_obj=pipeline.get_queue())
 
 def capture_thread():
-    ts_capture.start_capture()
+    capture_supervisor.run()
+
+def multi_capture_thread(interfaces):
+    # One pinned capture process per interface (or RSS queue), merged in timestamp order.
+    MultiInterfaceCapture(interfaces, pipeline.get_queue()).run()
+
+QUEUE_WAIT = metrics.histogram("stage_latency_seconds", "Time per call spent in each pipeline stage.", stage="queue")
+
+# Degrades to flow-head and then per-source sampled detection when the queue lag grows.
+load_shedder = LoadShedder()
 
 def processing_thread():
     while True:
+        # Drain micro-batches (up to pipeline.batch_size packets or batch_timeout seconds).
+        batch = pipeline.get_batch(timeout=1)
+        if not batch:
+            continue
+        try:
+            # Capture-to-dequeue wait of the oldest packet in the batch.
+            lag = time.time() - batch[0].ts
+            if metrics.enabled:
+                QUEUE_WAIT.observe(lag)
+            batch, weights = load_shedder.shed(batch, lag)
+            if not batch:
+                continue
+            decisions = manager_agent.process_packets(batch, weights)
+            if event_log.enabled(DEBUG):
+                event_log.debug("batch.processed", packets=len(batch), threats=int(decisions.threat_detected.sum()))
+        except Exception as e:
+            # One bad batch must not end the thread, or detection stops silently.
+            event_log.error("batch.failed", packets=len(batch), error=str(e))
+
+def sharded_processing_thread(sharded_processor):
+    # Worker-pool mode: each drained batch is partitioned by src_ip across shard processes.
+    sharded_processor.start()
+    while True:
+        batch = pipeline.get_batch(timeout=1)
+        if not batch:
+            continue
         try:
-            packet = pipeline.get_queue().get(timeout=1)
-            decision = manager_agent.process_packet(packet)
-            print(f"[{packet.timestamp}] Processed packet from {packet.src_ip} -> Decision: {decision.threat_type}")
-        except queue.Empty:
-            continue
\ No newline at end of file
+            sharded_processor.submit(batch)
+            sharded_processor.flush()
+        except Exception as e:
+            event_log.error("batch.failed", packets=len(batch), error=str(e))
@@ -1,9 +1,21 @@
+import random
+
+import numpy as np
+
+from domain import ThreatBatchDecision, ThreatDecision
+from threat_models import RandomModel, feature_row
+
+
 class ThreatDetector:
     """Simulates an AI-based threat detector.
        In a production system, this class would load a pre-trained machine learning model
        (for example, using scikit-learn, TensorFlow, or PyTorch) and evaluate packet features.
+
+       ``model`` is any object with ``predict(X) -> (class indices, scores)`` over the
+       feature matrix (see threat_models); class indices refer to THREAT_SCENARIOS.
+       Without a model the detector keeps simulating with random choices.
     """
-    def __init__(self):
+    def __init__(self, model=None, high_confidence=0.8, medium_confidence=0.5):
         self.THREAT_SCENARIOS = [
             {
                 "threat_type": "TCP SYN Flood Attack",
@@ -42,7 +54,17 @@ class ThreatDetector:
             }
         ]
 
+        self.model = model
+        self.high_confidence = high_confidence
+        self.medium_confidence = medium_confidence
+        self.threat_types = np.array([s["threat_type"] for s in self.THREAT_SCENARIOS], dtype=object)
+        self.actions = np.array([s["action"] for s in self.THREAT_SCENARIOS], dtype=object)
+        self.confidences = np.array([s["confidence"] for s in self.THREAT_SCENARIOS], dtype=object)
+        self.random_model = RandomModel(len(self.THREAT_SCENARIOS))
+
     def evaluate(self, features):
+        if self.model is not None:
+            return self.evaluate_batch(feature_row(features), [features["src_ip"]]).decision(0)
         # A ML model would process features here; we simulate with a random choice.
         threat = random.choice(self.THREAT_SCENARIOS)
         threat_detected = threat["action"] == "BLOCK"
@@ -53,4 +75,28 @@ class ThreatDetector:
             confidence=threat["confidence"],
             action=threat["action"],
             block_cidr=block_cidr
-        )
\ No newline at end of file
+        )
+
+    def evaluate_batch(self, X, src_ips=None):
+        """Score a whole feature matrix in one call and return a ThreatBatchDecision.
+
+        Confidence is the scenario's own label when the model score reaches
+        ``high_confidence``, otherwise "Medium" or "Low".
+        """
+        model = self.model if self.model is not None else self.random_model
+        classes, scores = model.predict(X)
+        action = self.actions[classes]
+        threat_detected = action == "BLOCK"
+        confidence = np.where(scores >= self.high_confidence, self.confidences[classes],
+                              np.where(scores >= self.medium_confidence, "Medium", "Low")).astype(object)
+        block_cidr = None
+        if src_ips is not None:
+            block_cidr = [f"{ip}/32" if detected else None for ip, detected in zip(src_ips, threat_detected.tolist())]
+        return ThreatBatchDecision(
+            threat_detected=threat_detected,
+            threat_type=self.threat_types[classes],
+            confidence=confidence,
+            action=action,
+            score=scores,
+            block_cidr=block_cidr
+        )
@@ -0,0 +1,97 @@
+import threading
+import time
+from collections import OrderedDict
+
+from core.metrics import metrics
+
+
+class VerdictCache:
+    """LRU cache of recent decisions with a per-entry TTL.
+
+    ``key="source"`` caches by source IP; ``key="flow"`` by (src_ip, dst_ip, protocol,
+    src_port, dst_port). Block verdicts are kept for ``block_ttl`` seconds; allow verdicts
+    are only cached when ``allow_ttl`` is set, since skipping the detector also skips the
+    flow-table updates that catch slow-building attacks.
+    """
+    def __init__(self, max_entries=100000, block_ttl=300.0, allow_ttl=None, key="source"):
+        if key not in ("source", "flow"):
+            raise ValueError(f"Unknown verdict cache key {key!r}; expected 'source' or 'flow'.")
+        self.max_entries = max_entries
+        self.block_ttl = block_ttl
+        self.allow_ttl = allow_ttl
+        self.key = key
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        metrics.gauge("verdict_cache_entries", lambda: len(self.entries), "Verdicts held in the verdict cache.")
+        metrics.gauge("verdict_cache_hits", lambda: self.hits, "Verdict cache lookups answered from the cache.")
+        metrics.gauge("verdict_cache_misses", lambda: self.misses,
+                      "Verdict cache lookups that found no live entry and went to the detector.")
+        metrics.gauge("verdict_cache_expirations", lambda: self.expirations, "Verdict cache entries found expired.")
+        metrics.gauge("verdict_cache_evictions", lambda: self.evictions, "Verdict cache entries evicted by LRU.")
+
+    def key_for(self, src_ip, dst_ip=None, protocol=None, src_port=None, dst_port=None):
+        if self.key == "source":
+            return src_ip
+        return (src_ip, dst_ip, protocol, src_port, dst_port)
+
+    def packet_key(self, packet):
+        if self.key == "source":
+            return packet.src_ip
+        data = packet.data
+        return (packet.src_ip, packet.dst_ip, packet.protocol, data.get("src_port"), data.get("dst_port"))
+
+    def get(self, key, now=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, decision = entry
+            if expires_at <= (time.monotonic() if now is None else now):
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return decision
+
+    def put(self, key, decision, now=None):
+        ttl = self.block_ttl if decision.threat_detected else self.allow_ttl
+        if ttl is None:
+            return
+        with self.lock:
+            self.entries[key] = ((time.monotonic() if now is None else now) + ttl, decision)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate_source(self, src_ip):
+        """Drop every cached verdict for ``src_ip`` (e.g. after a manual unblock)."""
+        with self.lock:
+            if self.key == "source":
+                return self.entries.pop(src_ip, None) is not None
+            stale = [key for key in self.entries if key[0] == src_ip]
+            for key in stale:
+                del self.entries[key]
+            return bool(stale)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }